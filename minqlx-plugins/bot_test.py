@@ -27,18 +27,137 @@ import minqlx
 # python
 import os
 import time
+import socket
 import math
 import random
-from enum import IntEnum
 from pprint import pprint
-import pickle
+
+from .qlsb.mathhelper import MathHelper
+from .qlsb.controller import (
+    Actions,
+    Controller,
+    INPUT_FRAME_INTERVAL,
+)
+from .qlsb.pmove import (
+    Simulator,
+    SimState,
+    World,
+    get_params,
+    ENTITYNUM_NONE,
+    SIM_DRIFT_FRAMES,
+)
+from .qlsb.snapshot import read_header, HEADER_SIZE
+from .qlsb.kinematics import Kinematics
+from .qlsb.search import (
+    BeamSearch,
+    SweepSearch,
+    TurnRateSearch,
+    segment_duration,
+    BEAM_WIDTH,
+    BEAM_DEPTH,
+)
+from .qlsb.farm import FarmCoordinator, FarmWorker
+from .qlsb.telemetry import TelemetryPublisher, TELEMETRY_INTERVAL
+from .qlsb.transposition import TranspositionTable, TRANSPOSITION_TABLE_SIZE
+from .qlsb.scheduler import FrameScheduler, FRAME_BUDGET_MS
+from .qlsb.history import History
+from .qlsb.journal import Journal, read_journal, JOURNAL_SUFFIX
+from .qlsb.fixture import Fixture, FIXTURE_SUFFIX
+from .qlsb.profiler import PhaseProfiler
+from .qlsb.solution import Solution, SOLUTION_SUFFIX, SOLUTION_KEYFRAME_INTERVAL
+from .qlsb.autocs import CircleStartSearch, cache_key, load_cached, save_cached
+from .qlsb.drift import (
+    DriftCheck,
+    PLAYBACK_POSITION_TOLERANCE,
+    PLAYBACK_VELOCITY_TOLERANCE,
+)
+from .qlsb.route import (
+    Point,
+    Route,
+    RouteIndex,
+    save_route,
+    load_route,
+    load_routes,
+    route_path,
+    migrate_pickle,
+    ROUTE_SUFFIX,
+)
+
+# solver time per server frame of batch solves, nobody is playing on the
+# server so it only has to run a frame now and then
+BATCH_FRAME_BUDGET_MS = 1000.0
+# batch solves give up on a route after this many frames (10 minutes)
+BATCH_MAX_FRAMES = 125 * 600
 
 
 class bot_test(minqlx.Plugin):
     bot = None
+    farm = None
+    farm_worker = None
+    telemetry = None
+    # routes the batch solve hasn't started yet, None before the first batch
+    batch = None
+    # route the batch solve is on
+    batch_route = None
+    batch_solving = False
+    batch_start = 0.0
+    batch_results = []
+    # quit the server when the batch is done
+    batch_quit = False
 
     def __init__(self):
         super().__init__()
+        # helper bots for !solve pool, kept between solves
+        self.pool = []
+
+        # the solving server binds these, workers connect to them
+        self.set_cvar_once("qlx_solverFarmJobs", "tcp://127.0.0.1:27970")
+        self.set_cvar_once("qlx_solverFarmResults", "tcp://127.0.0.1:27971")
+        # 1 = run rollouts for a solving server instead
+        self.set_cvar_once("qlx_solverFarmWorker", "0")
+        # rollout results cached per solve
+        self.set_cvar_once("qlx_solverCacheSize", str(TRANSPOSITION_TABLE_SIZE))
+        # solver time per server frame
+        self.set_cvar_once("qlx_solverFrameBudgetMs", "{:.1f}".format(FRAME_BUDGET_MS))
+        # greedy solve turn rate search, 0 = sweep, 1 = golden section
+        self.set_cvar_once("qlx_solverTurnSearch", "0")
+        # 1 = pick how long each action of a greedy solve runs from the distance
+        # to the next corner, 0 = every action runs INPUT_FRAME_INTERVAL frames
+        self.set_cvar_once("qlx_solverAdaptiveDuration", "1")
+        # write committed segments to qlsb_data/<route>.journal for !resumesolve
+        self.set_cvar_once("qlx_solverJournal", "1")
+        # 1 = time the bot's engine calls and solver phases, see !solveprofile
+        self.set_cvar_once("qlx_solverProfile", "0")
+        # frames between the states !savesolution stores, 0 = start only
+        self.set_cvar_once(
+            "qlx_solutionKeyframeInterval", str(SOLUTION_KEYFRAME_INTERVAL)
+        )
+        # bots !solve pool runs beam branches on, including the solving bot
+        self.set_cvar_once("qlx_solverPoolSize", "4")
+        # !play rewinds to the stored state only when it drifts further than this
+        self.set_cvar_once(
+            "qlx_playbackPositionTolerance", str(PLAYBACK_POSITION_TOLERANCE)
+        )
+        self.set_cvar_once(
+            "qlx_playbackVelocityTolerance", str(PLAYBACK_VELOCITY_TOLERANCE)
+        )
+        # routes to solve on startup, the server quits once their solutions
+        # are written to qlsb_data/<route>.solution
+        self.set_cvar_once("qlx_solverBatch", "")
+        # !solve args of batch solves
+        self.set_cvar_once("qlx_solverBatchArgs", "")
+        # solver time per server frame of batch solves
+        self.set_cvar_once("qlx_solverBatchBudgetMs", str(BATCH_FRAME_BUDGET_MS))
+        # batch solves give up on a route after this many frames
+        self.set_cvar_once("qlx_solverBatchMaxFrames", str(BATCH_MAX_FRAMES))
+        # publish solver progress to the python3 -m qlsb.telemetry at this address,
+        # empty = off
+        self.set_cvar_once("qlx_solverTelemetry", "")
+        # seconds between telemetry messages
+        self.set_cvar_once("qlx_solverTelemetryInterval", str(TELEMETRY_INTERVAL))
+
+        MapConfig.routes = load_routes()
+        print("indexed {} routes".format(len(MapConfig.routes)))
 
         self.add_hook("client_think", self.handle_client_think)
         self.add_hook("frame", self.handle_frame)
@@ -46,7 +165,9 @@ class bot_test(minqlx.Plugin):
         self.add_command("testbot", self.cmd_add)
         self.add_command("resetbot", self.cmd_reset)
         self.add_command("solve", self.cmd_solve)
+        self.add_command("resumesolve", self.cmd_resume_solve)
         self.add_command("stopsolve", self.cmd_stop_solve)
+        self.add_command("solvebatch", self.cmd_solve_batch)
         self.add_command("play", self.cmd_play)
         self.add_command("stopplay", self.cmd_stop_play)
         self.add_command("setstart", self.cmd_set_start)
@@ -55,9 +176,18 @@ class bot_test(minqlx.Plugin):
         self.add_command("addcp", self.cmd_add_cp)
         self.add_command("removecp", self.cmd_remove_cp)
         self.add_command("addcs", self.cmd_add_cs)
+        self.add_command("autocs", self.cmd_auto_cs)
         self.add_command("bothaste", self.cmd_haste)
         self.add_command("savecfg", self.cmd_save_config)
         self.add_command("loadcfg", self.cmd_load_config)
+        self.add_command("simcheck", self.cmd_sim_check)
+        self.add_command("solvestats", self.cmd_solve_stats)
+        self.add_command("savehistory", self.cmd_save_history)
+        self.add_command("loadhistory", self.cmd_load_history)
+        self.add_command("savesolution", self.cmd_save_solution)
+        self.add_command("loadsolution", self.cmd_load_solution)
+        self.add_command("recordfixture", self.cmd_record_fixture)
+        self.add_command("solveprofile", self.cmd_solve_profile)
 
     def handle_client_think(self, player, client_cmd):
         return client_cmd
@@ -70,24 +200,233 @@ class bot_test(minqlx.Plugin):
         self.bot.reset()
 
     def cmd_solve(self, player, msg, channel):
-        self.bot.start_solve()
+        # !solve [sim] [beam <width> <depth>] [farm] [pool <bots>]
+        # sim scores actions with the offline simulator,
+        # beam keeps the best <width> trajectories <depth> actions ahead,
+        # farm sends the beam rollouts to qlx_solverFarmWorker servers,
+        # pool runs <bots> beam rollouts side by side in the same server frames,
+        # new replaces the route's journal instead of refusing to start.
+        use_sim, beam, farm, pool = self.parse_solve_args(msg[1:])
+        try:
+            journal = self.make_journal("new" in msg[1:])
+        except FileExistsError as e:
+            print("{} exists, !resumesolve it or !solve new".format(e.filename))
+            return
+        self.bot.start_solve(use_sim, beam, farm, journal, pool)
+
+    # raises FileExistsError instead of truncating a journal unless overwrite
+    def make_journal(self, overwrite=False):
+        if not self.get_cvar("qlx_solverJournal", int):
+            return None
+        name = MapConfig.name or "solve"
+        return Journal.create(
+            "qlsb_data/" + name + JOURNAL_SUFFIX,
+            MapConfig.name,
+            MapConfig.haste,
+            self.bot.history,
+            overwrite,
+        )
+
+    def cmd_resume_solve(self, player, msg, channel):
+        # !resumesolve <name> [solve args]
+        if len(msg) <= 1:
+            print("missing name")
+            return
+        path = "qlsb_data/" + msg[1] + JOURNAL_SUFFIX
+        try:
+            route_name, haste, history, end = read_journal(path)
+        except (OSError, ValueError) as e:
+            print("can't resume: {}".format(e))
+            return
+        if len(history) == 0:
+            print("can't resume: {} is empty".format(path))
+            return
+        if len(route_name) > 0:
+            try:
+                MapConfig.load_config(route_name)
+            except (OSError, ValueError) as e:
+                print("can't resume: {}".format(e))
+                return
+        MapConfig.haste = haste
+
+        if self.bot is None:
+            self.bot = StrafeBot(minqlx.bot_add(1))
+            self.bot.reset()
+        self.bot.history = history
+        print("resuming {} from frame {}".format(path, len(history)))
+        use_sim, beam, farm, pool = self.parse_solve_args(msg[2:])
+        self.bot.start_solve(
+            use_sim, beam, farm, Journal.open_append(path, end), pool
+        )
+
+    def parse_solve_args(self, msg):
+        use_sim = "sim" in msg
+        farm = None
+        if "farm" in msg:
+            farm = self.get_farm()
+        beam = None
+        if "beam" in msg:
+            i = msg.index("beam")
+            width = BEAM_WIDTH
+            depth = BEAM_DEPTH
+            try:
+                if len(msg) > i + 1:
+                    width = int(msg[i + 1])
+            except:
+                pass
+            try:
+                if len(msg) > i + 2:
+                    depth = int(msg[i + 2])
+            except:
+                pass
+            beam = (width, depth)
+        pool = None
+        if "pool" in msg:
+            i = msg.index("pool")
+            size = self.get_cvar("qlx_solverPoolSize", int)
+            try:
+                if len(msg) > i + 1:
+                    size = int(msg[i + 1])
+            except:
+                pass
+            pool = self.get_pool(size)
+        return use_sim, beam, farm, pool
+
+    def get_pool(self, size):
+        """Client ids of the solving bot and up to size - 1 helper bots."""
+        while len(self.pool) < size - 1:
+            client_id = minqlx.bot_add(1)
+            if client_id < 0:
+                print("pool: no free clients, using {} bots".format(len(self.pool) + 1))
+                break
+            helper = StrafeBot(client_id)
+            helper.reset()
+            self.pool.append(helper)
+        return [self.bot.id] + [helper.id for helper in self.pool[: size - 1]]
+
+    def get_farm(self):
+        if self.farm is None:
+            self.farm = FarmCoordinator(
+                self.get_cvar("qlx_solverFarmJobs"),
+                self.get_cvar("qlx_solverFarmResults"),
+            )
+        return self.farm
 
     def cmd_stop_solve(self, player, msg, channel):
         self.bot.stop_solve()
 
+    # !solvebatch <route> [route ...] solves the routes (names or .route files)
+    # one after another and writes their solutions, the solver isn't paced to
+    # the server frame rate so the server is unplayable until they're done.
+    # qlx_solverBatch does the same on startup and quits afterwards.
+    def cmd_solve_batch(self, player, msg, channel):
+        if len(msg) <= 1:
+            print("missing routes")
+            return
+        self.start_batch(msg[1:])
+
+    def start_batch(self, routes, quit=False):
+        if self.bot is None:
+            self.bot = StrafeBot(minqlx.bot_add(1))
+        self.bot.frame_budget_ms = self.get_cvar("qlx_solverBatchBudgetMs", float)
+        self.batch = list(routes)
+        self.batch_results = []
+        self.batch_quit = quit
+        print("batch solving {} routes".format(len(self.batch)))
+        self.next_batch_route()
+
+    def next_batch_route(self):
+        self.batch_route = None
+        while len(self.batch) > 0:
+            route = self.batch.pop(0)
+            name = os.path.basename(route)
+            if name.endswith(ROUTE_SUFFIX):
+                name = name[: -len(ROUTE_SUFFIX)]
+            try:
+                if route.endswith(ROUTE_SUFFIX) and os.path.exists(route):
+                    MapConfig.routes[name] = load_route(route)
+                MapConfig.load_config(name)
+            except (OSError, ValueError) as e:
+                self.batch_results.append("{}: can't load, {}".format(route, e))
+                print("batch: " + self.batch_results[-1])
+                continue
+            self.batch_route = name
+            self.batch_solving = False
+            self.batch_start = time.time()
+            self.bot.reset()
+            # the search runs first if the start isn't cached yet
+            self.auto_cs()
+            return
+        self.finish_batch()
+
+    def run_batch_frame(self):
+        bot = self.bot
+        if bot.autocs is not None:
+            return
+        if not self.batch_solving:
+            self.batch_solving = True
+            args = (self.get_cvar("qlx_solverBatchArgs") or "").split()
+            use_sim, beam, farm, pool = self.parse_solve_args(args)
+            try:
+                journal = self.make_journal("new" in args)
+            except FileExistsError as e:
+                self.batch_results.append(
+                    "{}: {} exists, resume it or add new to the args".format(
+                        self.batch_route, e.filename
+                    )
+                )
+                print("batch: " + self.batch_results[-1])
+                self.next_batch_route()
+                return
+            bot.start_solve(use_sim, beam, farm, journal, pool)
+            return
+        if bot.solve and len(bot.history) < self.get_cvar(
+            "qlx_solverBatchMaxFrames", int
+        ):
+            return
+
+        if bot.solve:
+            bot.stop_solve()
+            result = "gave up after {} frames".format(len(bot.history))
+        elif bot.reached_end:
+            self.save_solution(self.batch_route)
+            result = "solved in {} frames".format(len(bot.history))
+        else:
+            result = "solve stopped before the end"
+        self.batch_results.append(
+            "{}: {}, {:.0f} s".format(
+                self.batch_route, result, time.time() - self.batch_start
+            )
+        )
+        print("batch: " + self.batch_results[-1])
+        self.next_batch_route()
+
+    def finish_batch(self):
+        self.batch_route = None
+        if self.bot is not None:
+            self.bot.frame_budget_ms = None
+        print("batch done")
+        for result in self.batch_results:
+            print("batch: " + result)
+        if self.batch_quit:
+            minqlx.console_command("quit")
+
+    # !play strict rewinds to the stored state every frame
     def cmd_play(self, player, msg, channel):
-        self.bot.start_playback()
+        self.bot.start_playback(len(msg) > 1 and msg[1] == "strict")
 
     def cmd_stop_play(self, player, msg, channel):
         self.bot.stop_playback()
 
     def cmd_set_start(self, player, msg, channel):
         MapConfig.start_point = Point.from_player(player, "start")
+        MapConfig.index = None
         if self.bot != None:
             self.bot.reset()
 
     def cmd_set_end(self, player, msg, channel):
         MapConfig.end_point = Point.from_player(player, "end")
+        MapConfig.index = None
     
     def cmd_set_end_dist(self, player, msg, channel):
         if len(msg) > 1:
@@ -99,10 +438,12 @@ class bot_test(minqlx.Plugin):
         MapConfig.checkpoints.append(
             Point.from_player(player, "cp{}".format(len(MapConfig.checkpoints)))
         )
+        MapConfig.index = None
 
     def cmd_remove_cp(self, player, msg, channel):
         if len(MapConfig.checkpoints) > 0:
             MapConfig.checkpoints.pop()
+            MapConfig.index = None
 
     def cmd_add_cs(self, player, msg, channel):
         # magic values that should give 511-512 ups without haste.
@@ -127,9 +468,33 @@ class bot_test(minqlx.Plugin):
             pass
         self.bot.add_cs_start(walk_frames, strafe_frames, strafe_angle)
 
+    # !autocs [search] adds the circle jump start with the most exit speed
+    # along the route, cached per route once searched. search searches again.
+    def cmd_auto_cs(self, player, msg, channel):
+        if self.bot is None:
+            print("no bot")
+            return
+        self.auto_cs(len(msg) > 1 and msg[1] == "search")
+
+    def auto_cs(self, search=False):
+        """Add the cached circle jump start, or start searching for it."""
+        params = get_params(minqlx.get_cvar("qlx_raceMode") or 0)
+        key = cache_key(params, MapConfig.haste)
+        cached = None
+        if len(MapConfig.name) > 0 and not search:
+            cached = load_cached(MapConfig.name, key, MapConfig.start_point)
+        if cached is not None:
+            print("cached circle jump start !addcs {} {} {}".format(*cached))
+            self.bot.reset()
+            self.bot.add_cs_start(*cached)
+            return
+        self.bot.start_autocs(key)
+
     def cmd_haste(self, player, msg, channel):
         MapConfig.haste = True if MapConfig.haste == False else False
         print("set haste to ", MapConfig.haste)
+        if self.bot is not None:
+            self.bot.check_powerups()
 
     def cmd_save_config(self, player, msg, channel):
         if len(msg) <= 1:
@@ -143,37 +508,207 @@ class bot_test(minqlx.Plugin):
             return
         MapConfig.load_config(msg[1])
 
+    def cmd_sim_check(self, player, msg, channel):
+        if self.bot is None or len(self.bot.history) < 2:
+            print("simcheck needs a bot with history")
+            return
+        simulator = StrafeBot.make_simulator()
+        pos_err, vel_err, frame = simulator.compare_history(self.bot.history)
+        drift_pos_err, drift_vel_err, drift_frame = simulator.compare_drift(
+            self.bot.history
+        )
+        print(
+            "simcheck {}, max pos err {:.3f}, max vel err {:.3f} (frame {}), "
+            "over {} frames {:.3f}, {:.3f} (frame {})".format(
+                "ok"
+                if simulator.within_tolerance(self.bot.history)
+                else "out of tolerance",
+                pos_err,
+                vel_err,
+                frame,
+                SIM_DRIFT_FRAMES,
+                drift_pos_err,
+                drift_vel_err,
+                drift_frame,
+            )
+        )
+
+    def cmd_save_history(self, player, msg, channel):
+        if len(msg) <= 1:
+            print("missing name")
+            return
+        if self.bot is None:
+            print("no bot")
+            return
+        name = "qlsb_data/" + msg[1] + ".history"
+        self.bot.history.save(name)
+        print("saved history ", name, len(self.bot.history))
+
+    def cmd_load_history(self, player, msg, channel):
+        if len(msg) <= 1:
+            print("missing name")
+            return
+        if self.bot is None:
+            print("no bot")
+            return
+        name = "qlsb_data/" + msg[1] + ".history"
+        try:
+            # mapped, playback only reads it
+            self.bot.history = History.load(name, use_mmap=True)
+        except (OSError, ValueError) as e:
+            print("can't load history: {}".format(e))
+            return
+        self.bot.solution = None
+        print("loaded history ", name, len(self.bot.history))
+
+    def cmd_save_solution(self, player, msg, channel):
+        if len(msg) <= 1:
+            print("missing name")
+            return
+        if self.bot is None or len(self.bot.history) == 0:
+            print("no history")
+            return
+        self.save_solution(msg[1])
+
+    def save_solution(self, name):
+        path = "qlsb_data/" + name + SOLUTION_SUFFIX
+        solution = Solution.from_history(
+            self.bot.history,
+            MapConfig.name,
+            MapConfig.haste,
+            self.get_cvar("qlx_solutionKeyframeInterval", int),
+        )
+        solution.save(path)
+        print(
+            "saved solution ",
+            path,
+            "{} frames, {} segments, {} bytes".format(
+                len(solution), len(solution.segments), os.path.getsize(path)
+            ),
+        )
+
+    # !loadsolution <name>, !play then streams it instead of the history
+    def cmd_load_solution(self, player, msg, channel):
+        if len(msg) <= 1:
+            print("missing name")
+            return
+        if self.bot is None:
+            print("no bot")
+            return
+        name = "qlsb_data/" + msg[1] + SOLUTION_SUFFIX
+        try:
+            solution = Solution.load(name)
+        except (OSError, ValueError) as e:
+            print("can't load solution: {}".format(e))
+            return
+        if len(solution.route_name) > 0:
+            MapConfig.load_config(solution.route_name)
+        MapConfig.haste = solution.haste
+        self.bot.solution = solution
+        print("loaded solution ", name, len(solution))
+
+    # !recordfixture <name> records the engine's rollout results during the
+    # next solve for python3 -m qlsb.benchmark --fixture, without a name saves them
+    def cmd_record_fixture(self, player, msg, channel):
+        if self.bot is None:
+            print("no bot")
+            return
+        if len(msg) > 1:
+            self.bot.fixture = Fixture(MapConfig.name)
+            self.bot.fixture_path = "qlsb_data/" + msg[1] + FIXTURE_SUFFIX
+            print("recording fixture ", self.bot.fixture_path)
+            return
+        self.bot.save_fixture()
+
+    # !solveprofile prints the phase times of the last solve or playback,
+    # !solveprofile <name> also writes them to qlsb_data/<name>.profile
+    def cmd_solve_profile(self, player, msg, channel):
+        if self.bot is None or self.bot.profiler is None:
+            print("nothing profiled, set qlx_solverProfile 1 and solve")
+            return
+        for line in self.bot.profiler.report():
+            print(line)
+        if len(msg) > 1:
+            name = "qlsb_data/" + msg[1] + ".profile"
+            self.bot.profiler.dump(name)
+            print("saved profile ", name)
+
+    def cmd_solve_stats(self, player, msg, channel):
+        if self.bot is None or self.bot.table is None:
+            print("no solve has been started")
+            return
+        print("cache: " + self.bot.table.stats())
+        print("frames: " + self.bot.scheduler.stats())
+        print(
+            "{}: {} decisions, {:.1f} rollouts/decision".format(
+                self.bot.solve_mode(),
+                self.bot.decisions,
+                self.bot.rollouts / self.bot.decisions if self.bot.decisions > 0 else 0.0,
+            )
+        )
+        if self.bot.pool is not None:
+            print(
+                "pool: {} bots, {} batches, {:.1f} branches/batch".format(
+                    len(self.bot.pool),
+                    self.bot.batches,
+                    self.bot.branches / self.bot.batches if self.bot.batches > 0 else 0.0,
+                )
+            )
+        if self.bot.farm is not None:
+            print(
+                "farm: {} sent, {} received, {} resent, {} pending".format(
+                    self.bot.farm.sent,
+                    self.bot.farm.received,
+                    self.bot.farm.resent,
+                    len(self.bot.farm.pending),
+                )
+            )
+
     def handle_frame(self):
-        if self.bot is not None:
-            if self.bot.run_frame() == False:
+        if self.farm_worker is None and self.get_cvar("qlx_solverFarmWorker", int):
+            self.bot = StrafeBot(minqlx.bot_add(1))
+            self.bot.reset()
+            self.farm_worker = EngineFarmWorker(
+                self.bot,
+                self.get_cvar("qlx_solverFarmJobs"),
+                self.get_cvar("qlx_solverFarmResults"),
+            )
+        if self.farm_worker is not None:
+            # keep some of the frame for the server itself
+            try:
+                self.farm_worker.poll(
+                    max_time=self.get_cvar("qlx_solverFrameBudgetMs", float) / 1000.0
+                )
+            except minqlx.NonexistentPlayerError:
+                # a new bot and worker next frame, the job is resent
+                self.farm_worker.close()
+                self.farm_worker = None
                 self.bot = None
 
+        if self.batch is None and self.get_cvar("qlx_solverBatch"):
+            self.start_batch(self.get_cvar("qlx_solverBatch").split(), True)
 
-class Point:
-    position = [0, 0, 0]
-    angles = [0, 0, 0]
-    ground_ent = -1
-    name = ""
-
-    def __init__(self, name="") -> None:
-        self.name = name
+        if self.bot is not None:
+            if self.bot.run_frame() == False:
+                self.bot = None
+        if self.batch_route is not None:
+            if self.bot is None:
+                self.batch_results.append(self.batch_route + ": bot was removed")
+                self.finish_batch()
+            else:
+                self.run_batch_frame()
 
-    @staticmethod
-    def from_player(player, name=""):
-        p = Point(name)
-        # can't pickle Vector3
-        p.position = [
-            player.state.position[0],
-            player.state.position[1],
-            player.state.position[2],
-        ]
-        p.angles = [
-            0,
-            player.state.viewangles[1],
-            0,
-        ]
-        p.ground_ent = player.state.ground_entity
-        return p
+        if self.telemetry is None and self.get_cvar("qlx_solverTelemetry"):
+            self.telemetry = TelemetryPublisher(
+                self.get_cvar("qlx_solverTelemetry"),
+                "{}:{}".format(socket.gethostname(), self.get_cvar("net_port")),
+                self.get_cvar("qlx_solverTelemetryInterval", float),
+            )
+        if self.telemetry is not None and self.bot is not None and self.telemetry.due():
+            self.telemetry.publish(self.bot.telemetry())
+        for helper in self.pool:
+            # only move inside simulate_branches, don't timeout
+            helper.idle_frame()
 
 
 class MapConfig:
@@ -182,93 +717,35 @@ class MapConfig:
     end_point = Point("end")
     end_dist = 250
     haste = False
+    # name -> Route, every route in qlsb_data
+    routes = {}
+    # built from the points on first use, set to None when they change
+    index = None
+    # route file last saved or loaded
+    name = ""
 
     @staticmethod
-    def get_reward(position, velocity):
-        remaining_points = MapConfig.get_remaining_points(position)
-
-        is_end = remaining_points[0].name == "end"
-        if is_end:
-            # Only care about distance, reach end as fast as possible.
-            # Building more speed, etc. don't really matter at this point.
-            # (Assuming last checkpoint is relatively close to the end.)
-            distance = MathHelper.vec3_dist(remaining_points[0].position, position)
-            # Use large constant so bot doesn't choose not to pass last checkpoint,
-            # ideally this should always give more reward than the normal reward function.
-            return 100000.0 + 1.0 / distance
-
-        # VELOCITY DIRECTION
-        # TODO lerp direction towards next point.position or
-        # current point.angles (forward) when near the point?
-        want_direction = MathHelper.vec3_norm(
-            MathHelper.vec3_sub(remaining_points[0].position, position)
-        )
-        direction_reward = MathHelper.vec_dot(want_direction, velocity, 3)
-
-        # VELOCITY MAGNITUDE
-        velocity_reward = MathHelper.vec2_len(velocity)
-
-        # DISTANCE TO ROUTE
-        previous_point = MapConfig.get_previous_point(remaining_points[0])
-        closest = remaining_points[0].position
-        if previous_point != None:
-            closest = MathHelper.line_closest_point_clamped(
-                previous_point.position, remaining_points[0].position, position
+    def get_index():
+        if MapConfig.index is None:
+            MapConfig.index = RouteIndex(
+                [MapConfig.start_point] + MapConfig.checkpoints + [MapConfig.end_point]
             )
-        distance = MathHelper.vec3_dist(position, closest)
-        distance_reward = 1.0 / distance
-
-        return (
-            #
-            100.0 * distance_reward
-            + 2.0 * direction_reward
-            + 3.0 * velocity_reward
-        )
+        return MapConfig.index
 
-    # get a list of all the points we haven't passed yet
-    # NOTE: always includes end_zone.point even if past it
     @staticmethod
-    def get_remaining_points(position):
-        points = [MapConfig.start_point]
-        for cp in MapConfig.checkpoints:
-            points.append(cp)
-        points.append(MapConfig.end_point)
-
-        nearest_index = -1
-        nearest_dist = math.inf
-        for i in range(0, len(points)):
-            dist = MathHelper.vec3_dist(position, points[i].position)
-            if dist < nearest_dist:
-                nearest_dist = dist
-                nearest_index = i
-
-        if nearest_index < len(points) - 1:
-            # are we past nearest point?
-            forward = MathHelper.vec3_sub(
-                points[nearest_index + 1].position, points[nearest_index].position
-            )
-            to_nearest = MathHelper.vec3_sub(points[nearest_index].position, position)
-            if MathHelper.vec_dot(to_nearest, forward, 3) > 0:
-                next_index = nearest_index
-            else:
-                next_index = nearest_index + 1
-        else:
-            next_index = nearest_index
+    def get_reward(position, velocity):
+        # reward function lives in RouteIndex.reward
+        return MapConfig.get_index().reward(position, velocity)
 
-        return points[next_index:]
+    @staticmethod
+    def get_corner_distance(position):
+        """Distance to the next corner of the route, see RouteIndex.corner_distance."""
+        return MapConfig.get_index().corner_distance(*position)
 
     @staticmethod
-    def get_previous_point(point):
-        points = [MapConfig.start_point]
-        for cp in MapConfig.checkpoints:
-            points.append(cp)
-        points.append(MapConfig.end_point)
-        for i in range(len(points)):
-            if points[i].name == point.name:
-                if i > 0:
-                    return points[i - 1]
-                break
-        return None
+    def get_rewards(positions, velocities):
+        """get_reward for N positions and velocities, see RouteIndex.rewards."""
+        return MapConfig.get_index().rewards(positions, velocities)
 
     @staticmethod
     def is_at_end(position):
@@ -278,63 +755,170 @@ class MapConfig:
 
     @staticmethod
     def save_config(name=""):
-        if len(name) < 0:
+        if len(name) <= 0:
             print("save_config invalid name")
             return
-        cfg = {
-            "start": MapConfig.start_point,
-            "end": MapConfig.end_point,
-            "checkpoints": MapConfig.checkpoints,
-            "end_dist": MapConfig.end_dist,
-            "haste": MapConfig.haste,
-        }
-        name = "qlsb_data/" + name
-        with open(name, mode="wb") as file:
-            pickle.dump(cfg, file)
-            print("saved config ", name)
+        route = Route(
+            MapConfig.start_point,
+            MapConfig.end_point,
+            list(MapConfig.checkpoints),
+            MapConfig.end_dist,
+            MapConfig.haste,
+        )
+        path = route_path(name)
+        save_route(path, route)
+        MapConfig.routes[name] = route
+        MapConfig.name = name
+        print("saved config ", path)
 
     @staticmethod
     def load_config(name=""):
-        if len(name) < 0:
-            print("save_config invalid name")
+        if len(name) <= 0:
+            print("load_config invalid name")
             return
-        name = "qlsb_data/" + name
-        with open(name, mode="rb") as file:
-            cfg = pickle.load(file)
-            MapConfig.start_point = cfg["start"]
-            MapConfig.end_point = cfg["end"]
-            MapConfig.checkpoints = cfg["checkpoints"]
-            MapConfig.end_dist = cfg["end_dist"]
-            MapConfig.haste = cfg["haste"]
-            print("loaded config ", name)
-
-
-class Actions(IntEnum):
-    LEFT_DIAG = 0
-    RIGHT_DIAG = 1
-    LEFT = 2
-    RIGHT = 3
-    MAX_ACTION = 4
-
-
-TURN_SPEED_MAX = 360  # deg/s
-TURN_SPEED_INTERVAL = 15  # deg/s
-TURN_SNAP_ANGLE = 5  # deg
-INPUT_FRAME_INTERVAL = 25  # frames per action
+        route = MapConfig.routes.get(name)
+        if route is None:
+            path = route_path(name)
+            if not os.path.exists(path) and os.path.exists("qlsb_data/" + name):
+                # pickle from before route files
+                path = migrate_pickle("qlsb_data/" + name)
+                print("migrated config to ", path)
+            route = load_route(path)
+            MapConfig.routes[name] = route
+        MapConfig.start_point = route.start
+        MapConfig.end_point = route.end
+        MapConfig.checkpoints = list(route.checkpoints)
+        MapConfig.index = None
+        MapConfig.end_dist = route.end_dist
+        MapConfig.haste = route.haste
+        MapConfig.name = name
+        print("loaded config ", name)
+
+
+# frames between checks of the bot's haste against MapConfig.haste
+POWERUP_CHECK_FRAMES = 125
+
+# (phase, method) timed when qlx_solverProfile is 1
+PROFILE_PHASES = [
+    ("player_state", "player_state"),
+    ("player_kinematics", "kinematics"),
+    ("client_think", "client_think"),
+    ("teleport", "teleport"),
+    ("snapshot", "snapshot"),
+    ("restore", "restore"),
+    ("simulate_actions", "simulate"),
+    ("simulate_branches", "simulate_branches"),
+    ("get_reward", "get_reward"),
+    ("get_rewards", "get_rewards"),
+    ("evaluate", "evaluate"),
+    ("rollout", "rollout"),
+    ("advance", "solve_frame_advance"),
+    ("solve_frame", "run_solve_frame"),
+    ("playback_frame", "run_playback_frame"),
+]
 
 
 class StrafeBot(minqlx.Player):
     playback_frame = -1
-    # action, position, velocity, viewangles, ground_entity, jump_time, double_jumped
-    history = []
+    history = History()
     playback = False
+    # None when playback rewinds every frame
+    drift = None
+    # loaded with !loadsolution, played instead of the history
+    solution = None
+    # frames of the solution being played
+    stream = None
     solve = False
     solve_done = False
-    best_solution = None
-    last_solution = None
+    # the last solve stopped because it reached the end
+    reached_end = False
+    # reward of the last action the solve committed
+    best_reward = 0.0
+    simulator = None
+    beam = None
+    farm = None
+    table = None
+    scheduler = None
+    search = None
+    rollouts = 0
+    decisions = 0
+    adaptive_duration = False
+    journal = None
+    # engine responses recorded for the benchmark
+    fixture = None
+    fixture_path = ""
+    profiler = None
+    # client ids beam rollouts are spread over, this bot first
+    pool = None
+    pool_jobs = []
+    batches = 0
+    branches = 0
+    # frames the action being searched for will run
+    duration = INPUT_FRAME_INTERVAL
+    # circle jump start search of !autocs, and its cache key
+    autocs = None
+    autocs_key = ""
+    # frames since powerups were last checked against MapConfig.haste
+    powerup_frames = 0
+    # solver time per server frame instead of qlx_solverFrameBudgetMs,
+    # batch solves don't need to keep the server responsive
+    frame_budget_ms = None
 
     def __init__(self, client_id):
         super().__init__(client_id)
+        self.kinematics_buffer = Kinematics()
+
+    @property
+    def state(self):
+        # each fetch builds a whole player_state, worth timing
+        return self.player_state()
+
+    # engine calls as methods, so the profiler can time them
+
+    def player_state(self):
+        return minqlx.player_state(self.id)
+
+    def kinematics(self):
+        """The per-frame part of the state, filled into a buffer reused every call."""
+        if minqlx.player_kinematics(self.id, self.kinematics_buffer.values) is None:
+            raise minqlx.NonexistentPlayerError("The bot has been removed.")
+        return self.kinematics_buffer
+
+    def client_think(self, cmd, msec):
+        return minqlx.client_think(self.id, cmd, msec)
+
+    def snapshot(self, client_id=None):
+        return minqlx.snapshot_player(self.id if client_id is None else client_id)
+
+    def restore(self, snapshot):
+        minqlx.restore_player(self.id, snapshot)
+
+    def simulate(self, snapshot, steps):
+        kinematics = minqlx.simulate_actions(self.id, snapshot, steps)
+        if kinematics is None:
+            raise minqlx.NonexistentPlayerError("The bot has been removed.")
+        return kinematics
+
+    def simulate_branches(self, client_ids, snapshots, steps):
+        return minqlx.simulate_branches(client_ids, snapshots, steps)
+
+    @staticmethod
+    def get_reward(position, velocity):
+        return MapConfig.get_reward(position, velocity)
+
+    @staticmethod
+    def get_rewards(positions, velocities):
+        return MapConfig.get_rewards(positions, velocities)
+
+    def start_profile(self):
+        """Attach a new profiler if qlx_solverProfile is 1.
+        Searches keep the methods they were created with, so call this first.
+        """
+        if self.profiler is not None:
+            self.profiler.detach()
+        if int(minqlx.get_cvar("qlx_solverProfile") or 0) == 1:
+            self.profiler = PhaseProfiler()
+            self.profiler.instrument(self, PROFILE_PHASES)
 
     @staticmethod
     def empty_solution():
@@ -342,12 +926,13 @@ class StrafeBot(minqlx.Player):
 
     def reset(self):
         self.playback_frame = -1
-        self.history = []
+        self.autocs = None
+        self.history = History()
         self.playback = False
         self.solve = False
         self.solve_done = False
-        self.best_solution = StrafeBot.empty_solution()
-        self.last_solution = StrafeBot.empty_solution()
+        self.best_reward = 0.0
+        self.solution = None
         self.teleport_to_start()
 
     def teleport_to_start(self):
@@ -359,70 +944,130 @@ class StrafeBot(minqlx.Player):
             0,
             0,
         )
-        self.history.append(
-            [
-                StrafeBot.empty_solution(),
-                [
-                    MapConfig.start_point.position[0],
-                    MapConfig.start_point.position[1],
-                    MapConfig.start_point.position[2],
-                ],
-                [0, 0, 0],
-                [0, MapConfig.start_point.angles[1], 0],
-                MapConfig.start_point.ground_ent,
-                0,
-                0,
-            ]
-        )
+        self.save_frame(StrafeBot.empty_solution())
 
     def add_cs_start(self, walk_frames, strafe_frames, strafe_angle):
-        actions = StrafeBot.get_cs_actions(walk_frames, strafe_frames, strafe_angle)
+        actions = Controller.get_cs_actions(walk_frames, strafe_frames, strafe_angle)
         for act in actions:
             self.save_frame(act)
             self.run_action(act)
         self.save_frame(StrafeBot.empty_solution())
 
     def save_frame(self, act):
-        self.history.append(
-            [
-                act,
-                self.state.position,
-                self.state.velocity,
-                self.state.viewangles,
-                self.state.ground_entity,
-                self.state.jump_time,
-                self.state.double_jumped,
-            ]
-        )
+        snapshot = self.snapshot()
+        self.history.append(act, *read_header(snapshot), snapshot=snapshot)
 
-    def start_playback(self):
-        if len(self.history) > 0:
-            self.teleport(
-                self.history[0][1],
-                self.history[0][2],
-                self.history[0][3],
-                self.history[0][4],
-                self.history[0][5],
-                self.history[0][6],
-            )
+    def rewind(self, i):
+        snapshot = self.history.snapshot(i)
+        if snapshot is not None:
+            self.restore(snapshot)
+            return
+        checkpoint, snapshot = self.history.checkpoint(i)
+        if snapshot is not None:
+            # only checkpoints keep their snapshot, replay the frames after it
+            self.restore(snapshot)
+            for j in range(checkpoint, i % len(self.history)):
+                self.run_action(self.history.action(j))
+            return
+        # loaded from a file, only kinematics were saved
+        self.teleport(*self.history.kinematics(i))
+        self.history.set_snapshot(i, self.snapshot())
+
+    def start_playback(self, strict=False):
+        # the solution or route may have changed MapConfig.haste
+        self.check_powerups()
+        self.stream = None
+        self.drift = None
+        if self.solution is not None:
+            # keyframe 0 puts the bot at the start
+            self.start_profile()
+            self.stream = self.solution.frames()
+            self.playback = True
+            if not strict:
+                self.drift = self.make_drift_check()
+        elif len(self.history) > 0:
+            self.start_profile()
+            self.rewind(0)
             self.playback = True
             self.playback_frame = -1
+            if not strict:
+                self.drift = self.make_drift_check()
         else:
             print("start_playback() expected history")
 
+    def make_drift_check(self):
+        return DriftCheck(
+            self.history,
+            float(
+                minqlx.get_cvar("qlx_playbackPositionTolerance")
+                or PLAYBACK_POSITION_TOLERANCE
+            ),
+            float(
+                minqlx.get_cvar("qlx_playbackVelocityTolerance")
+                or PLAYBACK_VELOCITY_TOLERANCE
+            ),
+        )
+
     def stop_playback(self):
         self.playback = False
 
-    def start_solve(self):
+    @staticmethod
+    def make_simulator():
+        return Simulator(
+            World.from_point(MapConfig.start_point),
+            get_params(minqlx.get_cvar("qlx_raceMode") or 0),
+            MapConfig.haste,
+        )
+
+    def start_solve(self, use_sim=False, beam=None, farm=None, journal=None, pool=None):
+        self.start_profile()
+        self.check_powerups()
+        # !play shows the history being solved from now on
+        self.solution = None
+        self.simulator = StrafeBot.make_simulator() if use_sim and farm is None else None
+        self.beam = None
+        self.farm = farm
+        # pool bots run engine rollouts, not farm or simulator ones
+        self.pool = pool if self.simulator is None and farm is None else None
+        self.pool_jobs = []
+        self.batches = 0
+        self.branches = 0
+        if self.journal is not None and self.journal is not journal:
+            self.journal.close()
+        self.journal = journal
+        # cached states are only valid for this solve's state type and route
+        self.table = TranspositionTable(
+            int(minqlx.get_cvar("qlx_solverCacheSize") or TRANSPOSITION_TABLE_SIZE)
+        )
+        self.scheduler = self.make_scheduler()
+        self.search = None
+        self.reached_end = False
+        self.best_reward = 0.0
+        self.rollouts = 0
+        self.decisions = 0
+        if farm is not None:
+            # drop results from an earlier solve
+            farm.cancel()
+        if (farm is not None or self.pool is not None) and beam is None:
+            beam = (BEAM_WIDTH, BEAM_DEPTH)
+        # beam search looks depth segments ahead, longer ones only cost it
+        self.adaptive_duration = (
+            beam is None and int(minqlx.get_cvar("qlx_solverAdaptiveDuration") or 0) == 1
+        )
         if len(self.history) > 0:
-            self.teleport(
-                self.history[-1][1],
-                self.history[-1][2],
-                self.history[-1][3],
-                self.history[-1][4],
-                self.history[-1][5],
-                self.history[-1][6],
-            )
+            self.rewind(-1)
+            if self.fixture is not None and self.fixture.root is None:
+                self.fixture.root = self.history.snapshot(-1)[:HEADER_SIZE]
+            self.duration = self.next_duration()
+            if beam is not None:
+                self.beam = BeamSearch(self.rollout, self.get_reward, beam[0], beam[1])
+                self.beam.reset(self.rollout_root())
+            elif int(minqlx.get_cvar("qlx_solverTurnSearch") or 0) == 1:
+                self.search = TurnRateSearch(self.evaluate)
+                self.search.reset()
+            else:
+                self.search = SweepSearch(self.evaluate)
+                self.search.reset()
             self.solve = True
         else:
             print("start_solve() expected history")
@@ -430,149 +1075,462 @@ class StrafeBot(minqlx.Player):
     def stop_solve(self):
         self.solve = False
 
-    def run_frame(self):
-        if MapConfig.haste == True and self.state.powerups.haste <= 0:
+    def make_scheduler(self):
+        if self.frame_budget_ms is not None:
+            return FrameScheduler(self.frame_budget_ms)
+        return FrameScheduler(
+            float(minqlx.get_cvar("qlx_solverFrameBudgetMs") or FRAME_BUDGET_MS)
+        )
+
+    def save_fixture(self):
+        if self.fixture is None:
+            print("not recording a fixture")
+            return
+        if self.fixture.root is None:
+            print("fixture is empty, start a solve first")
+            return
+        self.fixture.save(self.fixture_path)
+        print("saved fixture ", self.fixture_path, len(self.fixture))
+        self.fixture = None
+
+    def next_duration(self):
+        if not self.adaptive_duration:
+            return INPUT_FRAME_INTERVAL
+        return segment_duration(
+            MapConfig.get_corner_distance(self.history.position(-1)),
+            MathHelper.vec2_len(self.history.velocity(-1)),
+        )
+
+    def solve_mode(self):
+        if self.farm is not None:
+            return "farm beam"
+        if self.pool is not None:
+            return "pool beam"
+        if self.beam is not None:
+            return "beam"
+        if isinstance(self.search, TurnRateSearch):
+            return "golden section"
+        return "sweep"
+
+    def telemetry(self):
+        """Solve progress for the telemetry publisher."""
+        if self.solve:
+            state = "solving"
+        elif self.autocs is not None:
+            state = "autocs"
+        elif self.playback:
+            state = "playback"
+        else:
+            state = "idle"
+        position = (0.0, 0.0, 0.0)
+        velocity = (0.0, 0.0, 0.0)
+        if len(self.history) > 0:
+            position = self.history.position(-1)
+            velocity = self.history.velocity(-1)
+        rollouts = self.rollouts
+        if self.autocs is not None:
+            rollouts = self.autocs.rollouts
+        scheduler = self.scheduler
+        return {
+            "state": state,
+            "route": MapConfig.name,
+            "mode": self.solve_mode(),
+            "history": len(self.history),
+            "best_reward": self.best_reward,
+            "position": list(position),
+            "speed": MathHelper.vec2_len(velocity),
+            "decisions": self.decisions,
+            # the publisher turns this into rollouts_per_sec
+            "rollouts": rollouts,
+            "frames": scheduler.frames if scheduler is not None else 0,
+            "overruns": scheduler.overruns if scheduler is not None else 0,
+        }
+
+    def check_powerups(self):
+        state = self.state
+        if state is None:
+            raise minqlx.NonexistentPlayerError("The bot has been removed.")
+        powerups = state.powerups
+        if MapConfig.haste == True and powerups.haste <= 0:
             self.powerups(haste=999999)
-        elif MapConfig.haste == False and self.state.powerups.haste >= 0:
+        elif MapConfig.haste == False and powerups.haste >= 0:
             self.powerups(reset=True)
+        self.powerup_frames = 0
 
+    def run_frame(self):
+        """Returns False once the bot has been removed."""
+        try:
+            return self.run_client_frame()
+        except minqlx.NonexistentPlayerError:
+            return False
+
+    def run_client_frame(self):
+        # powerups are only in the full player_state, which is too slow to
+        # fetch every frame. haste lasts far longer than the check interval,
+        # and !bothaste checks immediately.
+        self.powerup_frames += 1
+        if self.powerup_frames >= POWERUP_CHECK_FRAMES:
+            self.check_powerups()
+
+        state = self.kinematics()
         if self.playback == True:
-            return self.run_playback_frame()
+            return self.run_playback_frame(state)
         elif self.solve == True:
             return self.run_solve_frame()
+        elif self.autocs is not None:
+            return self.run_autocs_frame()
         self.idle_frame()
 
-    def run_playback_frame(self):
+    def run_playback_frame(self, state):
+        if self.stream is not None:
+            return self.run_stream_frame(state)
+
         self.playback_frame += 1
 
         if self.playback_frame > len(self.history) - 1:
+            if self.drift is not None:
+                print("playback done, " + self.drift.report())
+                self.drift = None
             # don't timeout bot
             return self.idle_frame()
 
-        # determinism!
-        self.teleport(
-            self.history[self.playback_frame][1],
-            self.history[self.playback_frame][2],
-            self.history[self.playback_frame][3],
-            self.history[self.playback_frame][4],
-            self.history[self.playback_frame][5],
-            self.history[self.playback_frame][6],
-        )
+        if self.drift is None:
+            # determinism! frames between checkpoints have no snapshot,
+            # the recorded kinematics are the closest to it
+            if self.history.snapshot(self.playback_frame) is not None:
+                self.rewind(self.playback_frame)
+            else:
+                self.teleport(*self.history.kinematics(self.playback_frame))
+            state = None
+        elif self.drift.check(self.playback_frame, state.position, state.velocity):
+            self.rewind(self.playback_frame)
+            state = None
+
+        return self.run_action(self.history.action(self.playback_frame), False, state)
+
+    def run_stream_frame(self, state):
+        """Playback of a loaded solution, checked for drift at its keyframes
+        (strict playback teleports to every keyframe).
+        """
+        step = next(self.stream, None)
+        if step is None:
+            if self.drift is not None:
+                print("playback done, " + self.drift.report())
+            self.stream = None
+            self.playback = False
+            return self.idle_frame()
 
-        return self.run_action(self.history[self.playback_frame][0], False)
+        frame, action, keyframe = step
+        if keyframe is not None:
+            kinematics = read_header(keyframe)
+            if (
+                frame == 0
+                or self.drift is None
+                or self.drift.compare(
+                    frame, state.position, state.velocity, kinematics[0], kinematics[1]
+                )
+            ):
+                self.teleport(*kinematics)
+                state = None
+
+        return self.run_action(action, False, state)
+
+    def start_autocs(self, key):
+        """Search the circle jump start from the start point,
+        rollouts are spread over frames like a solve.
+        """
+        self.check_powerups()
+        self.reset()
+        start = self.history.snapshot(0)
+        direction = CircleStartSearch.route_direction(MapConfig.get_index().points)
+
+        def evaluate(params):
+            kinematics = self.simulate(start, CircleStartSearch.steps(params))
+            return CircleStartSearch.exit_speed(kinematics[1], direction)
+
+        self.scheduler = self.make_scheduler()
+        self.autocs = CircleStartSearch(evaluate)
+        self.autocs_key = key
+        self.autocs.reset()
+        print("searching circle jump start")
+
+    def run_autocs_frame(self):
+        self.scheduler.start_frame()
+        best = None
+        while best is None and self.scheduler.has_time():
+            best = self.autocs.step()
+        self.scheduler.end_frame()
+        if best is None:
+            return True
+
+        print(
+            "circle jump start !addcs {} {} {}, {:.1f} ups along the route, "
+            "{} rollouts".format(best[0], best[1], best[2], best[3], self.autocs.rollouts)
+        )
+        self.autocs = None
+        if len(MapConfig.name) > 0:
+            save_cached(MapConfig.name, self.autocs_key, MapConfig.start_point, best)
+        else:
+            print("route has no name, !savecfg it to cache the start")
+        self.rewind(0)
+        self.add_cs_start(best[0], best[1], best[2])
+        return True
 
     def run_solve_frame(self):
-        # Try actions until compute time gets close to actual frametime.
+        self.scheduler.start_frame()
+        ret = self.solve_frame_iterate()
+        self.scheduler.end_frame()
+        return ret
+
+    def solve_frame_iterate(self):
+        # Try actions while the scheduler predicts another one fits in the frame.
         # (this will call SV_ClientThink and G_RunFrame
-        # INPUT_FRAME_INTERVAL times for each action)
+        # self.duration times for each action)
         # Need to run a real COM_Frame/SV_Frame every now and then to not freeze server.
 
-        start_time = time.time()
-        while time.time() - start_time < 0.9 * (1.0 / 125.0):
-            if MapConfig.is_at_end(self.state.position):
+        while self.scheduler.has_time():
+            # the live bot is wherever the last rollout left it,
+            # only the committed history counts
+            if MapConfig.is_at_end(self.history.position(-1)):
                 self.solve_done = True
 
             if self.solve_done == True:
                 print("solve done, reached end")
                 self.solve = False
+                self.reached_end = True
+                # leave the bot at the end of the run, not of a rollout
+                self.rewind(-1)
+                if self.fixture is not None:
+                    self.save_fixture()
                 self.solve_done = False
                 return self.idle_frame()
 
-            # iterate through inputs
-            if self.last_solution[0] == Actions.MAX_ACTION:
-                self.last_solution[0] = Actions.LEFT_DIAG
-
-            elif self.last_solution[0] == Actions.LEFT_DIAG:
-                self.last_solution[0] = Actions.RIGHT_DIAG
+            if self.farm is not None:
+                # rollouts run elsewhere, nothing to spend the frame on
+                return self.solve_frame_farm()
 
-            elif self.last_solution[0] == Actions.RIGHT_DIAG:
-                self.last_solution[0] = Actions.LEFT
-                self.last_solution[1] = TURN_SPEED_INTERVAL
+            if self.pool is not None:
+                self.solve_frame_pool()
+                continue
 
-            elif self.last_solution[0] == Actions.LEFT:
-                self.last_solution[1] += TURN_SPEED_INTERVAL
-                if self.last_solution[1] > TURN_SPEED_MAX:
-                    self.last_solution[0] = Actions.RIGHT
-                    self.last_solution[1] = TURN_SPEED_INTERVAL
+            if self.beam is not None:
+                solution = self.beam.step()
+                if solution is not None:
+                    self.solve_frame_advance(solution)
+                    self.beam.reset(self.rollout_root())
+                continue
 
-            elif self.last_solution[0] == Actions.RIGHT:
-                self.last_solution[1] += TURN_SPEED_INTERVAL
-                if self.last_solution[1] > TURN_SPEED_MAX:
-                    # tried all inputs
-                    self.last_solution[1] = 0
-                    self.solve_frame_advance(self.best_solution)
-                    continue
-
-            # run the same solution INPUT_FRAME_INTERVAL frames in a row
-            self.solve_frame_measure()
+            solution = self.search.step()
+            if solution is not None:
+                self.solve_frame_advance(solution)
+                self.search.reset()
 
         return True
 
-    def solve_frame_measure(self):
-        self.teleport(
-            self.history[-1][1],
-            self.history[-1][2],
-            self.history[-1][3],
-            self.history[-1][4],
-            self.history[-1][5],
-            self.history[-1][6],
+    def evaluate(self, action):
+        """Reward of running action for self.duration frames from the last frame."""
+        self.rollouts += 1
+        history = self.history
+        key = TranspositionTable.key(
+            history.position(-1),
+            history.velocity(-1),
+            history.yaw(-1),
+            history.ground_entity(-1) != ENTITYNUM_NONE,
+            history.jump_time(-1),
+            history.double_jumped(-1),
+            action,
+            self.duration,
         )
-        for i in range(INPUT_FRAME_INTERVAL):
-            self.run_action(self.last_solution)
+        cached = self.table.get(key)
+        if cached is not None:
+            return cached[3]
+
+        if self.simulator is not None:
+            state = self.simulator.rollout(
+                self.simulator.state_from_history(history),
+                action,
+                self.duration,
+            )
+            position, velocity = state.position, state.velocity
+        else:
+            # rewind and run the whole interval in one call
+            position, velocity = self.simulate(
+                history.snapshot(-1),
+                [Controller.get_step(action)] * self.duration,
+            )[:2]
+            if self.fixture is not None:
+                self.fixture.record(
+                    history.snapshot(-1), action, self.duration, self.snapshot()
+                )
+        reward = self.get_reward(position, velocity)
+        # evaluate never needs the end state
+        self.table.put(key, None, position, velocity, reward)
+        return reward
+
+    def solve_frame_farm(self):
+        results = self.farm.poll()
+        rewards = []
+        if len(results) > 0:
+            rewards = self.get_rewards(
+                [r[2] for r in results], [r[3] for r in results]
+            )
+        for (context, state, position, velocity), reward in zip(results, rewards):
+            node, action = context
+            reward = float(reward)
+            if self.fixture is not None:
+                self.fixture.record(node[2], action, self.duration, state)
+            self.table.put(
+                self.state_key(node[2], action), state, position, velocity, reward
+            )
+            self.merge_beam_result(node, action, (state, position, velocity, reward))
+
+        for node, action in self.beam.take_jobs():
+            self.rollouts += 1
+            cached = self.table.get(self.state_key(node[2], action))
+            if cached is not None:
+                self.merge_beam_result(node, action, cached)
+                continue
+            self.farm.submit(
+                (node, action),
+                node[2],
+                [Controller.get_step(action)],
+                self.duration,
+                MapConfig.haste,
+                World.floor_under(MapConfig.start_point),
+            )
+        return self.idle_frame()
+
+    def solve_frame_pool(self):
+        """Run up to len(self.pool) of the beam's rollouts side by side,
+        every server frame of the rollout advances all of them.
+        """
+        if len(self.pool_jobs) == 0:
+            self.pool_jobs = self.beam.take_jobs()
+        batch = []
+        while len(self.pool_jobs) > 0 and len(batch) < len(self.pool):
+            node, action = self.pool_jobs.pop()
+            self.rollouts += 1
+            cached = self.table.get(self.state_key(node[2], action))
+            if cached is not None:
+                self.merge_beam_result(node, action, cached)
+                continue
+            batch.append((node, action))
+        if len(batch) == 0:
+            return
 
-        old_reward = self.last_solution[2]
-        self.last_solution[2] = MapConfig.get_reward(
-            self.state.position, self.state.velocity
+        client_ids = self.pool[: len(batch)]
+        kinematics = self.simulate_branches(
+            client_ids,
+            [node[2] for node, action in batch],
+            [[Controller.get_step(action)] * self.duration for node, action in batch],
+        )
+        self.batches += 1
+        self.branches += len(batch)
+        rewards = self.get_rewards([k[0] for k in kinematics], [k[1] for k in kinematics])
+        # the duration changes once the last result completes the search
+        duration = self.duration
+        for (node, action), client_id, k, reward in zip(
+            batch, client_ids, kinematics, rewards
+        ):
+            end = self.snapshot(client_id)
+            reward = float(reward)
+            if self.fixture is not None:
+                self.fixture.record(node[2], action, duration, end)
+            self.table.put(self.state_key(node[2], action), end, k[0], k[1], reward)
+            self.merge_beam_result(node, action, (end, k[0], k[1], reward))
+
+    def merge_beam_result(self, node, action, result):
+        solution = self.beam.add_result(node, action, *result)
+        if solution is not None:
+            self.solve_frame_advance(solution)
+            self.beam.reset(self.rollout_root())
+
+    def state_key(self, state, action):
+        """Transposition table key of a rollout state (SimState, snapshot or header)."""
+        if isinstance(state, SimState):
+            return TranspositionTable.key(
+                state.position,
+                state.velocity,
+                state.viewangles[1],
+                state.grounded,
+                state.jump_time,
+                state.double_jumped,
+                action,
+                self.duration,
+            )
+        position, velocity, viewangles, ground_entity, jump_time, double_jumped = (
+            read_header(state)
+        )
+        return TranspositionTable.key(
+            position,
+            velocity,
+            viewangles[1],
+            ground_entity != ENTITYNUM_NONE,
+            jump_time,
+            double_jumped,
+            action,
+            self.duration,
         )
 
-        if self.last_solution[2] > self.best_solution[2]:
-            self.best_solution = [
-                self.last_solution[0],
-                self.last_solution[1],
-                self.last_solution[2],
-            ]
-
-        # were we turning?
-        if old_reward > self.last_solution[2] and self.last_solution[0] in [
-            Actions.LEFT,
-            Actions.RIGHT,
-        ]:
-            if self.last_solution[1] > TURN_SPEED_INTERVAL:
-                # turning faster is giving less reward, don't bother iterating through remaining angles
-                if self.last_solution[0] == Actions.LEFT:
-                    self.last_solution[0] = Actions.RIGHT
-                    # incremented to TURN_SPEED_INTERVAL below
-                    self.last_solution[1] = 0
-                elif self.last_solution[0] == Actions.RIGHT:
-                    # tried all inputs
-                    self.last_solution[1] = 0
-                    return self.solve_frame_advance(self.best_solution)
-
-        return True
+    def rollout_root(self):
+        if self.simulator is not None:
+            return self.simulator.state_from_history(self.history)
+        if self.farm is not None:
+            # full snapshots can't leave this process
+            return self.history.snapshot(-1)[:HEADER_SIZE]
+        return self.history.snapshot(-1)
+
+    def rollout(self, state, action):
+        """Run action for self.duration frames from state,
+        returns (end state, position, velocity, reward).
+        """
+        self.rollouts += 1
+        key = self.state_key(state, action)
+        cached = self.table.get(key)
+        if cached is not None:
+            return cached
+
+        if self.simulator is not None:
+            end = self.simulator.rollout(state.copy(), action, self.duration)
+            position, velocity = end.position, end.velocity
+        else:
+            kinematics = self.simulate(
+                state, [Controller.get_step(action)] * self.duration
+            )
+            end = self.snapshot()
+            position, velocity = kinematics[0], kinematics[1]
+            if self.fixture is not None:
+                self.fixture.record(state, action, self.duration, end)
+        reward = self.get_reward(position, velocity)
+        self.table.put(key, end, position, velocity, reward)
+        return end, position, velocity, reward
 
     def solve_frame_advance(self, solution):
-        self.history[-1][0] = solution
-        self.teleport(
-            self.history[-1][1],
-            self.history[-1][2],
-            self.history[-1][3],
-            self.history[-1][4],
-            self.history[-1][5],
-            self.history[-1][6],
-        )
+        self.decisions += 1
+        self.best_reward = float(solution[2])
+        # the last frame gets its action now, journal from there
+        first = len(self.history) - 1
+        self.history.set_action(-1, solution, self.duration)
+        self.rewind(-1)
         print(
-            "history len {}, s {} {} {}".format(
+            "history len {}, s {} {} {} for {} frames".format(
                 len(self.history),
                 solution[0],
                 solution[1],
                 solution[2],
+                self.duration,
             )
         )
-        self.last_solution = StrafeBot.empty_solution()
-        self.best_solution = StrafeBot.empty_solution()
-        for i in range(INPUT_FRAME_INTERVAL):
+        start = self.history.snapshot(-1)
+        for i in range(self.duration):
             self.run_action(solution)
             self.save_frame(solution)
+        if self.fixture is not None:
+            # what the benchmark replays, in case it differs from the rollout
+            self.fixture.record(start, solution, self.duration, self.history.snapshot(-1))
+        if self.journal is not None:
+            self.journal.append(self.history, first)
+        self.duration = self.next_duration()
         return True
 
     def idle_frame(self):
@@ -589,277 +1547,34 @@ class StrafeBot(minqlx.Player):
         if double_jumped >= 0:
             minqlx.set_double_jumped(self.id, double_jumped)
 
-    @staticmethod
-    def get_cs_actions(walk_frames, strafe_frames, strafe_angle):
-        actions = []
-        total_frames = walk_frames + strafe_frames
-        turn_rate = (125.0 / strafe_frames) * abs(strafe_angle)
-        for i in range(total_frames):
-            actions.append(
-                [
-                    Actions.LEFT if strafe_angle >= 0 else Actions.RIGHT,
-                    turn_rate if i >= walk_frames else 0.0,
-                    -math.inf,
-                    False if i < total_frames - 1 else True,
-                ]
-            )
-        return actions
-
-    def run_action(self, action, immediate=True):
-        max_ground_speed = 320.0
-        velocity = self.state.velocity
-        vel_len = MathHelper.vec2_len(velocity)
-        grounded = self.state.grounded
-        jump = (
-            grounded and vel_len > max_ground_speed and action[0] != Actions.MAX_ACTION
+    def run_action(self, action, immediate=True, state=None):
+        """state is the current kinematics if the caller already has it."""
+        return self.client_think(
+            Controller.get_cmd(action, self.kinematics() if state is None else state),
+            8 if immediate == True else 0,  # 1000 / 125
         )
-        # disallow jump arg, e.g. when circle strafing
-        if len(action) >= 4 and action[3] == False:
-            jump = False
-        current_yaw = self.state.viewangles[1]
-        new_yaw = current_yaw
-        wishmove = None
-        frametime = 1.0 / 125.0
-
-        # don't walkmove for 1 frame,
-        # jump will return early and call airmove instead.
-        # (or watermove)
-        if jump:
-            grounded = False
-
-        if grounded:
-            # don't modify passed list
-            act = action[0]
-            turn = 0
-            if act == Actions.LEFT:
-                act = Actions.LEFT_DIAG
-                turn = float(action[1]) * frametime
-            elif act == Actions.RIGHT:
-                act = Actions.RIGHT_DIAG
-                turn = -float(action[1]) * frametime
-
-            accel = 10.0
-
-            wishmove = self.get_wishmove(act, jump)
-            if turn != 0:
-                new_yaw += turn
 
-        else:
-            wishmove = self.get_wishmove(action[0], jump)
 
-            # Acceleration
-            if action[0] in [Actions.LEFT_DIAG, Actions.RIGHT_DIAG]:
-                if MathHelper.vec2_len(wishmove) > 0.1 and vel_len > 0.1:
-                    forward = MathHelper.get_forward(current_yaw)
-                    right = [forward[1], -forward[0], 0]
+class EngineFarmWorker(FarmWorker):
+    """Runs farm jobs on this server's bot."""
 
-                    wishvel = [0.0, 0.0, 0.0]
-                    for i in range(3):
-                        wishvel[i] = forward[i] * wishmove[0] + right[i] * wishmove[1]
-                    wishvel[2] += wishmove[2]
-                    wishspeed = MathHelper.vec2_len(wishvel)
+    def __init__(self, bot, jobs_address, results_address):
+        super().__init__(jobs_address, results_address)
+        self.bot = bot
 
-                    accel = 1.0
+    def run_job(self, state, steps, frames, haste, floor):
+        # the floor is for simulator workers, this one runs on the map
+        if haste != MapConfig.haste:
+            MapConfig.haste = haste
+            if haste:
+                self.bot.powerups(haste=999999)
+            else:
+                self.bot.powerups(reset=True)
 
-                    vel_to_optimal_yaw = MathHelper.get_optimal_strafe_angle(
-                        wishspeed, accel, velocity, frametime
-                    )
-                    vel_to_optimal_yaw = MathHelper.rad_to_deg(vel_to_optimal_yaw)
-                    if vel_to_optimal_yaw > 0:
-                        vel_to_optimal_yaw -= 45.0
-                        if action[0] in [Actions.RIGHT_DIAG, Actions.RIGHT]:
-                            vel_to_optimal_yaw = -vel_to_optimal_yaw
-                    vel_yaw = MathHelper.get_yaw(
-                        [velocity[0], velocity[1], velocity[2]]
-                    )
-                    new_yaw = vel_yaw + vel_to_optimal_yaw
-            # Turning
-            elif action[0] in [Actions.LEFT, Actions.RIGHT]:
-                if vel_len > 0.1:
-                    yaw_change = float(action[1]) * frametime
-                    if action[0] == Actions.RIGHT:
-                        yaw_change = -yaw_change
-                    vel_yaw = MathHelper.get_yaw(
-                        [velocity[0], velocity[1], velocity[2]]
-                    )
-                    # Adding to vel_yaw will result in turns that are way too fast.
-                    # (Velocity direction overshoots aim direction when strafing.)
-                    # new_yaw = vel_yaw + yaw_change
-                    # Add the change to current instead, and snap current angle to velocity
-                    # when starting the strafe.
-                    # Assume we're starting the strafe if angle delta is too big.
-                    if abs(MathHelper.yaw_diff(new_yaw, vel_yaw)) > TURN_SNAP_ANGLE:
-                        new_yaw = vel_yaw
-                    new_yaw += yaw_change
-
-        # delta required here for bot
-        new_yaw = MathHelper.wrap_yaw(new_yaw - self.state.delta_angles[1])
-
-        cmd = {
-            "pitch": 0,
-            "yaw": new_yaw,
-            "roll": 0,
-            "buttons": 0,
-            "weapon": 5,
-            "weapon_primary": 5,
-            "fov": 100,
-            "forwardmove": wishmove[0],
-            "rightmove": wishmove[1],
-            "upmove": wishmove[2],
-        }
-        success = minqlx.client_think(
-            self.id, cmd, 8 if immediate == True else 0  # 1000 / 125
+        position, velocity, viewangles, ground_entity, jump_time, double_jumped = read_header(state)
+        self.bot.teleport(position, velocity, viewangles, ground_entity, jump_time, double_jumped)
+        kinematics = self.bot.simulate(
+            None, [(s[0], s[1], s[2]) for s in steps for i in range(frames)]
         )
-
-        return success
-
-    def get_wishmove(self, action, jump):
-        speed = 127
-        wishdir = [0, 0, 0]
-        if action == Actions.LEFT_DIAG:
-            wishdir = [speed, -speed, 0]
-        elif action == Actions.LEFT:
-            wishdir = [0, -speed, 0]
-        elif action == Actions.RIGHT_DIAG:
-            wishdir = [speed, speed, 0]
-        elif action == Actions.RIGHT:
-            wishdir = [0, speed, 0]
-        if jump:
-            wishdir[2] = speed
-        return wishdir
-
-
-class MathHelper:
-    @staticmethod
-    def wrap_yaw(yaw):
-        while yaw > 180.0:
-            yaw -= 360.0
-        while yaw < -180.0:
-            yaw += 360.0
-        return yaw
-
-    @staticmethod
-    def rad_to_deg(a):
-        return a * 180.0 / math.pi
-
-    @staticmethod
-    def deg_to_rad(a):
-        return a * math.pi / 180.0
-
-    @staticmethod
-    def get_yaw(vec):
-        norm = MathHelper.vec3_norm(vec)
-        rad = math.acos(norm[0])
-        deg = 180.0 * rad / math.pi  # 0-180
-        if norm[1] < 0:
-            return -deg
-        return deg
-
-    @staticmethod
-    def yaw_diff(a, b):
-        d = (a + 180) - (b + 180)
-        while d > 180:
-            d -= 360
-        while d < -180:
-            d += 360
-        return d
-
-    @staticmethod
-    def get_forward(yaw):
-        rad = yaw * math.pi * 2.0 / 360.0
-        a = math.sin(rad)
-        b = math.cos(rad)
-        return [b, a, 0]
-
-    @staticmethod
-    def sign(x):
-        if x < 0:
-            return -1.0
-        elif x > 0:
-            return 1.0
-        return 0.0
-
-    @staticmethod
-    def vec2_angle_sign(v, w):
-        return MathHelper.sign(v[0] * w[1] - v[1] * w[0])
-
-    @staticmethod
-    def vec_dot(v, w, i):
-        dot = 0.0
-        for i in range(i):
-            dot += v[i] * w[i]
-        return dot
-
-    @staticmethod
-    def vec2_len(v):
-        return math.sqrt(MathHelper.vec_dot(v, v, 2))
-
-    @staticmethod
-    def vec3_len(v):
-        return math.sqrt(MathHelper.vec_dot(v, v, 3))
-
-    @staticmethod
-    def vec3_norm(v):
-        a = [v[0], v[1], v[2]]
-        len = MathHelper.vec3_len(a)
-        a[0] /= len
-        a[1] /= len
-        a[2] /= len
-        return a
-
-    @staticmethod
-    def vec3_add(v, w):
-        return [v[0] + w[0], v[1] + w[1], v[2] + w[2]]
-
-    @staticmethod
-    def vec3_sub(v, w):
-        return [v[0] - w[0], v[1] - w[1], v[2] - w[2]]
-
-    @staticmethod
-    def vec3_scale(v, a):
-        return [v[0] * a, v[1] * a, v[2] * a]
-
-    @staticmethod
-    def vec3_dist(v, w):
-        return MathHelper.vec3_len([v[0] - w[0], v[1] - w[1], v[2] - w[2]])
-
-    @staticmethod
-    def clamp(a, b, c):
-        return min(c, max(a, b))
-
-    @staticmethod
-    def get_optimal_strafe_angle(wishspeed, accel, velocity, frametime):
-        # speed = accel * wishspeed * frametime
-        # num = wishspeed - speed
-        num = wishspeed * (1.0 - accel * frametime)
-        vel_len = MathHelper.vec2_len(velocity)
-        if num >= vel_len:
-            return 0
-        return math.acos(num / vel_len)
-
-    @staticmethod
-    def line_closest_point(start, end, pos):
-        norm = MathHelper.vec3_norm(MathHelper.vec3_sub(end, start))
-        to_pos = MathHelper.vec3_sub(pos, start)
-        frac = MathHelper.vec_dot(to_pos, norm, 3)
-        return MathHelper.vec3_add(start, MathHelper.vec3_scale(norm, frac))
-
-    @staticmethod
-    def line_closest_point_clamped(start, end, pos):
-        closest = MathHelper.line_closest_point(start, end, pos)
-
-        # closest is a point projected onto the line
-        # and can be outside the line segment, clamp.
-        line_dot = MathHelper.vec_dot(start, end, 3)
-        closest_dot = MathHelper.vec_dot(closest, end, 3)
-
-        if line_dot * closest_dot > 0:
-            # same direction
-            if MathHelper.vec3_dist(start, end) < MathHelper.vec3_dist(closest, end):
-                closest = start
-        else:
-            # opposite
-            if MathHelper.vec3_dist(start, end) < MathHelper.vec3_dist(closest, start):
-                closest = end
-
-        return closest
+        end = self.bot.snapshot()[:HEADER_SIZE]
+        return end, kinematics[0], kinematics[1]
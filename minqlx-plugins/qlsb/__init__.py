@@ -0,0 +1,24 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Helpers for the bot_test strafe bot.
+
+Nothing in this package imports minqlx, so everything here can also be
+used outside of the server (offline simulation, tools, benchmarks).
+qlsb.engine stands in for minqlx to run bot_test.py itself offline.
+"""
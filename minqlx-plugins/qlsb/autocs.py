@@ -0,0 +1,261 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Tunes the circle jump start of Controller.get_cs_actions.
+
+A circle jump start walks for walk_frames, strafes for strafe_frames while
+turning strafe_angle degrees, then jumps. Which values give the most speed
+depends on the map, the route direction, haste and the physics, so
+CircleStartSearch tries a coarse grid of them from the start point and
+then refines around the best one with halved steps. A start is scored by
+its exit speed, the velocity after the jump along the direction from the
+start to the next route point.
+
+The search is resumable like ActionSearch: step() runs one rollout, so
+StrafeBot can spread it over server frames. The best values are cached
+per route, physics and haste in qlsb_data/<route>.autocs.
+
+    python3 -m qlsb.autocs route [--race-mode n]
+
+runs the same search on the offline simulator.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from .controller import Controller
+from .mathhelper import MathHelper
+
+AUTOCS_SUFFIX = ".autocs"
+# coarse grid, the refinement starts at half these steps
+AUTOCS_WALK_FRAMES = range(0, 29, 4)
+AUTOCS_STRAFE_FRAMES = range(20, 141, 15)
+AUTOCS_STRAFE_ANGLES = [a for a in range(-360, 361, 30) if abs(a) >= 90]
+AUTOCS_REFINE_STEPS = (2, 7, 15)  # walk frames, strafe frames, angle
+# rounds at the finest step before settling on a local best
+AUTOCS_MAX_FINE_ROUNDS = 8
+
+
+class CircleStartSearch:
+    """Finds (walk_frames, strafe_frames, strafe_angle),
+    evaluate(params) -> exit speed runs one rollout.
+    """
+
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+        self.rollouts = 0
+        self.results = {}
+        # [walk_frames, strafe_frames, strafe_angle, exit speed]
+        self.best = None
+        self.pending = None
+        self.search = None
+
+    def reset(self):
+        self.results = {}
+        self.best = None
+        self.search = self._search()
+        self.pending = next(self.search)
+
+    def step(self):
+        """Run one rollout, returns self.best once the search is done."""
+        while True:
+            params = self.pending
+            speed = self.results.get(params)
+            evaluated = speed is None
+            if evaluated:
+                speed = self.evaluate(params)
+                self.rollouts += 1
+                self.results[params] = speed
+                if self.best is None or speed > self.best[3]:
+                    self.best = [params[0], params[1], params[2], speed]
+            try:
+                self.pending = self.search.send(speed)
+            except StopIteration:
+                return self.best
+            if evaluated:
+                return None
+
+    def _search(self):
+        for walk_frames in AUTOCS_WALK_FRAMES:
+            for strafe_frames in AUTOCS_STRAFE_FRAMES:
+                for strafe_angle in AUTOCS_STRAFE_ANGLES:
+                    yield (walk_frames, strafe_frames, strafe_angle)
+
+        steps = AUTOCS_REFINE_STEPS
+        fine_rounds = 0
+        while fine_rounds < AUTOCS_MAX_FINE_ROUNDS:
+            center = tuple(self.best[:3])
+            for params in CircleStartSearch.neighbours(center, steps):
+                yield params
+            if max(steps) > 1:
+                steps = tuple(max(1, s // 2) for s in steps)
+            elif tuple(self.best[:3]) == center:
+                # no neighbour is better
+                return
+            else:
+                fine_rounds += 1
+
+    @staticmethod
+    def neighbours(center, steps):
+        for dw in (-1, 0, 1):
+            for ds in (-1, 0, 1):
+                for da in (-1, 0, 1):
+                    walk_frames = center[0] + dw * steps[0]
+                    strafe_frames = center[1] + ds * steps[1]
+                    strafe_angle = center[2] + da * steps[2]
+                    if (
+                        walk_frames >= 0
+                        and strafe_frames >= 1
+                        and strafe_angle != 0
+                        and abs(strafe_angle) <= 360
+                    ):
+                        yield (walk_frames, strafe_frames, strafe_angle)
+
+    @staticmethod
+    def steps(params):
+        """The (action, turn_rate, allow_jump) steps of a start,
+        one per frame for minqlx.simulate_actions.
+        """
+        return [Controller.get_step(a) for a in Controller.get_cs_actions(*params)]
+
+    @staticmethod
+    def route_direction(points):
+        """Unit vector from the start to the next route point, on the ground plane."""
+        delta = MathHelper.vec3_sub(points[1].position, points[0].position)
+        length = MathHelper.vec2_len(delta)
+        if length == 0:
+            return [0.0, 0.0, 0.0]
+        return [delta[0] / length, delta[1] / length, 0.0]
+
+    @staticmethod
+    def exit_speed(velocity, direction):
+        return MathHelper.vec_dot(velocity, direction, 2)
+
+
+def cache_key(params, haste):
+    """Cached values are per physics and haste, params is a PhysicsParams."""
+    return params.name + (" haste" if haste else "")
+
+
+def load_cached(name, key, start, directory="qlsb_data"):
+    """The cached (walk_frames, strafe_frames, strafe_angle) for the route,
+    None if there are none or the start point moved since.
+    """
+    path = os.path.join(directory, name + AUTOCS_SUFFIX)
+    try:
+        with open(path) as file:
+            entry = json.load(file).get(key)
+    except (OSError, ValueError):
+        return None
+    if entry is None or entry.get("start") != _start_key(start):
+        return None
+    return (entry["walk_frames"], entry["strafe_frames"], entry["strafe_angle"])
+
+
+def save_cached(name, key, start, best, directory="qlsb_data"):
+    path = os.path.join(directory, name + AUTOCS_SUFFIX)
+    cache = {}
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        pass
+    cache[key] = {
+        "start": _start_key(start),
+        "walk_frames": best[0],
+        "strafe_frames": best[1],
+        "strafe_angle": best[2],
+        "exit_speed": best[3],
+    }
+    with open(path, mode="w") as file:
+        json.dump(cache, file, indent=2, sort_keys=True)
+    return path
+
+
+def _start_key(start):
+    # rounded so it survives the round trip through the route file
+    return [round(float(x), 3) for x in start.position] + [
+        round(float(start.angles[1]), 3)
+    ]
+
+
+def main():
+    from .benchmark import start_state
+    from .pmove import Simulator, World, get_params
+    from .route import load_route, route_path, ROUTE_SUFFIX
+
+    parser = argparse.ArgumentParser(description="qlsb circle jump start search")
+    parser.add_argument("route", help="route name or file")
+    parser.add_argument("--directory", default="qlsb_data", help="route directory")
+    parser.add_argument("--race-mode", type=int, default=0, help="qlx_raceMode")
+    parser.add_argument("--no-cache", action="store_true", help="don't save the result")
+    args = parser.parse_args()
+
+    if args.route.endswith(ROUTE_SUFFIX) or os.path.isfile(args.route):
+        name = os.path.basename(args.route)
+        if name.endswith(ROUTE_SUFFIX):
+            name = name[: -len(ROUTE_SUFFIX)]
+        directory = os.path.dirname(args.route) or "."
+        route = load_route(args.route)
+    else:
+        name = args.route
+        directory = args.directory
+        route = load_route(route_path(name, directory))
+
+    params = get_params(args.race_mode)
+    simulator = Simulator(World.from_point(route.start), params, route.haste)
+    start = start_state(route, route.haste)
+    direction = CircleStartSearch.route_direction(route.points())
+
+    def evaluate(cs):
+        ps = start.copy()
+        for action in Controller.get_cs_actions(*cs):
+            simulator.run_action(ps, action)
+        return CircleStartSearch.exit_speed(ps.velocity, direction)
+
+    search = CircleStartSearch(evaluate)
+    search.reset()
+    started = time.perf_counter()
+    best = None
+    while best is None:
+        best = search.step()
+    print(
+        "{}: !addcs {} {} {}, {:.1f} ups along the route, "
+        "{} rollouts in {:.1f} s".format(
+            name,
+            best[0],
+            best[1],
+            best[2],
+            best[3],
+            search.rollouts,
+            time.perf_counter() - started,
+        ),
+        file=sys.stderr,
+    )
+    if not args.no_cache:
+        key = cache_key(params, route.haste)
+        path = save_cached(name, key, route.start, best, directory)
+        print("cached in", path, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Deterministic solver benchmark.
+
+Solves stored routes with StrafeBot from bot_test.py, the solver the
+server runs, with a qlsb.engine.Engine in place of minqlx: rollouts run
+on the offline simulator, or are replayed from a fixture of rollout
+responses (!recordfixture on the server, --record here). Everything but
+the timings is deterministic, so two runs of the same tree give the same
+solution and a change to the solver shows up as a change in speed
+(rollouts/sec, wall time) or quality (run frames).
+
+    python3 -m qlsb.benchmark [route ...] [--search sweep|golden|beam|pool]
+        [--fixed-duration] [--fixture file] [--record file] [--output file]
+
+Routes are names in --directory or paths to route files, every route in
+qlsb/benchmarks by default. qlsb/benchmarks/straight.fixture is the
+straight route recorded with the default options:
+
+    python3 -m qlsb.benchmark straight --fixture qlsb/benchmarks/straight.fixture
+
+Results are written as JSON, the bot's own output is dropped.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import types
+import zlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .engine import Engine
+from .fixture import Fixture
+from .pmove import Simulator, SimState, World, get_params
+from .route import load_route, load_routes, route_path, ROUTE_SUFFIX
+from .scheduler import FRAME_BUDGET_MS
+from .search import BEAM_WIDTH, BEAM_DEPTH
+from .snapshot import HEADER_SIZE
+from .transposition import TRANSPOSITION_TABLE_SIZE
+
+# give up on routes the solver can't finish, one minute of run time
+BENCHMARK_MAX_FRAMES = 7500
+# routes and fixtures that ship with qlsb
+BENCHMARK_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmarks"
+)
+# the package bot_test.py is imported in, it imports qlsb relative to it
+PLUGIN_PACKAGE = "minqlx-plugins"
+
+# bot_test.py imported on an Engine, see load_bot_test
+_plugin = None
+
+
+def start_state(route, haste):
+    """The state StrafeBot.teleport_to_start leaves the bot in."""
+    return SimState(
+        route.start.position,
+        (0, 0, 0),
+        (0, route.start.angles[1], 0),
+        route.start.ground_ent,
+        0,
+        0,
+        haste,
+    )
+
+
+def load_bot_test():
+    """Import bot_test.py with an Engine as minqlx, returns the module.
+    Its minqlx attribute is the Engine, reset() it for every solve.
+    """
+    global _plugin
+    if _plugin is not None:
+        return _plugin
+    engine = Engine()
+    previous = engine.install()
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    package = types.ModuleType(PLUGIN_PACKAGE)
+    package.__path__ = [directory]
+    sys.modules[PLUGIN_PACKAGE] = package
+    name = PLUGIN_PACKAGE + ".bot_test"
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(directory, "bot_test.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        # the plugin keeps its reference, nothing else should see the Engine
+        if previous is not None:
+            sys.modules["minqlx"] = previous
+        else:
+            del sys.modules["minqlx"]
+    _plugin = module
+    return module
+
+
+class BotSolve:
+    """A solve of one route by StrafeBot, run a server frame at a time."""
+
+    def __init__(
+        self,
+        name,
+        route,
+        search="sweep",
+        race_mode=0,
+        adaptive_duration=True,
+        cache_size=TRANSPOSITION_TABLE_SIZE,
+        beam=(BEAM_WIDTH, BEAM_DEPTH),
+        pool_size=4,
+        fixture=None,
+        record=None,
+        frame_budget_ms=FRAME_BUDGET_MS,
+    ):
+        plugin = load_bot_test()
+        engine = plugin.minqlx
+        simulator = Simulator(
+            World.from_point(route.start), get_params(race_mode), route.haste
+        )
+        engine.reset(simulator, fixture)
+        engine.cvars.update(
+            {
+                "qlx_raceMode": str(race_mode),
+                "qlx_solverTurnSearch": "1" if search == "golden" else "0",
+                "qlx_solverAdaptiveDuration": "1" if adaptive_duration else "0",
+                "qlx_solverCacheSize": str(cache_size),
+                "qlx_solverProfile": "0",
+            }
+        )
+        self.engine = engine
+        plugin.MapConfig.routes[name] = route
+        plugin.MapConfig.load_config(name)
+
+        bot = plugin.StrafeBot(engine.bot_add(1))
+        bot.frame_budget_ms = frame_budget_ms
+        bot.reset()
+        start = bot.history.snapshot(-1)[:HEADER_SIZE]
+        if fixture is not None and start != fixture.root:
+            raise ValueError("the fixture doesn't start where {} does".format(name))
+        if record is not None:
+            bot.fixture = plugin.Fixture(name)
+            bot.fixture_path = record
+        pool = None
+        if search == "pool":
+            # the same bots bot_test.get_pool adds
+            pool = [bot.id]
+            while len(pool) < pool_size:
+                helper = plugin.StrafeBot(engine.bot_add(1))
+                helper.reset()
+                pool.append(helper.id)
+        bot.start_solve(False, beam if search == "beam" else None, None, None, pool)
+        self.bot = bot
+
+    def run(self, max_frames=BENCHMARK_MAX_FRAMES):
+        """Run server frames until the solve ends, returns the wall time in
+        seconds or None if the run got longer than max_frames first.
+        """
+        bot = self.bot
+        start = time.perf_counter()
+        while bot.solve:
+            if len(bot.history) > max_frames:
+                bot.stop_solve()
+                return None
+            bot.run_frame()
+        elapsed = time.perf_counter() - start
+        # saved when the solve reaches the end
+        if bot.fixture is not None:
+            bot.save_fixture()
+        return elapsed if bot.reached_end else None
+
+    def segments(self):
+        """[action, turn rate, allow jump, duration] of every committed segment,
+        as in a Solution.
+        """
+        history = self.bot.history
+        allow_jump = history.column("allow_jump")
+        segments = []
+        for start, duration in history.segments():
+            action = history.action(start)
+            segments.append([int(action[0]), action[1], allow_jump[start], duration])
+        return segments
+
+    def crc(self):
+        """crc32 of the committed segments, to compare solutions between runs."""
+        crc = 0
+        for act, turn_rate, allow_jump, duration in self.segments():
+            crc = zlib.crc32(
+                "{} {} {};".format(act, turn_rate, duration).encode(), crc
+            )
+        return "{:08x}".format(crc)
+
+
+def make_solve(args, name, route, record=None):
+    fixture = Fixture.load(args.fixture) if args.fixture is not None else None
+    return BotSolve(
+        name,
+        route,
+        args.search,
+        args.race_mode,
+        not args.fixed_duration,
+        args.cache_size,
+        (args.beam_width, args.beam_depth),
+        args.pool_size,
+        fixture,
+        record,
+    )
+
+
+def benchmark_route(args, name, route):
+    with open(os.devnull, mode="w") as devnull, contextlib.redirect_stdout(devnull):
+        solve = make_solve(args, name, route, args.record)
+        start = time.perf_counter()
+        wall_time = solve.run(args.max_frames)
+        elapsed = time.perf_counter() - start
+
+    bot = solve.bot
+    scheduler = bot.scheduler
+    result = {
+        "route": name,
+        "reached_end": wall_time is not None,
+        "wall_time": wall_time,
+        "elapsed": elapsed,
+        "run_frames": len(bot.history) - 1 if wall_time is not None else None,
+        "decisions": bot.decisions,
+        # rollouts asked for, including cache hits
+        "evaluations": bot.rollouts,
+        # rollouts the engine ran
+        "rollouts": solve.engine.rollouts,
+        "rollouts_per_sec": solve.engine.rollouts / elapsed if elapsed > 0 else 0.0,
+        "cache_hit_rate": bot.table.hit_rate(),
+        "server_frames": scheduler.frames,
+        "overruns": scheduler.overruns,
+        "skipped_frames": scheduler.skipped,
+        "solution_crc": solve.crc(),
+        "end_position": list(bot.history.position(-1)),
+        "peak_memory": None,
+    }
+
+    if not args.no_memory:
+        # tracemalloc slows the solver down several times, so memory is
+        # measured on a second, untimed run of the same deterministic solve
+        with open(os.devnull, mode="w") as devnull, contextlib.redirect_stdout(devnull):
+            solve = make_solve(args, name, route)
+            tracemalloc.start()
+            try:
+                solve.run(args.max_frames)
+                result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        if solve.crc() != result["solution_crc"]:
+            raise RuntimeError("{}: solve is not deterministic".format(name))
+    return result
+
+
+def find_routes(args):
+    if len(args.routes) == 0:
+        if args.fixture is not None:
+            name = Fixture.load(args.fixture).route_name
+            return [(name, load_route(route_path(name, args.directory)))]
+        return sorted(load_routes(args.directory).items())
+    routes = []
+    for arg in args.routes:
+        if arg.endswith(ROUTE_SUFFIX) or os.path.isfile(arg):
+            name = os.path.basename(arg)
+            if name.endswith(ROUTE_SUFFIX):
+                name = name[: -len(ROUTE_SUFFIX)]
+            routes.append((name, load_route(arg)))
+        else:
+            routes.append((arg, load_route(route_path(arg, args.directory))))
+    return routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qlsb solver benchmark")
+    parser.add_argument("routes", nargs="*", help="route names or files")
+    parser.add_argument(
+        "--directory", default=BENCHMARK_DIRECTORY, help="route directory"
+    )
+    parser.add_argument(
+        "--search", choices=["sweep", "golden", "beam", "pool"], default="sweep"
+    )
+    parser.add_argument("--beam-width", type=int, default=BEAM_WIDTH)
+    parser.add_argument("--beam-depth", type=int, default=BEAM_DEPTH)
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=4,
+        help="bots of --search pool, qlx_solverPoolSize",
+    )
+    parser.add_argument(
+        "--fixed-duration",
+        action="store_true",
+        help="INPUT_FRAME_INTERVAL frames per action, qlx_solverAdaptiveDuration 0",
+    )
+    parser.add_argument("--cache-size", type=int, default=TRANSPOSITION_TABLE_SIZE)
+    parser.add_argument("--race-mode", type=int, default=0, help="qlx_raceMode")
+    parser.add_argument("--max-frames", type=int, default=BENCHMARK_MAX_FRAMES)
+    parser.add_argument("--fixture", help="replay a recorded fixture")
+    parser.add_argument("--record", help="record the rollouts into a fixture")
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the peak memory run"
+    )
+    parser.add_argument("--output", default="-", help="JSON file, - for stdout")
+    args = parser.parse_args()
+
+    if args.fixture is not None and args.record is not None:
+        parser.error("--fixture replays a fixture, --record writes one, not both")
+    routes = find_routes(args)
+    if (args.fixture is not None or args.record is not None) and len(routes) != 1:
+        parser.error("fixtures hold exactly one route")
+
+    results = []
+    for name, route in routes:
+        result = benchmark_route(args, name, route)
+        results.append(result)
+        print(
+            "{}: {} frames, {:.2f} s, {:.0f} rollouts/s".format(
+                name,
+                result["run_frames"],
+                result["elapsed"],
+                result["rollouts_per_sec"],
+            ),
+            file=sys.stderr,
+        )
+
+    report = {
+        "python": platform.python_version(),
+        "search": args.search,
+        "adaptive_duration": not args.fixed_duration,
+        "cache_size": args.cache_size,
+        "race_mode": args.race_mode,
+        "backend": "fixture" if args.fixture is not None else "simulator",
+        "recorded": args.record,
+        "max_frames": args.max_frames,
+        # the whole process, tracemalloc only sees Python allocations
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if resource is not None
+        else None,
+        "routes": results,
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, mode="w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
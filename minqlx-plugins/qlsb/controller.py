@@ -0,0 +1,206 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Turns bot actions into usercmds.
+
+Shared by StrafeBot and the offline simulator so both drive the player the
+exact same way.
+"""
+
+import math
+from enum import IntEnum
+
+from .mathhelper import MathHelper
+from .strafetable import StrafeAngleTable
+
+
+class Actions(IntEnum):
+    LEFT_DIAG = 0
+    RIGHT_DIAG = 1
+    LEFT = 2
+    RIGHT = 3
+    MAX_ACTION = 4
+
+
+TURN_SPEED_MAX = 360  # deg/s
+TURN_SPEED_INTERVAL = 15  # deg/s
+TURN_SNAP_ANGLE = 5  # deg
+INPUT_FRAME_INTERVAL = 25  # frames per action
+# adaptive segment length bounds
+MIN_ACTION_FRAMES = 5
+MAX_ACTION_FRAMES = 100
+
+FRAMETIME = 1.0 / 125.0
+MAX_GROUND_SPEED = 320.0
+GROUND_ACCEL = 10.0
+AIR_ACCEL = 1.0
+WISHMOVE_SPEED = 127
+# |wishvel| of a diagonal wishmove, the same at any yaw
+STRAFE_WISHSPEED = math.sqrt(2.0) * WISHMOVE_SPEED
+
+STRAFE_TABLE = StrafeAngleTable()
+# yaw of the optimal diagonal air strafe, deg
+_strafe_yaw = STRAFE_TABLE.strafe_yaw(STRAFE_WISHSPEED, AIR_ACCEL, FRAMETIME)
+# MathHelper.get_yaw of the velocity, deg
+_velocity_yaw = STRAFE_TABLE.velocity_yaw()
+
+
+class Controller:
+    @staticmethod
+    def get_cmd(action, state):
+        """Build the usercmd dict for running action from state.
+
+        state can be anything with velocity, grounded, viewangles and
+        delta_angles attributes, e.g. minqlx.PlayerState or Kinematics.
+        """
+        velocity = state.velocity
+        vel_len = math.sqrt(velocity[0] * velocity[0] + velocity[1] * velocity[1])
+        grounded = state.grounded
+        # plain ints from here on, Actions attribute lookups are slow per frame
+        act = int(action[0])
+        jump = grounded and vel_len > MAX_GROUND_SPEED and act != _MAX_ACTION
+        # disallow jump arg, e.g. when circle strafing
+        if len(action) >= 4 and action[3] == False:
+            jump = False
+        new_yaw = state.viewangles[1]
+        wishmove = None
+        frametime = FRAMETIME
+
+        # don't walkmove for 1 frame,
+        # jump will return early and call airmove instead.
+        # (or watermove)
+        if jump:
+            grounded = False
+
+        if grounded:
+            turn = 0
+            if act == _LEFT:
+                act = _LEFT_DIAG
+                turn = float(action[1]) * frametime
+            elif act == _RIGHT:
+                act = _RIGHT_DIAG
+                turn = -float(action[1]) * frametime
+
+            wishmove = _WISHMOVES[act][jump]
+            if turn != 0:
+                new_yaw += turn
+
+        else:
+            wishmove = _WISHMOVES[act][jump]
+
+            # Acceleration
+            if act == _LEFT_DIAG or act == _RIGHT_DIAG:
+                if vel_len > 0.1:
+                    new_yaw = Controller.get_strafe_yaw(
+                        velocity, vel_len, act == _RIGHT_DIAG
+                    )
+            # Turning
+            elif act == _LEFT or act == _RIGHT:
+                if vel_len > 0.1:
+                    yaw_change = float(action[1]) * frametime
+                    if act == _RIGHT:
+                        yaw_change = -yaw_change
+                    vel_yaw = _velocity_yaw(velocity)
+                    # Adding to vel_yaw will result in turns that are way too fast.
+                    # (Velocity direction overshoots aim direction when strafing.)
+                    # new_yaw = vel_yaw + yaw_change
+                    # Add the change to current instead, and snap current angle to velocity
+                    # when starting the strafe.
+                    # Assume we're starting the strafe if angle delta is too big.
+                    if abs(MathHelper.yaw_diff(new_yaw, vel_yaw)) > TURN_SNAP_ANGLE:
+                        new_yaw = vel_yaw
+                    new_yaw += yaw_change
+
+        # delta required here for bot
+        # (MathHelper.wrap_yaw inlined)
+        new_yaw -= state.delta_angles[1]
+        while new_yaw > 180.0:
+            new_yaw -= 360.0
+        while new_yaw < -180.0:
+            new_yaw += 360.0
+
+        return {
+            "pitch": 0,
+            "yaw": new_yaw,
+            "roll": 0,
+            "buttons": 0,
+            "weapon": 5,
+            "weapon_primary": 5,
+            "fov": 100,
+            "forwardmove": wishmove[0],
+            "rightmove": wishmove[1],
+            "upmove": wishmove[2],
+        }
+
+    # get_strafe_yaw(velocity, vel_len, right), the yaw of the optimal
+    # diagonal air strafe, vel_len is the 2d speed. Runs every airborne frame,
+    # so it's built from the tables of STRAFE_TABLE with no trig per call.
+    get_strafe_yaw = staticmethod(_strafe_yaw)
+
+    @staticmethod
+    def get_step(action):
+        """The (action, turn_rate, allow_jump) step minqlx.simulate_actions
+        expands into the same usercmd get_cmd builds.
+        """
+        turn_rate = float(action[1]) if len(action) > 1 else 0.0
+        allow_jump = not (len(action) >= 4 and action[3] == False)
+        return (int(action[0]), turn_rate, allow_jump)
+
+    @staticmethod
+    def get_wishmove(action, jump):
+        speed = WISHMOVE_SPEED
+        wishdir = [0, 0, 0]
+        if action == Actions.LEFT_DIAG:
+            wishdir = [speed, -speed, 0]
+        elif action == Actions.LEFT:
+            wishdir = [0, -speed, 0]
+        elif action == Actions.RIGHT_DIAG:
+            wishdir = [speed, speed, 0]
+        elif action == Actions.RIGHT:
+            wishdir = [0, speed, 0]
+        if jump:
+            wishdir[2] = speed
+        return wishdir
+
+    @staticmethod
+    def get_cs_actions(walk_frames, strafe_frames, strafe_angle):
+        actions = []
+        total_frames = walk_frames + strafe_frames
+        turn_rate = (125.0 / strafe_frames) * abs(strafe_angle)
+        for i in range(total_frames):
+            actions.append(
+                [
+                    Actions.LEFT if strafe_angle >= 0 else Actions.RIGHT,
+                    turn_rate if i >= walk_frames else 0.0,
+                    -math.inf,
+                    False if i < total_frames - 1 else True,
+                ]
+            )
+        return actions
+
+
+_LEFT_DIAG = int(Actions.LEFT_DIAG)
+_RIGHT_DIAG = int(Actions.RIGHT_DIAG)
+_LEFT = int(Actions.LEFT)
+_RIGHT = int(Actions.RIGHT)
+_MAX_ACTION = int(Actions.MAX_ACTION)
+# get_wishmove for [action][jump]
+_WISHMOVES = [
+    [tuple(Controller.get_wishmove(a, jump)) for jump in (False, True)]
+    for a in range(_MAX_ACTION + 1)
+]
@@ -0,0 +1,85 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Checks a replayed solution against the history it was solved as.
+
+Playback feeds the stored actions and compares the live state with the
+stored one every frame. It only rewinds to the stored state when the error
+exceeds the tolerance, so a clean playback shows the solution reproduces,
+and the frames where it didn't are reported.
+"""
+
+from .mathhelper import MathHelper
+
+# the engine replays exactly, anything over this is a real divergence
+PLAYBACK_POSITION_TOLERANCE = 0.125  # units
+PLAYBACK_VELOCITY_TOLERANCE = 1.0  # ups
+# divergence frames listed in the report
+DRIFT_REPORT_FRAMES = 10
+
+
+class DriftCheck:
+    def __init__(
+        self,
+        history,
+        position_tolerance=PLAYBACK_POSITION_TOLERANCE,
+        velocity_tolerance=PLAYBACK_VELOCITY_TOLERANCE,
+    ):
+        self.history = history
+        self.position_tolerance = position_tolerance
+        self.velocity_tolerance = velocity_tolerance
+        self.frames = 0
+        # (frame, position error, velocity error)
+        self.divergences = []
+        self.max_position_error = 0.0
+        self.max_velocity_error = 0.0
+
+    def check(self, i, position, velocity):
+        """Compare the live state before frame i runs,
+        returns True if it drifted too far and should be rewound.
+        """
+        return self.compare(
+            i, position, velocity, self.history.position(i), self.history.velocity(i)
+        )
+
+    def compare(self, i, position, velocity, expected_position, expected_velocity):
+        """check() against a stored state that isn't in a history, e.g. a keyframe."""
+        self.frames += 1
+        pos_err = MathHelper.vec3_dist(position, expected_position)
+        vel_err = MathHelper.vec3_dist(velocity, expected_velocity)
+        self.max_position_error = max(self.max_position_error, pos_err)
+        self.max_velocity_error = max(self.max_velocity_error, vel_err)
+        if pos_err > self.position_tolerance or vel_err > self.velocity_tolerance:
+            self.divergences.append((i, pos_err, vel_err))
+            return True
+        return False
+
+    def report(self):
+        text = "{} frames checked, {} divergences, max pos err {:.3f}, max vel err {:.3f}".format(
+            self.frames,
+            len(self.divergences),
+            self.max_position_error,
+            self.max_velocity_error,
+        )
+        if len(self.divergences) > 0:
+            text += ", frames {}".format(
+                " ".join(str(d[0]) for d in self.divergences[:DRIFT_REPORT_FRAMES])
+            )
+            if len(self.divergences) > DRIFT_REPORT_FRAMES:
+                text += " ..."
+        return text
@@ -0,0 +1,305 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The minqlx calls of bot_test.py, answered without a server.
+
+An Engine is a module that stands in for minqlx, installed in
+sys.modules before bot_test.py is imported, so StrafeBot runs its own
+solve on it (see qlsb.benchmark). Players are SimStates run by the pmove
+simulator, snapshots are their headers, and like playerState_t the
+kinematics are stored as floats after every frame. With a fixture the
+rollouts (simulate_actions, simulate_branches) are its recorded
+responses, the frames the bot runs itself with client_think stay on the
+simulator.
+
+Only what bot_test.py uses is here: no map geometry beyond the
+simulator's World, no other entities, plugins can't be loaded.
+"""
+
+import sys
+import types
+from array import array
+
+from .controller import Controller
+from .pmove import SimState, ENTITYNUM_NONE
+
+# powerups.haste of a hasted player, the same as !bothaste gives
+HASTE_TIME = 999999
+
+
+class NonexistentPlayerError(Exception):
+    pass
+
+
+class Vector3(tuple):
+    pass
+
+
+class Powerups:
+    def __init__(self, haste=0):
+        self.haste = haste
+
+
+class PlayerState:
+    """The minqlx.PlayerState fields bot_test.py reads."""
+
+    def __init__(self, state):
+        self.position = Vector3(state.position)
+        self.velocity = Vector3(state.velocity)
+        self.viewangles = Vector3(state.viewangles)
+        self.delta_angles = Vector3(state.delta_angles)
+        self.grounded = state.grounded
+        self.ground_entity = state.ground_entity
+        self.jump_time = state.jump_time
+        self.double_jumped = state.double_jumped
+        self.powerups = Powerups(HASTE_TIME if state.haste else 0)
+
+
+class Plugin:
+    """Enough of minqlx.Plugin to define one, cvars are the engine's."""
+
+    engine = None
+
+    def set_cvar_once(self, name, value):
+        self.engine.cvars.setdefault(name, str(value))
+
+    def get_cvar(self, name, return_type=str):
+        value = self.engine.get_cvar(name)
+        if value is None or return_type is str:
+            return value
+        return return_type(value)
+
+    def add_hook(self, event, handler, priority=None):
+        pass
+
+    def add_command(self, name, handler, permission=0, usage=""):
+        pass
+
+
+class Player:
+    engine = None
+
+    def __init__(self, client_id, info=None):
+        self.id = client_id
+
+    def powerups(self, reset=False, haste=None):
+        state = self.engine.client(self.id)
+        if reset:
+            state.haste = False
+        if haste is not None:
+            state.haste = haste > 0
+
+
+def _store(values):
+    """values as the engine keeps them, in floats."""
+    return list(array("f", values))
+
+
+class Engine(types.ModuleType):
+    """minqlx for one route, reset() it for the next."""
+
+    PRI_NORMAL = 2
+
+    def __init__(self):
+        super().__init__("minqlx")
+        self.NonexistentPlayerError = NonexistentPlayerError
+        self.Vector3 = Vector3
+        self.Plugin = type("Plugin", (Plugin,), {"engine": self})
+        self.Player = type("Player", (Player,), {"engine": self})
+        self.cvars = {}
+        self.commands = []
+        self.clients = {}
+        self.simulator = None
+        self.fixture = None
+        # rollouts simulate_actions and simulate_branches ran or looked up
+        self.rollouts = 0
+        # frames run by client_think
+        self.frames = 0
+
+    def install(self):
+        """Make this the minqlx module, returns the one it replaced."""
+        previous = sys.modules.get("minqlx")
+        sys.modules["minqlx"] = self
+        return previous
+
+    def reset(self, simulator, fixture=None):
+        """No players, rollouts on simulator or from fixture."""
+        self.simulator = simulator
+        self.fixture = fixture
+        self.clients = {}
+        self.rollouts = 0
+        self.frames = 0
+
+    def client(self, client_id):
+        state = self.clients.get(client_id)
+        if state is None:
+            raise NonexistentPlayerError("Invalid client ID {}.".format(client_id))
+        return state
+
+    def get_cvar(self, name):
+        return self.cvars.get(name)
+
+    def console_command(self, command):
+        self.commands.append(command)
+
+    def bot_add(self, skill=1):
+        client_id = len(self.clients)
+        self.clients[client_id] = SimState(haste=self.simulator.haste)
+        return client_id
+
+    def player_state(self, client_id):
+        state = self.clients.get(client_id)
+        if state is None:
+            return None
+        return PlayerState(state)
+
+    def player_kinematics(self, client_id, values):
+        state = self.clients.get(client_id)
+        if state is None:
+            return None
+        values[0:3] = array("d", state.position)
+        values[3:6] = array("d", state.velocity)
+        values[6:9] = array("d", state.viewangles)
+        values[9:12] = array("d", state.delta_angles)
+        values[12] = 1.0 if state.grounded else 0.0
+        values[13] = state.ground_entity
+        values[14] = state.jump_time
+        values[15] = state.double_jumped
+        return True
+
+    def set_position(self, client_id, position):
+        self.client(client_id).position = _store(position)
+
+    def set_velocity(self, client_id, velocity):
+        self.client(client_id).velocity = _store(velocity)
+
+    def set_viewangles(self, client_id, viewangles):
+        self.client(client_id).viewangles = _store(viewangles)
+
+    def set_ground_entity(self, client_id, ground_entity):
+        self.client(client_id).ground_entity = ground_entity
+
+    def set_jump_time(self, client_id, jump_time):
+        self.client(client_id).jump_time = jump_time
+
+    def set_double_jumped(self, client_id, double_jumped):
+        self.client(client_id).double_jumped = double_jumped
+
+    def snapshot_player(self, client_id):
+        state = self.clients.get(client_id)
+        if state is None:
+            return None
+        return state.to_header()
+
+    def restore_player(self, client_id, snapshot):
+        state = self.client(client_id)
+        self.clients[client_id] = SimState.from_header(snapshot, state.haste)
+
+    def run_frame(self, state, cmd):
+        self.simulator.pmove.think(state, cmd)
+        state.position = _store(state.position)
+        state.velocity = _store(state.velocity)
+        state.viewangles = _store(state.viewangles)
+
+    def client_think(self, client_id, cmd, msec):
+        state = self.clients.get(client_id)
+        if state is None:
+            return False
+        # the bot's msec 0 cmds run on the next server frame,
+        # which is right away here
+        self.run_frame(state, cmd)
+        self.frames += 1
+        return True
+
+    def run_step(self, state, step):
+        if len(step) == 3:
+            action = [step[0], step[1], 0]
+            if not step[2]:
+                action.append(False)
+            cmd = Controller.get_cmd(action, state)
+        else:
+            keys = (
+                "pitch",
+                "yaw",
+                "roll",
+                "buttons",
+                "weapon",
+                "weapon_primary",
+                "fov",
+                "forwardmove",
+                "rightmove",
+                "upmove",
+            )
+            cmd = dict(zip(keys, step))
+        self.run_frame(state, cmd)
+
+    def replay(self, client_id, snapshot, steps):
+        """The fixture's response to the rollout, a step repeated len(steps) times."""
+        step = steps[0]
+        if len(step) != 3 or any(s != step for s in steps):
+            raise ValueError("fixtures only hold rollouts of a single step")
+        action = [step[0], step[1], 0] if step[2] else [step[0], step[1], 0, False]
+        end = self.fixture.response(snapshot, action, len(steps))
+        if end is None:
+            raise ValueError(
+                "fixture has no response for {} {} over {} frames, "
+                "the solver left the recorded path".format(step[0], step[1], len(steps))
+            )
+        self.restore_player(client_id, end)
+
+    def simulate_actions(self, client_id, snapshot, steps, all_steps=False):
+        if client_id not in self.clients:
+            return None
+        self.rollouts += 1
+        if self.fixture is not None and snapshot is not None and not all_steps:
+            self.replay(client_id, snapshot, steps)
+            return self.kinematics_tuple(client_id)
+
+        if snapshot is not None:
+            self.restore_player(client_id, snapshot)
+        state = self.clients[client_id]
+        kinematics = []
+        for step in steps:
+            self.run_step(state, step)
+            if all_steps:
+                kinematics.append(self.kinematics_tuple(client_id))
+        if all_steps:
+            return kinematics
+        return self.kinematics_tuple(client_id)
+
+    def simulate_branches(self, client_ids, snapshots, steps):
+        if len(set(client_ids)) != len(client_ids):
+            raise ValueError("client_ids must not repeat.")
+        if not (len(client_ids) == len(snapshots) == len(steps)):
+            raise ValueError("client_ids, snapshots and steps must be the same length.")
+        for client_id in client_ids:
+            self.client(client_id)
+        return [
+            self.simulate_actions(client_id, snapshot, branch)
+            for client_id, snapshot, branch in zip(client_ids, snapshots, steps)
+        ]
+
+    def kinematics_tuple(self, client_id):
+        state = self.clients[client_id]
+        return (
+            tuple(state.position),
+            tuple(state.velocity),
+            tuple(state.viewangles),
+            state.ground_entity != ENTITYNUM_NONE,
+            state.ground_entity,
+        )
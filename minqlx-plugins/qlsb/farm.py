@@ -0,0 +1,377 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Spreads solver rollouts over several processes.
+
+The coordinator (the server doing the solve) PUSHes jobs to any number of
+workers and PULLs their results back, zmq load balances the jobs between
+connected workers. A worker is either another qlds running bot_test with
+qlx_solverFarmWorker 1, or a SimFarmWorker running the offline simulator
+(python3 -m qlsb.farm, see main()).
+
+Snapshots from snapshot_player() contain pointers that are only valid in
+the process that made them, so states go over the wire as snapshot headers
+(see snapshot.pack_header) and workers teleport to them.
+
+Job:    [json {"id", "steps", "frames", "haste", "floor"}, header]
+Result: [json {"id", "position", "velocity"}, header]
+
+The floor is the height of the flat floor the coordinator's own simulator
+uses (World.from_point of the route start), SimFarmWorkers run on it. It
+is null when the coordinator doesn't know, qlds workers ignore it.
+
+    python3 -m qlsb.farm [--jobs address] [--results address]
+    python3 -m qlsb.farm --check [count]
+
+--check sends count random jobs through a coordinator and a
+SimFarmWorker in this process and compares the results with running the
+same jobs locally, it exits with 1 if any differ. It runs them twice, the
+second time with the jobs submitted before the worker connects.
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+
+import zmq
+
+# jobs that haven't come back by then are sent again,
+# e.g. the worker that had them was restarted.
+JOB_TIMEOUT = 5.0  # seconds
+
+
+class FarmCoordinator:
+    """Sends rollouts to workers, one job is a state and a list of
+    (action, turn_rate, allow_jump) steps that are each run for frames.
+
+    Every job carries a context that is handed back with its result,
+    results for jobs dropped with cancel() are ignored.
+    """
+
+    def __init__(self, jobs_address, results_address, context=None):
+        self.context = context or zmq.Context.instance()
+        self.jobs = self.context.socket(zmq.PUSH)
+        self.jobs.bind(jobs_address)
+        self.results = self.context.socket(zmq.PULL)
+        self.results.bind(results_address)
+        self.next_id = 0
+        # id -> [context, job frames, send time or None while unsent]
+        self.pending = {}
+        self.sent = 0
+        self.received = 0
+        self.resent = 0
+
+    def submit(self, context, state, steps, frames, haste=False, floor=None):
+        self.next_id += 1
+        meta = json.dumps(
+            {
+                "id": self.next_id,
+                "steps": [[int(s[0]), float(s[1]), bool(s[2])] for s in steps],
+                "frames": frames,
+                "haste": haste,
+                "floor": floor,
+            }
+        ).encode()
+        job = [meta, state]
+        self.pending[self.next_id] = [context, job, None]
+        self._send(self.pending[self.next_id])
+        return self.next_id
+
+    def _send(self, pending):
+        """Send a pending job without blocking, returns False if no worker
+        could take it. It stays unsent and poll() tries it again.
+        """
+        # a PUSH socket without connected workers would block the server frame
+        try:
+            self.jobs.send_multipart(pending[1], zmq.NOBLOCK, copy=False)
+        except zmq.Again:
+            pending[2] = None
+            return False
+        pending[2] = time.time()
+        self.sent += 1
+        return True
+
+    def poll(self):
+        """Collect every result that has arrived without blocking,
+        returns a list of (context, state, position, velocity).
+        """
+        done = []
+        while True:
+            try:
+                meta, state = self.results.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            meta = json.loads(meta.decode())
+            job = self.pending.pop(meta["id"], None)
+            if job is None:
+                # cancelled or a duplicate of a resent job
+                continue
+            self.received += 1
+            done.append((job[0], state, meta["position"], meta["velocity"]))
+
+        now = time.time()
+        for job in self.pending.values():
+            if job[2] is None:
+                if not self._send(job):
+                    # still no worker, the rest would fail too
+                    break
+            elif now - job[2] > JOB_TIMEOUT:
+                if not self._send(job):
+                    break
+                self.resent += 1
+        return done
+
+    def cancel(self):
+        self.pending = {}
+
+    def close(self):
+        self.jobs.close(linger=0)
+        self.results.close(linger=0)
+
+
+class FarmWorker:
+    """Receives jobs and sends back results, subclasses implement run_job()."""
+
+    def __init__(self, jobs_address, results_address, context=None):
+        self.context = context or zmq.Context.instance()
+        self.jobs = self.context.socket(zmq.PULL)
+        # don't let one worker hoard the queue
+        self.jobs.setsockopt(zmq.RCVHWM, 1)
+        self.jobs.connect(jobs_address)
+        self.results = self.context.socket(zmq.PUSH)
+        self.results.connect(results_address)
+        self.done = 0
+
+    def run_job(self, state, steps, frames, haste, floor):
+        """Run steps from the state header, returns (header, position, velocity)."""
+        raise NotImplementedError()
+
+    def poll(self, timeout=0, max_time=None):
+        """Run jobs until none are waiting or max_time seconds have passed,
+        returns how many were run.
+        """
+        start_time = time.time()
+        count = 0
+        while self.jobs.poll(timeout * 1000) != 0:
+            meta, state = self.jobs.recv_multipart()
+            meta = json.loads(meta.decode())
+            state, position, velocity = self.run_job(
+                state, meta["steps"], meta["frames"], meta["haste"], meta.get("floor")
+            )
+            reply = {
+                "id": meta["id"],
+                "position": list(position),
+                "velocity": list(velocity),
+            }
+            self.results.send_multipart([json.dumps(reply).encode(), state])
+            count += 1
+            self.done += 1
+            # only wait for the first one
+            timeout = 0
+            if max_time is not None and time.time() - start_time >= max_time:
+                break
+        return count
+
+    def serve_forever(self):
+        while True:
+            self.poll(1.0)
+
+    def close(self):
+        self.jobs.close(linger=0)
+        self.results.close(linger=0)
+
+
+class SimFarmWorker(FarmWorker):
+    """Worker running jobs on the offline simulator. The simulator's world
+    is only used for jobs that don't carry a floor.
+    """
+
+    def __init__(self, simulator, jobs_address, results_address, context=None):
+        super().__init__(jobs_address, results_address, context)
+        self.simulator = simulator
+        self.default_world = simulator.pmove.world
+        self.floor = None
+
+    def run_job(self, state, steps, frames, haste, floor):
+        # imported here so the coordinator doesn't need the simulator
+        from .pmove import SimState, World
+
+        if floor != self.floor:
+            self.floor = floor
+            if floor is None:
+                self.simulator.pmove.world = self.default_world
+            else:
+                self.simulator.pmove.world = World.flat(floor)
+        ps = SimState.from_header(state, haste)
+        for step in steps:
+            action = [step[0], step[1], 0, step[2]]
+            self.simulator.rollout(ps, action, frames)
+        return ps.to_header(), ps.position, ps.velocity
+
+
+def random_job(rng):
+    """A (header, steps, frames, haste, floor) job from a random grounded
+    state, standing on a floor at a random height.
+    """
+    from .pmove import SimState, World, ENTITYNUM_WORLD
+    from .route import Point
+    from .search import candidate_actions
+
+    start = Point("start")
+    start.position = [rng.uniform(-2000, 2000), rng.uniform(-2000, 2000)]
+    start.position.append(rng.uniform(-500, 500))
+    speed = rng.uniform(0, 800)
+    yaw = rng.uniform(-180, 180)
+    ps = SimState(
+        start.position,
+        [speed * math.cos(math.radians(yaw)), speed * math.sin(math.radians(yaw)), 0],
+        [0, rng.uniform(-180, 180), 0],
+        ENTITYNUM_WORLD,
+    )
+    actions = candidate_actions()
+    steps = []
+    for i in range(rng.randint(1, 3)):
+        action = rng.choice(actions)
+        steps.append((int(action[0]), float(action[1]), rng.random() < 0.8))
+    haste = rng.random() < 0.3
+    return ps.to_header(), steps, rng.randint(5, 25), haste, World.floor_under(start)
+
+
+def check_round_trip(count, race_mode=0, seed=0, late_worker=False):
+    """Run count random jobs through a FarmCoordinator and a SimFarmWorker
+    in this process and locally, returns the indices of the jobs that differ.
+
+    With late_worker the jobs are submitted before the worker connects, they
+    have to stay pending without blocking and go out once it does.
+    """
+    from .pmove import Simulator, SimState, World, get_params
+
+    rng = random.Random(seed)
+    context = zmq.Context()
+    coordinator = FarmCoordinator("inproc://jobs", "inproc://results", context)
+    # a send that blocks raises instead of hanging the check
+    coordinator.jobs.setsockopt(zmq.SNDTIMEO, 1000)
+
+    def connect_worker():
+        # the jobs are on other floors, so a worker that ignores theirs fails
+        return SimFarmWorker(
+            Simulator(World.flat(0.0), get_params(race_mode)),
+            "inproc://jobs",
+            "inproc://results",
+            context,
+        )
+
+    worker = None if late_worker else connect_worker()
+    expected = []
+    for i in range(count):
+        state, steps, frames, haste, floor = random_job(rng)
+        coordinator.submit(i, state, steps, frames, haste, floor)
+        simulator = Simulator(World.flat(floor), get_params(race_mode))
+        ps = SimState.from_header(state, haste)
+        for step in steps:
+            simulator.rollout(ps, [step[0], step[1], 0, step[2]], frames)
+        expected.append(ps)
+
+    failed = []
+    if worker is None:
+        coordinator.poll()
+        # nothing could be sent yet
+        failed.extend(
+            job[0] for job in coordinator.pending.values() if job[2] is not None
+        )
+        worker = connect_worker()
+    received = 0
+    deadline = time.time() + JOB_TIMEOUT
+    while received < count and time.time() < deadline:
+        worker.poll()
+        for i, state, position, velocity in coordinator.poll():
+            received += 1
+            ps = expected[i]
+            if (
+                state != ps.to_header()
+                or position != ps.position
+                or velocity != ps.velocity
+            ):
+                failed.append(i)
+    failed.extend(job[0] for job in coordinator.pending.values())
+    worker.close()
+    coordinator.close()
+    context.term()
+    return failed
+
+
+def main():
+    from .pmove import Simulator, World, get_params
+
+    parser = argparse.ArgumentParser(description="qlsb solver farm worker")
+    parser.add_argument("--jobs", default="tcp://127.0.0.1:27970")
+    parser.add_argument("--results", default="tcp://127.0.0.1:27971")
+    parser.add_argument(
+        "--floor", type=float, default=0.0, help="floor height of jobs without one"
+    )
+    parser.add_argument("--race-mode", type=int, default=0, help="qlx_raceMode")
+    parser.add_argument(
+        "--check",
+        type=int,
+        nargs="?",
+        const=200,
+        metavar="COUNT",
+        help="round trip random jobs in this process instead of serving",
+    )
+    args = parser.parse_args()
+
+    if args.check is not None:
+        ok = True
+        for late_worker in (False, True):
+            failed = check_round_trip(
+                args.check, args.race_mode, late_worker=late_worker
+            )
+            case = "worker connected late" if late_worker else "worker connected"
+            if len(failed) > 0:
+                ok = False
+                print(
+                    "{}: {} of {} jobs differ, e.g. job {}".format(
+                        case, len(failed), args.check, failed[0]
+                    )
+                )
+            else:
+                print("{}: {} jobs match".format(case, args.check))
+        if not ok:
+            sys.exit(1)
+        return
+
+    world = World.flat(args.floor)
+    worker = SimFarmWorker(
+        Simulator(world, get_params(args.race_mode)), args.jobs, args.results
+    )
+    print("worker connected to {} {}".format(args.jobs, args.results))
+    try:
+        worker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("ran {} jobs".format(worker.done))
+        worker.close()
+
+
+if __name__ == "__main__":
+    main()
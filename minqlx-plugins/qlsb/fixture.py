@@ -0,0 +1,117 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Recorded rollout responses.
+
+A fixture maps (start state, action, frames) to the state the rollout
+ended in, all states as snapshot headers. Recorded from a solve on the
+server it stands in for the engine when the solver runs offline,
+see qlsb.benchmark.
+
+    header     magic, version, route name, response count
+    root       header of the state the solve started from
+    response   start header, action, turn rate, allow jump, frames, end header
+"""
+
+import struct
+
+from .controller import Controller
+from .snapshot import HEADER_SIZE
+
+FIXTURE_MAGIC = b"QLSF"
+FIXTURE_VERSION = 1
+FIXTURE_SUFFIX = ".fixture"
+
+# magic, version, route name, response count
+_HEADER = struct.Struct("<4sH32sI")
+# action, turn rate, allow jump, frames
+_STEP = struct.Struct("<bdbH")
+_RESPONSE_SIZE = HEADER_SIZE + _STEP.size + HEADER_SIZE
+
+
+class Fixture:
+    def __init__(self, route_name="", root=None):
+        self.route_name = route_name
+        self.root = root
+        # (start header, step, frames) -> end header
+        self.responses = {}
+
+    def __len__(self):
+        return len(self.responses)
+
+    @staticmethod
+    def key(start, action, frames):
+        return bytes(start[:HEADER_SIZE]), Controller.get_step(action), frames
+
+    def record(self, start, action, frames, end):
+        self.responses[Fixture.key(start, action, frames)] = bytes(end[:HEADER_SIZE])
+
+    def response(self, start, action, frames):
+        """End header of the recorded rollout, None if it wasn't recorded."""
+        return self.responses.get(Fixture.key(start, action, frames))
+
+    def save(self, path):
+        if self.root is None:
+            raise ValueError("fixture has no root state")
+        data = [
+            _HEADER.pack(
+                FIXTURE_MAGIC,
+                FIXTURE_VERSION,
+                self.route_name.encode()[:32],
+                len(self.responses),
+            ),
+            bytes(self.root[:HEADER_SIZE]),
+        ]
+        for (start, step, frames), end in self.responses.items():
+            data.append(start)
+            data.append(_STEP.pack(step[0], step[1], 1 if step[2] else 0, frames))
+            data.append(end)
+        with open(path, mode="wb") as file:
+            file.write(b"".join(data))
+
+    @staticmethod
+    def load(path):
+        with open(path, mode="rb") as file:
+            data = file.read()
+
+        if len(data) < _HEADER.size + HEADER_SIZE:
+            raise ValueError("{} is too short for a fixture".format(path))
+        magic, version, route_name, count = _HEADER.unpack_from(data, 0)
+        if magic != FIXTURE_MAGIC or version != FIXTURE_VERSION:
+            raise ValueError(
+                "{} is not a version {} fixture".format(path, FIXTURE_VERSION)
+            )
+        size = _HEADER.size + HEADER_SIZE + count * _RESPONSE_SIZE
+        if len(data) != size:
+            raise ValueError("{} is {} bytes, expected {}".format(path, len(data), size))
+
+        offset = _HEADER.size
+        fixture = Fixture(
+            route_name.rstrip(b"\0").decode(), data[offset : offset + HEADER_SIZE]
+        )
+        offset += HEADER_SIZE
+        for i in range(count):
+            start = data[offset : offset + HEADER_SIZE]
+            offset += HEADER_SIZE
+            action, turn_rate, allow_jump, frames = _STEP.unpack_from(data, offset)
+            offset += _STEP.size
+            fixture.responses[
+                (start, (action, turn_rate, allow_jump != 0), frames)
+            ] = data[offset : offset + HEADER_SIZE]
+            offset += HEADER_SIZE
+        return fixture
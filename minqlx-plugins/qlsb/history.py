@@ -0,0 +1,312 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Solver history stored as columns.
+
+One array per field instead of a list per frame keeps a long run compact,
+makes append and truncate O(1) (columns are preallocated and only the
+length moves) and lets a whole column be handed to numpy with
+np.frombuffer(history.column("pos_x"), dtype=np.float32).
+
+Save files are a header followed by every column back to back, each
+aligned to 8 bytes, so load(use_mmap=True) can map a file without copying.
+
+Snapshots are process local and are not saved. A snapshot is ~1.5 KB, so
+only the last frame and every SNAPSHOT_INTERVAL-th frame keep theirs,
+other frames are rebuilt by replaying actions from the checkpoint before
+them (see StrafeBot.rewind).
+"""
+
+import mmap
+import struct
+from array import array
+
+from .controller import Actions
+
+HISTORY_MAGIC = b"QLSH"
+HISTORY_VERSION = 2
+
+# magic, version, frame count
+_FILE_HEADER = struct.Struct("<4sII")
+
+# qlds is x86 only, columns are written in native (little endian) order
+COLUMNS = (
+    ("action", "b"),
+    ("allow_jump", "b"),
+    ("turn_rate", "d"),
+    ("reward", "f"),
+    ("pos_x", "f"),
+    ("pos_y", "f"),
+    ("pos_z", "f"),
+    ("vel_x", "f"),
+    ("vel_y", "f"),
+    ("vel_z", "f"),
+    ("yaw", "f"),
+    ("ground_entity", "i"),
+    ("jump_time", "i"),
+    ("double_jumped", "b"),
+    # frames the action runs for on the first frame of a solver segment, 0 elsewhere
+    ("duration", "H"),
+)
+
+HISTORY_CAPACITY = 1024
+
+# frames between the snapshots kept as rewind checkpoints
+SNAPSHOT_INTERVAL = 125
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class History:
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.length = 0
+        self.capacity = 0
+        self.columns = {}
+        for name, typecode in COLUMNS:
+            self.columns[name] = array(typecode)
+        # frame -> snapshot, the last frame and checkpoints only
+        self.snapshots = {}
+        self.mapped = None
+        self._grow(max(1, capacity))
+
+    def __len__(self):
+        return self.length
+
+    def _grow(self, capacity):
+        for name, typecode in COLUMNS:
+            column = self.columns[name]
+            column.frombytes(bytes((capacity - self.capacity) * column.itemsize))
+        self.capacity = capacity
+
+    def _index(self, i):
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError("history index out of range")
+        return i
+
+    def _writable(self):
+        # mapped columns are read only memoryviews, copy them on first write
+        if self.mapped is None:
+            return
+        for name, typecode in COLUMNS:
+            column = array(typecode)
+            column.frombytes(self.columns[name][: self.length].tobytes())
+            self.columns[name] = column
+        self.capacity = self.length
+        # unmapped once the last view is gone
+        self.mapped = None
+
+    def append(
+        self,
+        action,
+        position,
+        velocity,
+        viewangles,
+        ground_entity,
+        jump_time,
+        double_jumped,
+        snapshot=None,
+        duration=0,
+    ):
+        self._writable()
+        if self.length == self.capacity:
+            self._grow(max(1, self.capacity * 2))
+        i = self.length
+        self.length += 1
+        c = self.columns
+        c["pos_x"][i] = position[0]
+        c["pos_y"][i] = position[1]
+        c["pos_z"][i] = position[2]
+        c["vel_x"][i] = velocity[0]
+        c["vel_y"][i] = velocity[1]
+        c["vel_z"][i] = velocity[2]
+        c["yaw"][i] = viewangles[1]
+        c["ground_entity"][i] = ground_entity
+        c["jump_time"][i] = jump_time
+        c["double_jumped"][i] = double_jumped
+        if snapshot is not None:
+            self.snapshots[i] = snapshot
+        else:
+            self.snapshots.pop(i, None)
+        # the previous frame is no longer the last one
+        if i > 0 and (i - 1) % SNAPSHOT_INTERVAL != 0:
+            self.snapshots.pop(i - 1, None)
+        self.set_action(i, action, duration)
+
+    def truncate(self, length):
+        """Drop every frame from length on."""
+        length = max(0, min(length, self.length))
+        for i in [i for i in self.snapshots if i >= length]:
+            del self.snapshots[i]
+        self.length = length
+
+    def clear(self):
+        self.truncate(0)
+
+    def action(self, i):
+        """The action run from frame i, in the list form Controller takes."""
+        i = self._index(i)
+        c = self.columns
+        act = [Actions(c["action"][i]), c["turn_rate"][i], c["reward"][i]]
+        if c["allow_jump"][i] == 0:
+            act.append(False)
+        return act
+
+    def set_action(self, i, action, duration=0):
+        self._writable()
+        i = self._index(i)
+        c = self.columns
+        c["duration"][i] = duration
+        c["action"][i] = int(action[0])
+        c["turn_rate"][i] = action[1] if len(action) > 1 else 0.0
+        c["reward"][i] = action[2] if len(action) > 2 else 0.0
+        c["allow_jump"][i] = 0 if len(action) >= 4 and action[3] == False else 1
+
+    def position(self, i):
+        i = self._index(i)
+        c = self.columns
+        return (c["pos_x"][i], c["pos_y"][i], c["pos_z"][i])
+
+    def velocity(self, i):
+        i = self._index(i)
+        c = self.columns
+        return (c["vel_x"][i], c["vel_y"][i], c["vel_z"][i])
+
+    def yaw(self, i):
+        return self.columns["yaw"][self._index(i)]
+
+    def viewangles(self, i):
+        # the bot never pitches or rolls
+        return (0.0, self.yaw(i), 0.0)
+
+    def ground_entity(self, i):
+        return self.columns["ground_entity"][self._index(i)]
+
+    def jump_time(self, i):
+        return self.columns["jump_time"][self._index(i)]
+
+    def double_jumped(self, i):
+        return self.columns["double_jumped"][self._index(i)]
+
+    def duration(self, i):
+        return self.columns["duration"][self._index(i)]
+
+    def segments(self):
+        """(start frame, duration) of every solver segment."""
+        durations = self.columns["duration"]
+        return [(i, durations[i]) for i in range(self.length) if durations[i] > 0]
+
+    def snapshot(self, i):
+        """Snapshot of frame i, None unless it's the last frame or a checkpoint."""
+        return self.snapshots.get(self._index(i))
+
+    def set_snapshot(self, i, snapshot):
+        """Keep snapshot for frame i if it's the last frame or a checkpoint."""
+        i = self._index(i)
+        if i % SNAPSHOT_INTERVAL == 0 or i == self.length - 1:
+            self.snapshots[i] = snapshot
+
+    def checkpoint(self, i):
+        """(frame, snapshot) of the closest snapshot at or before frame i,
+        (frame i, None) if the checkpoint before it has none.
+        """
+        i = self._index(i)
+        for j in range(i, i - i % SNAPSHOT_INTERVAL - 1, -1):
+            snapshot = self.snapshots.get(j)
+            if snapshot is not None:
+                return j, snapshot
+        return i, None
+
+    def kinematics(self, i):
+        """(position, velocity, viewangles, ground_entity, jump_time, double_jumped),
+        the same tuple snapshot.read_header returns.
+        """
+        return (
+            self.position(i),
+            self.velocity(i),
+            self.viewangles(i),
+            self.ground_entity(i),
+            self.jump_time(i),
+            self.double_jumped(i),
+        )
+
+    def column(self, name):
+        """Memoryview of the used part of a column."""
+        return memoryview(self.columns[name])[: self.length]
+
+    def save(self, path):
+        with open(path, mode="wb") as file:
+            file.write(_FILE_HEADER.pack(HISTORY_MAGIC, HISTORY_VERSION, self.length))
+            offset = _FILE_HEADER.size
+            for name, typecode in COLUMNS:
+                padding = _align(offset) - offset
+                file.write(bytes(padding))
+                data = self.column(name).tobytes()
+                file.write(data)
+                offset += padding + len(data)
+
+    @staticmethod
+    def load(path, use_mmap=False):
+        """Load a saved history, with use_mmap the columns stay in the
+        mapped file until the history is modified.
+        """
+        with open(path, mode="rb") as file:
+            if use_mmap:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = file.read()
+
+        if len(data) < _FILE_HEADER.size:
+            raise ValueError("{} is too short for a history file".format(path))
+        magic, version, length = _FILE_HEADER.unpack_from(data, 0)
+        if magic != HISTORY_MAGIC or version != HISTORY_VERSION:
+            raise ValueError(
+                "{} is not a version {} history file".format(path, HISTORY_VERSION)
+            )
+        size = _FILE_HEADER.size
+        for name, typecode in COLUMNS:
+            size = _align(size) + length * array(typecode).itemsize
+        if len(data) < size:
+            raise ValueError(
+                "{} is truncated, {} frames need {} bytes, the file has {}".format(
+                    path, length, size, len(data)
+                )
+            )
+
+        history = History(length)
+        view = memoryview(data)
+        offset = _FILE_HEADER.size
+        for name, typecode in COLUMNS:
+            offset = _align(offset)
+            size = length * history.columns[name].itemsize
+            if use_mmap:
+                history.columns[name] = view[offset : offset + size].cast(typecode)
+            else:
+                history.columns[name] = array(typecode)
+                history.columns[name].frombytes(view[offset : offset + size])
+            offset += size
+        history.length = length
+        history.capacity = length
+        history.snapshots = {}
+        if use_mmap:
+            history.mapped = data
+        return history
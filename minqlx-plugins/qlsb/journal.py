@@ -0,0 +1,189 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Append-only solver journal.
+
+Every committed solver segment is written as a record and fsynced, so a
+crash, map change or plugin reload loses at most the segment being
+written. A record replaces the history from its first frame on, which
+covers solve_frame_advance rewriting the action of the last frame.
+
+    header  magic, version, haste, route name length, route name
+    record  payload length, crc32, first frame, rows...
+
+Reading stops at the first torn or corrupt record.
+"""
+
+import os
+import struct
+import zlib
+
+from .history import History
+
+JOURNAL_MAGIC = b"QLSJ"
+JOURNAL_VERSION = 2
+JOURNAL_SUFFIX = ".journal"
+
+# magic, version, haste, route name length, then the utf-8 route name
+_HEADER = struct.Struct("<4sHHH")
+# version 1 had the route name cut to 32 bytes instead
+_HEADER_V1 = struct.Struct("<4sHH32s")
+# payload length, crc32 of the payload
+_RECORD = struct.Struct("<II")
+# first frame
+_FIRST = struct.Struct("<I")
+# action, allow_jump, turn_rate, reward, duration,
+# position, velocity, yaw, ground_entity, jump_time, double_jumped
+_ROW = struct.Struct("<bbdfH7f2ib")
+
+
+def _pack_record(history, first):
+    rows = [_FIRST.pack(first)]
+    for i in range(first, len(history)):
+        action = history.action(i)
+        position, velocity, viewangles, ground_entity, jump_time, double_jumped = (
+            history.kinematics(i)
+        )
+        rows.append(
+            _ROW.pack(
+                int(action[0]),
+                0 if len(action) >= 4 and action[3] == False else 1,
+                action[1],
+                action[2],
+                history.duration(i),
+                position[0],
+                position[1],
+                position[2],
+                velocity[0],
+                velocity[1],
+                velocity[2],
+                viewangles[1],
+                ground_entity,
+                jump_time,
+                double_jumped,
+            )
+        )
+    payload = b"".join(rows)
+    return _RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class Journal:
+    def __init__(self, path, file):
+        self.path = path
+        self.file = file
+        self.records = 0
+
+    @staticmethod
+    def create(path, route_name, haste, history, overwrite=False):
+        """Start a new journal holding the whole history.
+
+        An existing journal could still be resumed, so it is only replaced
+        with overwrite, otherwise this raises FileExistsError.
+        """
+        name = route_name.encode()
+        file = open(path, mode="wb" if overwrite else "xb")
+        file.write(
+            _HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, 1 if haste else 0, len(name))
+            + name
+        )
+        journal = Journal(path, file)
+        journal.append(history, 0)
+        return journal
+
+    @staticmethod
+    def open_append(path, end):
+        """Continue a journal after its last valid record, end is the
+        offset read_journal returned.
+        """
+        file = open(path, mode="r+b")
+        # drop a torn record
+        file.truncate(end)
+        file.seek(end)
+        return Journal(path, file)
+
+    def append(self, history, first):
+        """Write frames first.. of history and wait for them to hit the disk."""
+        self.file.write(_pack_record(history, first))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.records += 1
+
+    def close(self):
+        self.file.close()
+
+
+def read_journal(path):
+    """Rebuild the history from a journal in one read.
+
+    Returns (route name, haste, history, end offset of the last valid record).
+    """
+    with open(path, mode="rb") as file:
+        data = file.read()
+
+    if len(data) < _HEADER.size:
+        raise ValueError("{} is too short for a journal".format(path))
+    magic, version, haste, name_length = _HEADER.unpack_from(data, 0)
+    if magic == JOURNAL_MAGIC and version == 1 and len(data) >= _HEADER_V1.size:
+        route_name = _HEADER_V1.unpack_from(data, 0)[3].rstrip(b"\0")
+        offset = _HEADER_V1.size
+    elif magic == JOURNAL_MAGIC and version == JOURNAL_VERSION:
+        offset = _HEADER.size + name_length
+        if len(data) < offset:
+            raise ValueError("{} is too short for a journal".format(path))
+        route_name = data[_HEADER.size : offset]
+    else:
+        raise ValueError(
+            "{} is not a version {} journal".format(path, JOURNAL_VERSION)
+        )
+
+    history = History()
+    while offset + _RECORD.size <= len(data):
+        length, crc = _RECORD.unpack_from(data, offset)
+        start = offset + _RECORD.size
+        payload = data[start : start + length]
+        if (
+            len(payload) != length
+            or length < _FIRST.size
+            or (length - _FIRST.size) % _ROW.size != 0
+            or zlib.crc32(payload) != crc
+        ):
+            print("{}: ignoring torn record at {}".format(path, offset))
+            break
+        (first,) = _FIRST.unpack_from(payload, 0)
+        if first > len(history):
+            print("{}: record at {} skips frames".format(path, offset))
+            break
+        history.truncate(first)
+        for row in _ROW.iter_unpack(payload[_FIRST.size :]):
+            action = [row[0], row[2], row[3]]
+            if row[1] == 0:
+                action.append(False)
+            history.append(
+                action,
+                row[5:8],
+                row[8:11],
+                (0.0, row[11], 0.0),
+                row[12],
+                row[13],
+                row[14],
+                duration=row[4],
+            )
+        offset = start + length
+
+    return route_name.decode(), haste != 0, history, offset
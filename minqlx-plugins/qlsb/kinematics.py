@@ -0,0 +1,82 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The part of the player state read every frame, from minqlx.player_kinematics.
+
+player_state builds a struct sequence of every field, weapons and powerups
+included, which is most of the cost of a bot frame. player_kinematics
+fills a flat buffer of doubles instead; Kinematics reads it back under the
+names player_state uses, so the controller and drift check take either.
+"""
+
+from array import array
+
+# origin, velocity, viewangles, delta_angles, grounded, ground_entity, jump_time, double_jumped
+KINEMATICS_SIZE = 16
+
+
+class Kinematics:
+    """A reusable buffer for minqlx.player_kinematics.
+    The values change on every fill, copy them to keep them.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        if values is None:
+            values = array("d", [0.0]) * KINEMATICS_SIZE
+        elif len(values) < KINEMATICS_SIZE:
+            raise ValueError(
+                "Expected {} kinematics values, got {}.".format(
+                    KINEMATICS_SIZE, len(values)
+                )
+            )
+        self.values = values
+
+    @property
+    def position(self):
+        return self.values[0:3]
+
+    @property
+    def velocity(self):
+        return self.values[3:6]
+
+    @property
+    def viewangles(self):
+        return self.values[6:9]
+
+    @property
+    def delta_angles(self):
+        return self.values[9:12]
+
+    @property
+    def grounded(self):
+        return self.values[12] != 0
+
+    @property
+    def ground_entity(self):
+        return int(self.values[13])
+
+    @property
+    def jump_time(self):
+        return int(self.values[14])
+
+    @property
+    def double_jumped(self):
+        return int(self.values[15])
@@ -0,0 +1,155 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+import math
+
+
+class MathHelper:
+    @staticmethod
+    def wrap_yaw(yaw):
+        while yaw > 180.0:
+            yaw -= 360.0
+        while yaw < -180.0:
+            yaw += 360.0
+        return yaw
+
+    @staticmethod
+    def rad_to_deg(a):
+        return a * 180.0 / math.pi
+
+    @staticmethod
+    def deg_to_rad(a):
+        return a * math.pi / 180.0
+
+    @staticmethod
+    def get_yaw(vec):
+        # acos of the normalized x, without building the normalized vector
+        x = vec[0]
+        rad = math.acos(x / math.sqrt(x * x + vec[1] * vec[1] + vec[2] * vec[2]))
+        deg = 180.0 * rad / math.pi  # 0-180
+        if vec[1] < 0:
+            return -deg
+        return deg
+
+    @staticmethod
+    def yaw_diff(a, b):
+        d = (a + 180) - (b + 180)
+        while d > 180:
+            d -= 360
+        while d < -180:
+            d += 360
+        return d
+
+    @staticmethod
+    def get_forward(yaw):
+        rad = yaw * math.pi * 2.0 / 360.0
+        a = math.sin(rad)
+        b = math.cos(rad)
+        return [b, a, 0]
+
+    @staticmethod
+    def sign(x):
+        if x < 0:
+            return -1.0
+        elif x > 0:
+            return 1.0
+        return 0.0
+
+    @staticmethod
+    def vec2_angle_sign(v, w):
+        return MathHelper.sign(v[0] * w[1] - v[1] * w[0])
+
+    @staticmethod
+    def vec_dot(v, w, i):
+        dot = 0.0
+        for i in range(i):
+            dot += v[i] * w[i]
+        return dot
+
+    @staticmethod
+    def vec2_len(v):
+        return math.sqrt(v[0] * v[0] + v[1] * v[1])
+
+    @staticmethod
+    def vec3_len(v):
+        return math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+
+    @staticmethod
+    def vec3_norm(v):
+        a = [v[0], v[1], v[2]]
+        len = MathHelper.vec3_len(a)
+        a[0] /= len
+        a[1] /= len
+        a[2] /= len
+        return a
+
+    @staticmethod
+    def vec3_add(v, w):
+        return [v[0] + w[0], v[1] + w[1], v[2] + w[2]]
+
+    @staticmethod
+    def vec3_sub(v, w):
+        return [v[0] - w[0], v[1] - w[1], v[2] - w[2]]
+
+    @staticmethod
+    def vec3_scale(v, a):
+        return [v[0] * a, v[1] * a, v[2] * a]
+
+    @staticmethod
+    def vec3_dist(v, w):
+        return MathHelper.vec3_len([v[0] - w[0], v[1] - w[1], v[2] - w[2]])
+
+    @staticmethod
+    def clamp(a, b, c):
+        return min(c, max(a, b))
+
+    @staticmethod
+    def get_optimal_strafe_angle(wishspeed, accel, velocity, frametime):
+        # speed = accel * wishspeed * frametime
+        # num = wishspeed - speed
+        num = wishspeed * (1.0 - accel * frametime)
+        vel_len = MathHelper.vec2_len(velocity)
+        if num >= vel_len:
+            return 0
+        return math.acos(num / vel_len)
+
+    @staticmethod
+    def line_closest_point(start, end, pos):
+        norm = MathHelper.vec3_norm(MathHelper.vec3_sub(end, start))
+        to_pos = MathHelper.vec3_sub(pos, start)
+        frac = MathHelper.vec_dot(to_pos, norm, 3)
+        return MathHelper.vec3_add(start, MathHelper.vec3_scale(norm, frac))
+
+    @staticmethod
+    def line_closest_point_clamped(start, end, pos):
+        closest = MathHelper.line_closest_point(start, end, pos)
+
+        # closest is a point projected onto the line
+        # and can be outside the line segment, clamp.
+        line_dot = MathHelper.vec_dot(start, end, 3)
+        closest_dot = MathHelper.vec_dot(closest, end, 3)
+
+        if line_dot * closest_dot > 0:
+            # same direction
+            if MathHelper.vec3_dist(start, end) < MathHelper.vec3_dist(closest, end):
+                closest = start
+        else:
+            # opposite
+            if MathHelper.vec3_dist(start, end) < MathHelper.vec3_dist(closest, start):
+                closest = end
+
+        return closest
@@ -0,0 +1,499 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Whole-run trajectory optimizer.
+
+The solvers commit one segment at a time by its reward, so they can't take
+a worse segment now for a faster run later. This optimizes the whole run
+at once on the offline simulator: the run is the list of
+[action, turn rate, allow jump, duration] segments of a Solution, and the
+cross-entropy method searches around it for the fewest frames to the end
+of the route.
+
+Each generation samples a population from per-segment distributions, a
+normal one for the turn rate and the duration and a categorical one for
+the action. The candidates run in a process pool, and the best fraction
+refits the distributions. Runs are cut off at the best time found so far,
+and the ones cut off rank by the route distance they had left.
+
+The seed is the greedy solve: a solution (!savesolution) or journal file,
+or a greedy solve of the route by StrafeBot on the simulator (see
+qlsb.benchmark). The best run kept is never slower than the seed. The
+result is written as a solution for !loadsolution.
+
+Runs are only scored on the simulator's world, an infinite flat floor
+under the route start. A run that is faster there can hit a wall, miss a
+ramp or fall through a gap on the real map, so --output is refused for
+routes whose points aren't all on (or above) that floor. Before the best
+run is written it is played back from the solution the way the server
+does, with simulate_actions on a qlsb.engine.Engine, and compared with
+its keyframes like the drift report of !play. A run that drifts or
+misses the end isn't written. On the server, !loadsolution and !play
+still have to show no divergences.
+
+    python3 -m qlsb.optimize route [--seed file] [--processes n]
+        [--evaluations n] [--population n] [--output file]
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from .benchmark import BotSolve, BENCHMARK_MAX_FRAMES
+from .controller import Actions, TURN_SPEED_INTERVAL, TURN_SPEED_MAX
+from .drift import DriftCheck
+from .engine import Engine
+from .journal import read_journal, JOURNAL_SUFFIX
+from .mathhelper import MathHelper
+from .pmove import Simulator, SimState, World, get_params, ENTITYNUM_NONE
+from .route import RouteIndex, load_route, route_path, ROUTE_SUFFIX
+from .snapshot import read_header
+from .solution import (
+    Solution,
+    MAX_SEGMENT_FRAMES,
+    SOLUTION_KEYFRAME_INTERVAL,
+    SOLUTION_SUFFIX,
+)
+
+# whole-run simulations, the CPU budget
+OPTIMIZE_EVALUATIONS = 2000
+OPTIMIZE_POPULATION = 32
+# candidates the distributions are refit to
+OPTIMIZE_ELITE_FRACTION = 0.25
+# weight of the elites against the old distribution when refitting
+OPTIMIZE_SMOOTHING = 0.7
+# initial spread around the seed, and the floor it can shrink to
+OPTIMIZE_RATE_SIGMA = float(TURN_SPEED_INTERVAL)  # deg/s
+OPTIMIZE_MIN_RATE_SIGMA = 1.0
+OPTIMIZE_DURATION_SIGMA = 2.0  # frames
+OPTIMIZE_MIN_DURATION_SIGMA = 0.5
+# probability of sampling any action but the seed's
+OPTIMIZE_ACTION_NOISE = 0.02
+# route points on a floor further than this from the one under the start
+# make the route non-flat
+FLAT_ROUTE_TOLERANCE = 1.0  # units
+
+# actions the solvers pick from, see search.candidate_actions
+_ACTIONS = [Actions.LEFT_DIAG, Actions.RIGHT_DIAG, Actions.LEFT, Actions.RIGHT]
+
+
+class RunEvaluator:
+    """Runs whole candidate runs on the simulator."""
+
+    def __init__(self, simulator, route, start):
+        self.simulator = simulator
+        self.route = route
+        self.start = start
+        self.index = RouteIndex(route.points())
+        # route distance from point i to the end
+        self.remaining = [0.0] * len(self.index.points)
+        for i in range(len(self.remaining) - 2, -1, -1):
+            self.remaining[i] = self.remaining[i + 1] + self.index.line_len[i + 1]
+
+    def run(self, segments, max_frames, keyframe_interval=0):
+        """Run segments from the start, the last one is held until the end or
+        max_frames. Returns (frames to the end or None, route distance left,
+        keyframes as (frame, header) every keyframe_interval frames).
+        """
+        ps = self.start.copy()
+        end = self.route.end.position
+        end_dist = self.route.end_dist
+        keyframes = []
+        frame = 0
+        for n in range(len(segments)):
+            act, turn_rate, allow_jump, duration = segments[n]
+            action = [act, turn_rate, -math.inf]
+            if allow_jump == 0:
+                action.append(False)
+            if n == len(segments) - 1:
+                duration = max_frames - frame
+            for i in range(duration):
+                if frame >= max_frames:
+                    break
+                if keyframe_interval > 0 and frame % keyframe_interval == 0:
+                    keyframes.append((frame, ps.to_header()))
+                self.simulator.run_action(ps, action)
+                frame += 1
+                if MathHelper.vec3_dist(ps.position, end) < end_dist:
+                    return frame, 0.0, keyframes
+        i = self.index.next_point(*ps.position)
+        left = MathHelper.vec3_dist(ps.position, self.index.points[i].position)
+        return None, left + self.remaining[i], keyframes
+
+    def key(self, segments, max_frames):
+        """Sort key, lower is better: (frames, 0) for runs that reach the
+        end, (max_frames + 1, distance left) for runs cut off.
+        """
+        frames, left = self.run(segments, max_frames)[:2]
+        if frames is None:
+            return (max_frames + 1, left)
+        return (frames, 0.0)
+
+
+# the evaluator of a pool process
+_evaluator = None
+
+
+def _init_worker(route, race_mode, start):
+    global _evaluator
+    _evaluator = make_evaluator(route, race_mode, start)
+
+
+def _evaluate(job):
+    return _evaluator.key(job[0], job[1])
+
+
+def make_evaluator(route, race_mode, start):
+    simulator = Simulator(
+        World.from_point(route.start), get_params(race_mode), route.haste
+    )
+    return RunEvaluator(simulator, route, start)
+
+
+class CrossEntropyOptimizer:
+    """Per-segment sampling distributions around the seed run."""
+
+    def __init__(
+        self,
+        seed,
+        rng,
+        population=OPTIMIZE_POPULATION,
+        elite_fraction=OPTIMIZE_ELITE_FRACTION,
+        smoothing=OPTIMIZE_SMOOTHING,
+    ):
+        self.rng = rng
+        self.population = max(2, population)
+        self.elites = max(1, int(self.population * elite_fraction))
+        self.smoothing = smoothing
+        self.allow_jump = [s[2] for s in seed]
+        self.rate_mean = [float(s[1]) for s in seed]
+        self.rate_sigma = [OPTIMIZE_RATE_SIGMA] * len(seed)
+        self.duration_mean = [float(s[3]) for s in seed]
+        self.duration_sigma = [OPTIMIZE_DURATION_SIGMA] * len(seed)
+        self.action_p = []
+        for s in seed:
+            p = [OPTIMIZE_ACTION_NOISE / (len(_ACTIONS) - 1)] * len(_ACTIONS)
+            if s[0] in _ACTIONS:
+                p[_ACTIONS.index(s[0])] = 1.0 - OPTIMIZE_ACTION_NOISE
+            else:
+                p = [1.0 / len(_ACTIONS)] * len(_ACTIONS)
+            self.action_p.append(p)
+
+    def sample(self):
+        rng = self.rng
+        segments = []
+        for i in range(len(self.rate_mean)):
+            act = _ACTIONS[self._choose(self.action_p[i])]
+            turn_rate = rng.gauss(self.rate_mean[i], self.rate_sigma[i])
+            turn_rate = MathHelper.clamp(0.0, turn_rate, float(TURN_SPEED_MAX))
+            duration = rng.gauss(self.duration_mean[i], self.duration_sigma[i])
+            duration = int(MathHelper.clamp(1, round(duration), MAX_SEGMENT_FRAMES))
+            segments.append([int(act), turn_rate, self.allow_jump[i], duration])
+        return segments
+
+    def _choose(self, p):
+        x = self.rng.random()
+        for i in range(len(p) - 1):
+            x -= p[i]
+            if x < 0:
+                return i
+        return len(p) - 1
+
+    def update(self, ranked):
+        """Refit to the elites of a generation sorted best first."""
+        elites = ranked[: self.elites]
+        a = self.smoothing
+        for i in range(len(self.rate_mean)):
+            rates = [e[i][1] for e in elites]
+            durations = [e[i][3] for e in elites]
+            mean, sigma = _fit(rates)
+            self.rate_mean[i] = (1.0 - a) * self.rate_mean[i] + a * mean
+            self.rate_sigma[i] = max(
+                OPTIMIZE_MIN_RATE_SIGMA, (1.0 - a) * self.rate_sigma[i] + a * sigma
+            )
+            mean, sigma = _fit(durations)
+            self.duration_mean[i] = (1.0 - a) * self.duration_mean[i] + a * mean
+            self.duration_sigma[i] = max(
+                OPTIMIZE_MIN_DURATION_SIGMA,
+                (1.0 - a) * self.duration_sigma[i] + a * sigma,
+            )
+            p = self.action_p[i]
+            for j in range(len(_ACTIONS)):
+                freq = sum(1 for e in elites if e[i][0] == _ACTIONS[j]) / len(elites)
+                p[j] = (1.0 - a) * p[j] + a * freq
+            # keep every action possible
+            floor = OPTIMIZE_ACTION_NOISE / (len(_ACTIONS) * 4)
+            total = sum(max(floor, x) for x in p)
+            for j in range(len(_ACTIONS)):
+                p[j] = max(floor, p[j]) / total
+
+
+def _fit(values):
+    mean = sum(values) / len(values)
+    variance = sum((v - mean) * (v - mean) for v in values) / len(values)
+    return mean, math.sqrt(variance)
+
+
+def optimize(
+    seed,
+    evaluate,
+    evaluations=OPTIMIZE_EVALUATIONS,
+    max_frames=BENCHMARK_MAX_FRAMES,
+    rng=None,
+    population=OPTIMIZE_POPULATION,
+):
+    """Cross-entropy search from the seed segments.
+
+    evaluate(jobs) takes a list of (segments, max_frames) and returns their
+    keys (see RunEvaluator.key) in order. Returns
+    (best segments, best key, seed key, evaluations run, generations).
+    """
+    optimizer = CrossEntropyOptimizer(seed, rng or random.Random(1), population)
+    seed_key = evaluate([(seed, max_frames)])[0]
+    best = seed
+    best_key = seed_key
+    done = 1
+    generations = 0
+    while done < evaluations:
+        # runs slower than the best can't win, cut them off there
+        cutoff = best_key[0] if best_key[1] == 0.0 else max_frames
+        candidates = [
+            optimizer.sample()
+            for i in range(min(optimizer.population, evaluations - done))
+        ]
+        keys = evaluate([(c, cutoff) for c in candidates])
+        done += len(candidates)
+        generations += 1
+        ranked = sorted(zip(keys, range(len(candidates))))
+        if ranked[0][0] < best_key:
+            best_key = ranked[0][0]
+            best = candidates[ranked[0][1]]
+        optimizer.update([candidates[r[1]] for r in ranked])
+    return best, best_key, seed_key, done, generations
+
+
+def is_flat(route):
+    """Whether every route point stands on the floor under the start, the
+    only floor the simulator has, or is in the air above it.
+    """
+    floor = World.floor_under(route.start)
+    for point in route.points():
+        height = World.floor_under(point)
+        if point.ground_ent == ENTITYNUM_NONE:
+            if height < floor - FLAT_ROUTE_TOLERANCE:
+                return False
+        elif abs(height - floor) > FLAT_ROUTE_TOLERANCE:
+            return False
+    return True
+
+
+def verify_solution(solution, route, race_mode):
+    """Play solution back with simulate_actions on an Engine, the minqlx
+    calls of the server on the simulator, and compare it with its keyframes.
+    Returns (DriftCheck of the keyframes, whether the last frame is at the end).
+    """
+    engine = Engine()
+    engine.reset(
+        Simulator(World.from_point(route.start), get_params(race_mode), route.haste)
+    )
+    client_id = engine.bot_add()
+    steps = []
+    for act, turn_rate, allow_jump, duration in solution.segments:
+        steps.extend([(act, turn_rate, allow_jump)] * duration)
+    # the state after every frame
+    kinematics = engine.simulate_actions(
+        client_id, solution.keyframes[0][1], steps, all_steps=True
+    )
+    drift = DriftCheck(None)
+    for frame, header in solution.keyframes[1:]:
+        position, velocity = read_header(header)[:2]
+        state = kinematics[frame - 1]
+        drift.compare(frame, state[0], state[1], position, velocity)
+    end = kinematics[-1][0]
+    reached = MathHelper.vec3_dist(end, route.end.position) < route.end_dist
+    return drift, reached
+
+
+def trim_segments(segments, frames):
+    """The segments as they ran for frames frames, the last one cut or held."""
+    trimmed = []
+    total = 0
+    for s in segments:
+        if total >= frames:
+            break
+        trimmed.append(list(s))
+        total += s[3]
+    trimmed[-1][3] += frames - total
+    while trimmed[-1][3] > MAX_SEGMENT_FRAMES:
+        trimmed.insert(-1, trimmed[-1][:3] + [MAX_SEGMENT_FRAMES])
+        trimmed[-1][3] -= MAX_SEGMENT_FRAMES
+    return trimmed
+
+
+def load_seed(args, route, name):
+    """Returns (segments, start state) of the greedy run to start from."""
+    if args.seed is not None and args.seed.endswith(SOLUTION_SUFFIX):
+        solution = Solution.load(args.seed)
+        start = SimState.from_header(solution.keyframes[0][1], route.haste)
+        return [list(s) for s in solution.segments], start
+    if args.seed is not None and args.seed.endswith(JOURNAL_SUFFIX):
+        history = read_journal(args.seed)[2]
+        if len(history) == 0:
+            raise ValueError("{} has no history".format(args.seed))
+        solution = Solution.from_history(history, name, route.haste, 0)
+        return solution.segments, SimState.from_history(history, 0, route.haste)
+    if args.seed is not None:
+        raise ValueError(
+            "--seed takes a {} or {} file".format(SOLUTION_SUFFIX, JOURNAL_SUFFIX)
+        )
+    with open(os.devnull, mode="w") as devnull, contextlib.redirect_stdout(devnull):
+        solve = BotSolve(name, route, race_mode=args.race_mode)
+        if solve.run(args.max_frames) is None:
+            raise ValueError("the greedy solver didn't reach the end")
+    return solve.segments(), SimState.from_history(solve.bot.history, 0, route.haste)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qlsb whole-run optimizer")
+    parser.add_argument("route", help="route name or file")
+    parser.add_argument("--directory", default="qlsb_data", help="route directory")
+    parser.add_argument(
+        "--seed", help="solution or journal to start from, a greedy solve by default"
+    )
+    parser.add_argument("--race-mode", type=int, default=0, help="qlx_raceMode")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--evaluations", type=int, default=OPTIMIZE_EVALUATIONS, help="CPU budget"
+    )
+    parser.add_argument("--population", type=int, default=OPTIMIZE_POPULATION)
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--max-frames", type=int, default=BENCHMARK_MAX_FRAMES)
+    parser.add_argument(
+        "--keyframe-interval", type=int, default=SOLUTION_KEYFRAME_INTERVAL
+    )
+    parser.add_argument(
+        "--output",
+        help="solution file to write the best run to, flat routes only",
+    )
+    args = parser.parse_args()
+
+    if args.route.endswith(ROUTE_SUFFIX) or os.path.isfile(args.route):
+        name = os.path.basename(args.route)
+        if name.endswith(ROUTE_SUFFIX):
+            name = name[: -len(ROUTE_SUFFIX)]
+        route = load_route(args.route)
+    else:
+        name = args.route
+        route = load_route(route_path(name, args.directory))
+
+    if args.output is not None and not is_flat(route):
+        parser.error(
+            "{} isn't flat, runs are only scored on a flat floor at z {:.3f} "
+            "and --output would write an unchecked solution".format(
+                name, World.floor_under(route.start)
+            )
+        )
+
+    try:
+        seed, start = load_seed(args, route, name)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    evaluator = make_evaluator(route, args.race_mode, start)
+    pool = None
+    if args.processes > 1:
+        pool = multiprocessing.Pool(
+            args.processes, _init_worker, (route, args.race_mode, start)
+        )
+        evaluate = lambda jobs: pool.map(
+            _evaluate, jobs, max(1, len(jobs) // args.processes)
+        )
+    else:
+        evaluate = lambda jobs: [evaluator.key(job[0], job[1]) for job in jobs]
+
+    started = time.perf_counter()
+    try:
+        best, best_key, seed_key, evaluations, generations = optimize(
+            seed,
+            evaluate,
+            args.evaluations,
+            args.max_frames,
+            rng=random.Random(args.random_seed),
+            population=args.population,
+        )
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - started
+
+    reached = best_key[1] == 0.0
+    result = {
+        "route": name,
+        "seed_frames": seed_key[0] if seed_key[1] == 0.0 else None,
+        "best_frames": best_key[0] if reached else None,
+        "segments": len(best),
+        "evaluations": evaluations,
+        "generations": generations,
+        "processes": args.processes,
+        "elapsed": elapsed,
+        "evaluations_per_sec": evaluations / elapsed if elapsed > 0 else 0.0,
+        # scored without the map, see the module docstring
+        "flat_floor": World.floor_under(route.start),
+    }
+    print(
+        "{}: {} -> {} frames, {} evaluations in {:.1f} s".format(
+            name, result["seed_frames"], result["best_frames"], evaluations, elapsed
+        ),
+        file=sys.stderr,
+    )
+
+    if args.output is not None and reached:
+        frames, left, keyframes = evaluator.run(
+            best, best_key[0], args.keyframe_interval
+        )
+        solution = Solution(name, route.haste, args.keyframe_interval)
+        solution.segments = trim_segments(best, frames)
+        solution.keyframes = keyframes
+        drift, end_reached = verify_solution(solution, route, args.race_mode)
+        result["verified"] = end_reached and len(drift.divergences) == 0
+        print("{}: playback {}".format(args.output, drift.report()), file=sys.stderr)
+        if result["verified"]:
+            solution.save(args.output)
+        else:
+            print(
+                "{}: not written, the playback {}".format(
+                    args.output,
+                    "drifts from the run" if end_reached else "doesn't reach the end",
+                ),
+                file=sys.stderr,
+            )
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    if result.get("verified") is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
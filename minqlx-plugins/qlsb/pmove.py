@@ -0,0 +1,921 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Offline player movement simulator.
+
+A Python port of the parts of bg_pmove.c the strafe bot relies on
+(walkmove, airmove, friction, acceleration, jumping, stepping and sliding),
+run against a simple world made of axis-aligned brushes. It lets the solver
+score actions without running G_RunFrame on the live server.
+
+Only the movement code is simulated: no water, no ducking, no movers,
+no jump pads or triggers. Map geometry isn't supported either, the world
+is a list of axis-aligned boxes and the solver only gives it a flat floor
+under the route start (World.from_point). Slopes, stairs, ramps and walls
+of the real map aren't there, rollouts that touch them diverge from the
+engine and have to run on it.
+
+"python3 -m qlsb.pmove" checks the simulator against histories recorded
+on the engine, frame by frame and over SIM_DRIFT_FRAMES frames run
+without the recorded states in between.
+"""
+
+import argparse
+import math
+import sys
+
+from .controller import (
+    Controller,
+    MAX_GROUND_SPEED,
+    GROUND_ACCEL,
+    AIR_ACCEL,
+    WISHMOVE_SPEED,
+    INPUT_FRAME_INTERVAL,
+)
+from .mathhelper import MathHelper
+from .snapshot import read_header, pack_header
+
+PLAYER_MINS = (-15.0, -15.0, -24.0)
+PLAYER_MAXS = (15.0, 15.0, 32.0)
+
+ENTITYNUM_NONE = 1023
+ENTITYNUM_WORLD = 1022
+
+FRAME_MSEC = 8
+STEPSIZE = 18.0
+OVERCLIP = 1.001
+MIN_WALK_NORMAL = 0.7
+MAX_CLIP_PLANES = 5
+SURFACE_CLIP_EPSILON = 0.125
+HASTE_FACTOR = 1.3
+
+# Largest per-frame error we accept between the simulator and the engine
+# when stepping from recorded states, see Simulator.compare_history.
+SIM_POSITION_TOLERANCE = 1.0  # units
+SIM_VELOCITY_TOLERANCE = 2.0  # ups
+# Largest error we accept after SIM_DRIFT_FRAMES frames run from one recorded
+# state, the way a rollout runs, see Simulator.compare_drift.
+SIM_DRIFT_FRAMES = INPUT_FRAME_INTERVAL
+SIM_DRIFT_POSITION_TOLERANCE = 4.0  # units
+SIM_DRIFT_VELOCITY_TOLERANCE = 4.0  # ups
+
+
+class PhysicsParams:
+    """Movement constants for one physics mode."""
+
+    def __init__(
+        self,
+        name,
+        jump_velocity,
+        chain_jump_velocity=0.0,
+        chain_jump_time=0,
+        ramp_jump=False,
+        air_control=0.0,
+        air_stop_accelerate=AIR_ACCEL,
+        strafe_accelerate=AIR_ACCEL,
+        strafe_wishspeed=MAX_GROUND_SPEED,
+    ):
+        self.name = name
+        self.speed = MAX_GROUND_SPEED
+        self.gravity = 800.0
+        self.accelerate = GROUND_ACCEL
+        self.air_accelerate = AIR_ACCEL
+        self.friction = 6.0
+        self.stop_speed = 100.0
+        self.jump_velocity = jump_velocity
+        self.chain_jump_velocity = chain_jump_velocity
+        self.chain_jump_time = chain_jump_time  # ms
+        self.ramp_jump = ramp_jump
+        self.air_control = air_control
+        self.air_stop_accelerate = air_stop_accelerate
+        self.strafe_accelerate = strafe_accelerate
+        self.strafe_wishspeed = strafe_wishspeed
+        self.snap_velocity = True
+
+
+# Turbo
+PQL = PhysicsParams(
+    "pql",
+    jump_velocity=275.0,
+    chain_jump_velocity=100.0,
+    chain_jump_time=400,
+    ramp_jump=True,
+    air_control=150.0,
+    air_stop_accelerate=2.5,
+    strafe_accelerate=70.0,
+    strafe_wishspeed=30.0,
+)
+
+# Classic
+VQL = PhysicsParams("vql", jump_velocity=270.0)
+
+
+def get_params(race_mode):
+    """Physics for a qlx_raceMode value (0 = Turbo/PQL, 2 = Classic/VQL)."""
+    return VQL if int(race_mode) == 2 else PQL
+
+
+class Trace:
+    __slots__ = ("fraction", "endpos", "normal", "allsolid", "startsolid", "entity_num")
+
+    def __init__(self):
+        self.fraction = 1.0
+        self.endpos = None
+        self.normal = None
+        self.allsolid = False
+        self.startsolid = False
+        self.entity_num = ENTITYNUM_NONE
+
+
+class World:
+    """Collision world made of solid axis-aligned brushes."""
+
+    def __init__(self, brushes=None):
+        # [(mins, maxs), ...]
+        self.brushes = []
+        for mins, maxs in brushes or []:
+            self.add_brush(mins, maxs)
+
+    @staticmethod
+    def flat(floor_z):
+        """An infinite floor with its top surface at floor_z."""
+        return World([((-1e6, -1e6, floor_z - 64.0), (1e6, 1e6, floor_z))])
+
+    @staticmethod
+    def floor_under(point):
+        """Height of the floor a player standing at a route point is on."""
+        return point.position[2] + PLAYER_MINS[2] - SURFACE_CLIP_EPSILON
+
+    @staticmethod
+    def from_point(point):
+        """An infinite floor under a route point, e.g. MapConfig.start_point."""
+        return World.flat(World.floor_under(point))
+
+    def add_brush(self, mins, maxs):
+        self.brushes.append((tuple(mins), tuple(maxs)))
+
+    def trace(self, start, end, mins=PLAYER_MINS, maxs=PLAYER_MAXS):
+        """Sweep a box from start to end, see CM_TraceThroughBrush."""
+        tr = Trace()
+        for bmins, bmaxs in self.brushes:
+            # brush planes expanded by the box, as (axis, sign, dist)
+            planes = (
+                (0, 1.0, bmaxs[0] - mins[0]),
+                (0, -1.0, -(bmins[0] - maxs[0])),
+                (1, 1.0, bmaxs[1] - mins[1]),
+                (1, -1.0, -(bmins[1] - maxs[1])),
+                (2, 1.0, bmaxs[2] - mins[2]),
+                (2, -1.0, -(bmins[2] - maxs[2])),
+            )
+            enter_frac = -1.0
+            leave_frac = 1.0
+            clip_normal = None
+            getout = False
+            startout = False
+            outside = False
+            for axis, sign, dist in planes:
+                d1 = sign * start[axis] - dist
+                d2 = sign * end[axis] - dist
+                if d2 > 0:
+                    getout = True
+                if d1 > 0:
+                    startout = True
+                # completely in front of face, no intersection with the entire brush
+                if d1 > 0 and (d2 >= SURFACE_CLIP_EPSILON or d2 >= d1):
+                    outside = True
+                    break
+                # completely behind this plane
+                if d1 <= 0 and d2 <= 0:
+                    continue
+                if d1 > d2:
+                    # enter
+                    f = (d1 - SURFACE_CLIP_EPSILON) / (d1 - d2)
+                    if f < 0:
+                        f = 0.0
+                    if f > enter_frac:
+                        enter_frac = f
+                        clip_normal = (axis, sign)
+                else:
+                    # leave
+                    f = (d1 + SURFACE_CLIP_EPSILON) / (d1 - d2)
+                    if f > 1:
+                        f = 1.0
+                    if f < leave_frac:
+                        leave_frac = f
+            if outside:
+                continue
+            if not startout:
+                tr.startsolid = True
+                if not getout:
+                    tr.allsolid = True
+                    tr.fraction = 0.0
+                    tr.entity_num = ENTITYNUM_WORLD
+                continue
+            if enter_frac < leave_frac and enter_frac > -1 and enter_frac < tr.fraction:
+                tr.fraction = max(enter_frac, 0.0)
+                normal = [0.0, 0.0, 0.0]
+                normal[clip_normal[0]] = clip_normal[1]
+                tr.normal = normal
+                tr.entity_num = ENTITYNUM_WORLD
+
+        tr.endpos = [
+            start[0] + tr.fraction * (end[0] - start[0]),
+            start[1] + tr.fraction * (end[1] - start[1]),
+            start[2] + tr.fraction * (end[2] - start[2]),
+        ]
+        return tr
+
+
+class SimState:
+    """The subset of playerState_t the simulator needs.
+
+    Attribute names match minqlx.PlayerState, so Controller and
+    MapConfig can take either.
+    """
+
+    __slots__ = (
+        "position",
+        "velocity",
+        "viewangles",
+        "delta_angles",
+        "ground_entity",
+        "jump_time",
+        "double_jumped",
+        "command_time",
+        "haste",
+    )
+
+    def __init__(
+        self,
+        position=(0, 0, 0),
+        velocity=(0, 0, 0),
+        viewangles=(0, 0, 0),
+        ground_entity=ENTITYNUM_NONE,
+        jump_time=0,
+        double_jumped=0,
+        haste=False,
+    ):
+        self.position = [float(position[0]), float(position[1]), float(position[2])]
+        self.velocity = [float(velocity[0]), float(velocity[1]), float(velocity[2])]
+        self.viewangles = [
+            float(viewangles[0]),
+            float(viewangles[1]),
+            float(viewangles[2]),
+        ]
+        self.delta_angles = [0.0, 0.0, 0.0]
+        self.ground_entity = ground_entity
+        self.jump_time = jump_time
+        self.double_jumped = double_jumped
+        self.command_time = 0
+        self.haste = haste
+
+    @property
+    def grounded(self):
+        return self.ground_entity != ENTITYNUM_NONE
+
+    @staticmethod
+    def from_history(history, i, haste=False):
+        """Build a state from frame i of a History."""
+        return SimState(*history.kinematics(i), haste=haste)
+
+    @staticmethod
+    def from_header(blob, haste=False):
+        """Build a state from a snapshot_player() blob or header."""
+        return SimState(*read_header(blob), haste=haste)
+
+    def to_header(self):
+        return pack_header(
+            self.position,
+            self.velocity,
+            self.viewangles,
+            self.ground_entity,
+            self.jump_time,
+            self.double_jumped,
+        )
+
+    def copy(self):
+        s = SimState(
+            self.position,
+            self.velocity,
+            self.viewangles,
+            self.ground_entity,
+            self.jump_time,
+            self.double_jumped,
+            self.haste,
+        )
+        s.delta_angles = self.delta_angles[:]
+        s.command_time = self.command_time
+        return s
+
+
+def _clip_velocity(v, normal, overbounce=OVERCLIP):
+    backoff = v[0] * normal[0] + v[1] * normal[1] + v[2] * normal[2]
+    if backoff < 0:
+        backoff *= overbounce
+    else:
+        backoff /= overbounce
+    return [
+        v[0] - normal[0] * backoff,
+        v[1] - normal[1] * backoff,
+        v[2] - normal[2] * backoff,
+    ]
+
+
+def _normalize(v):
+    length = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+    if length == 0:
+        return [0.0, 0.0, 0.0], 0.0
+    return [v[0] / length, v[1] / length, v[2] / length], length
+
+
+def _cross(v, w):
+    return [
+        v[1] * w[2] - v[2] * w[1],
+        v[2] * w[0] - v[0] * w[2],
+        v[0] * w[1] - v[1] * w[0],
+    ]
+
+
+def _angle2short(a):
+    return int(a * 65536.0 / 360.0) & 65535
+
+
+def _short2angle(s):
+    return s * (360.0 / 65536.0)
+
+
+class _Locals:
+    """pml_t"""
+
+    __slots__ = ("forward", "right", "walking", "ground_plane", "ground_normal")
+
+    def __init__(self):
+        self.forward = None
+        self.right = None
+        self.walking = False
+        self.ground_plane = False
+        self.ground_normal = None
+
+
+class Pmove:
+    """Runs usercmds against a SimState, one 8 ms frame at a time."""
+
+    def __init__(self, world, params=PQL):
+        self.world = world
+        self.params = params
+        self.frametime = FRAME_MSEC * 0.001
+
+    def think(self, ps, cmd):
+        """Run one frame, cmd is the same dict minqlx.client_think takes."""
+        pml = _Locals()
+        ps.command_time += FRAME_MSEC
+
+        self._update_view_angles(ps, cmd)
+        yaw = MathHelper.deg_to_rad(ps.viewangles[1])
+        pml.forward = [math.cos(yaw), math.sin(yaw), 0.0]
+        pml.right = [math.sin(yaw), -math.cos(yaw), 0.0]
+
+        self._ground_trace(ps, pml)
+        self._drop_timers(ps)
+
+        if pml.walking:
+            self._walk_move(ps, pml, cmd)
+        else:
+            self._air_move(ps, pml, cmd)
+
+        self._ground_trace(ps, pml)
+
+        if self.params.snap_velocity:
+            v = ps.velocity
+            ps.velocity = [float(int(v[0])), float(int(v[1])), float(int(v[2]))]
+
+    def _update_view_angles(self, ps, cmd):
+        for i, key in enumerate(("pitch", "yaw", "roll")):
+            temp = _angle2short(cmd[key]) + _angle2short(ps.delta_angles[i])
+            ps.viewangles[i] = MathHelper.wrap_yaw(_short2angle(temp & 65535))
+
+    def _speed(self, ps):
+        return self.params.speed * (HASTE_FACTOR if ps.haste else 1.0)
+
+    def _cmd_scale(self, ps, cmd):
+        fmove = abs(cmd["forwardmove"])
+        smove = abs(cmd["rightmove"])
+        umove = abs(cmd["upmove"])
+        maxmove = max(fmove, smove, umove)
+        if maxmove == 0:
+            return 0.0
+        total = math.sqrt(fmove * fmove + smove * smove + umove * umove)
+        return self._speed(ps) * maxmove / (float(WISHMOVE_SPEED) * total)
+
+    def _drop_timers(self, ps):
+        if ps.jump_time > 0:
+            ps.jump_time = max(ps.jump_time - FRAME_MSEC, 0)
+
+    def _ground_trace(self, ps, pml):
+        point = [ps.position[0], ps.position[1], ps.position[2] - 0.25]
+        tr = self.world.trace(ps.position, point)
+
+        # no solid ground or stuck in solid
+        if tr.fraction == 1.0 or tr.allsolid:
+            ps.ground_entity = ENTITYNUM_NONE
+            pml.ground_plane = False
+            pml.walking = False
+            return
+
+        # check if getting thrown off the ground
+        if ps.velocity[2] > 0 and MathHelper.vec_dot(ps.velocity, tr.normal, 3) > 10:
+            ps.ground_entity = ENTITYNUM_NONE
+            pml.ground_plane = False
+            pml.walking = False
+            return
+
+        pml.ground_normal = tr.normal
+        pml.ground_plane = True
+
+        # slopes that are too steep will not be considered onground
+        if tr.normal[2] < MIN_WALK_NORMAL:
+            ps.ground_entity = ENTITYNUM_NONE
+            pml.walking = False
+            return
+
+        pml.walking = True
+        ps.ground_entity = tr.entity_num
+
+    def _friction(self, ps, pml):
+        vel = ps.velocity
+        if pml.walking:
+            speed = math.sqrt(vel[0] * vel[0] + vel[1] * vel[1])
+        else:
+            speed = math.sqrt(vel[0] * vel[0] + vel[1] * vel[1] + vel[2] * vel[2])
+        if speed < 1:
+            vel[0] = 0.0
+            vel[1] = 0.0
+            return
+
+        drop = 0.0
+        if pml.walking:
+            control = speed if speed > self.params.stop_speed else self.params.stop_speed
+            drop += control * self.params.friction * self.frametime
+
+        newspeed = speed - drop
+        if newspeed < 0:
+            newspeed = 0.0
+        newspeed /= speed
+        vel[0] *= newspeed
+        vel[1] *= newspeed
+        vel[2] *= newspeed
+
+    def _accelerate(self, ps, wishdir, wishspeed, accel):
+        vel = ps.velocity
+        currentspeed = vel[0] * wishdir[0] + vel[1] * wishdir[1] + vel[2] * wishdir[2]
+        addspeed = wishspeed - currentspeed
+        if addspeed <= 0:
+            return
+        accelspeed = accel * self.frametime * wishspeed
+        if accelspeed > addspeed:
+            accelspeed = addspeed
+        vel[0] += accelspeed * wishdir[0]
+        vel[1] += accelspeed * wishdir[1]
+        vel[2] += accelspeed * wishdir[2]
+
+    def _air_control(self, ps, cmd, wishdir, wishspeed):
+        # only when moving straight forward or back
+        if cmd["rightmove"] != 0 or wishspeed == 0.0 or cmd["forwardmove"] == 0:
+            return
+        vel = ps.velocity
+        zspeed = vel[2]
+        flat, speed = _normalize([vel[0], vel[1], 0.0])
+        dot = flat[0] * wishdir[0] + flat[1] * wishdir[1]
+        k = 32.0 * self.params.air_control * dot * dot * self.frametime
+        if dot > 0:
+            flat = [
+                flat[0] * speed + wishdir[0] * k,
+                flat[1] * speed + wishdir[1] * k,
+                0.0,
+            ]
+            flat, _ = _normalize(flat)
+        vel[0] = flat[0] * speed
+        vel[1] = flat[1] * speed
+        vel[2] = zspeed
+
+    def _check_jump(self, ps, pml, cmd):
+        # autohop, holding jump is enough
+        if cmd["upmove"] < 10:
+            return False
+
+        pml.ground_plane = False
+        pml.walking = False
+        ps.ground_entity = ENTITYNUM_NONE
+
+        jump_velocity = self.params.jump_velocity
+        if self.params.ramp_jump and ps.velocity[2] > 0:
+            ps.velocity[2] += jump_velocity
+        else:
+            ps.velocity[2] = jump_velocity
+
+        if self.params.chain_jump_time > 0:
+            if ps.jump_time > 0 and not ps.double_jumped:
+                ps.velocity[2] += self.params.chain_jump_velocity
+                ps.double_jumped = 1
+            else:
+                ps.double_jumped = 0
+            ps.jump_time = self.params.chain_jump_time
+        return True
+
+    def _wish(self, ps, cmd, forward, right):
+        fmove = cmd["forwardmove"]
+        smove = cmd["rightmove"]
+        wishvel = [
+            forward[0] * fmove + right[0] * smove,
+            forward[1] * fmove + right[1] * smove,
+            forward[2] * fmove + right[2] * smove,
+        ]
+        wishdir, wishspeed = _normalize(wishvel)
+        return wishdir, wishspeed * self._cmd_scale(ps, cmd)
+
+    def _air_move(self, ps, pml, cmd):
+        self._friction(ps, pml)
+
+        wishdir, wishspeed = self._wish(ps, cmd, pml.forward, pml.right)
+        wishdir[2] = 0.0
+        wishdir, _ = _normalize(wishdir)
+
+        params = self.params
+        accel = params.air_accelerate
+        accel_wishspeed = wishspeed
+        if params.air_control > 0:
+            if MathHelper.vec_dot(ps.velocity, wishdir, 3) < 0:
+                accel = params.air_stop_accelerate
+            # pure sidestep strafing
+            if cmd["forwardmove"] == 0 and cmd["rightmove"] != 0:
+                if accel_wishspeed > params.strafe_wishspeed:
+                    accel_wishspeed = params.strafe_wishspeed
+                accel = params.strafe_accelerate
+
+        self._accelerate(ps, wishdir, accel_wishspeed, accel)
+        if params.air_control > 0:
+            self._air_control(ps, cmd, wishdir, wishspeed)
+
+        # we may have a ground plane that is very steep, even
+        # though we don't have a groundentity
+        # slide along the steep plane
+        if pml.ground_plane:
+            ps.velocity = _clip_velocity(ps.velocity, pml.ground_normal)
+
+        self._step_slide_move(ps, pml, True)
+
+    def _walk_move(self, ps, pml, cmd):
+        if self._check_jump(ps, pml, cmd):
+            self._air_move(ps, pml, cmd)
+            return
+
+        self._friction(ps, pml)
+
+        # project the movement onto the ground plane
+        forward, _ = _normalize(_clip_velocity(pml.forward, pml.ground_normal))
+        right, _ = _normalize(_clip_velocity(pml.right, pml.ground_normal))
+        wishdir, wishspeed = self._wish(ps, cmd, forward, right)
+
+        self._accelerate(ps, wishdir, wishspeed, self.params.accelerate)
+
+        vel = math.sqrt(MathHelper.vec_dot(ps.velocity, ps.velocity, 3))
+
+        # slide along the ground plane
+        ps.velocity = _clip_velocity(ps.velocity, pml.ground_normal)
+
+        # don't decrease velocity when going up or down a slope
+        direction, _ = _normalize(ps.velocity)
+        ps.velocity = [direction[0] * vel, direction[1] * vel, direction[2] * vel]
+
+        # don't do anything if standing still
+        if ps.velocity[0] == 0 and ps.velocity[1] == 0:
+            return
+
+        self._step_slide_move(ps, pml, False)
+
+    def _slide_move(self, ps, pml, gravity):
+        numbumps = 4
+        end_velocity = None
+        if gravity:
+            end_velocity = ps.velocity[:]
+            end_velocity[2] -= self.params.gravity * self.frametime
+            ps.velocity[2] = (ps.velocity[2] + end_velocity[2]) * 0.5
+            if pml.ground_plane:
+                # slide along the ground plane
+                end_velocity = _clip_velocity(end_velocity, pml.ground_normal)
+
+        time_left = self.frametime
+        planes = []
+        # never turn against the ground plane
+        if pml.ground_plane:
+            planes.append(pml.ground_normal)
+        # never turn against original velocity
+        planes.append(_normalize(ps.velocity)[0])
+
+        bumpcount = 0
+        while bumpcount < numbumps:
+            end = [
+                ps.position[0] + time_left * ps.velocity[0],
+                ps.position[1] + time_left * ps.velocity[1],
+                ps.position[2] + time_left * ps.velocity[2],
+            ]
+            tr = self.world.trace(ps.position, end)
+
+            if tr.allsolid:
+                # entity is completely trapped in another solid
+                ps.velocity[2] = 0.0
+                return True
+
+            if tr.fraction > 0:
+                ps.position = tr.endpos
+
+            if tr.fraction == 1:
+                break
+
+            time_left -= time_left * tr.fraction
+
+            if len(planes) >= MAX_CLIP_PLANES:
+                ps.velocity = [0.0, 0.0, 0.0]
+                return True
+
+            # if this is the same plane we hit before, nudge velocity
+            # out along it, which fixes some epsilon issues with
+            # non-axial planes
+            nudged = False
+            for plane in planes:
+                if MathHelper.vec_dot(tr.normal, plane, 3) > 0.99:
+                    ps.velocity = MathHelper.vec3_add(tr.normal, ps.velocity)
+                    nudged = True
+                    break
+            if nudged:
+                bumpcount += 1
+                continue
+
+            planes.append(tr.normal)
+
+            # modify velocity so it parallels all of the clip planes
+            for i in range(len(planes)):
+                if MathHelper.vec_dot(ps.velocity, planes[i], 3) >= 0.1:
+                    # move doesn't interact with the plane
+                    continue
+
+                clip = _clip_velocity(ps.velocity, planes[i])
+                end_clip = None
+                if gravity:
+                    end_clip = _clip_velocity(end_velocity, planes[i])
+
+                # see if there is a second plane that the new move enters
+                stopped = False
+                for j in range(len(planes)):
+                    if j == i:
+                        continue
+                    if MathHelper.vec_dot(clip, planes[j], 3) >= 0.1:
+                        continue
+
+                    # try clipping the move to the plane
+                    clip = _clip_velocity(clip, planes[j])
+                    if gravity:
+                        end_clip = _clip_velocity(end_clip, planes[j])
+
+                    # see if it goes back into the first clip plane
+                    if MathHelper.vec_dot(clip, planes[i], 3) >= 0:
+                        continue
+
+                    # slide the original velocity along the crease
+                    direction, _ = _normalize(_cross(planes[i], planes[j]))
+                    d = MathHelper.vec_dot(direction, ps.velocity, 3)
+                    clip = MathHelper.vec3_scale(direction, d)
+                    if gravity:
+                        d = MathHelper.vec_dot(direction, end_velocity, 3)
+                        end_clip = MathHelper.vec3_scale(direction, d)
+
+                    # see if there is a third plane the the new move enters
+                    for k in range(len(planes)):
+                        if k == i or k == j:
+                            continue
+                        if MathHelper.vec_dot(clip, planes[k], 3) >= 0.1:
+                            continue
+                        # stop dead at a tripple plane interaction
+                        stopped = True
+                        break
+                    if stopped:
+                        break
+
+                if stopped:
+                    ps.velocity = [0.0, 0.0, 0.0]
+                    return True
+
+                # if we have fixed all interactions, try another move
+                ps.velocity = clip
+                if gravity:
+                    end_velocity = end_clip
+                break
+
+            bumpcount += 1
+
+        if gravity:
+            ps.velocity = end_velocity
+
+        return bumpcount != 0
+
+    def _step_slide_move(self, ps, pml, gravity):
+        start_o = ps.position[:]
+        start_v = ps.velocity[:]
+
+        if not self._slide_move(ps, pml, gravity):
+            # we got exactly where we wanted to go first try
+            return
+
+        down = start_o[:]
+        down[2] -= STEPSIZE
+        tr = self.world.trace(start_o, down)
+        # never step up when you still have up velocity
+        if ps.velocity[2] > 0 and (tr.fraction == 1.0 or tr.normal[2] < 0.7):
+            return
+
+        up = start_o[:]
+        up[2] += STEPSIZE
+        # test the player position if they were a stepheight higher
+        tr = self.world.trace(start_o, up)
+        if tr.allsolid:
+            # can't step up
+            return
+
+        step_size = tr.endpos[2] - start_o[2]
+        # try slidemove from this position
+        ps.position = tr.endpos
+        ps.velocity = start_v[:]
+
+        self._slide_move(ps, pml, gravity)
+
+        # push down the final amount
+        down = ps.position[:]
+        down[2] -= step_size
+        tr = self.world.trace(ps.position, down)
+        if not tr.allsolid:
+            ps.position = tr.endpos
+        if tr.fraction < 1.0:
+            ps.velocity = _clip_velocity(ps.velocity, tr.normal)
+
+
+class Simulator:
+    """Runs bot actions offline, the same way StrafeBot.run_action does."""
+
+    def __init__(self, world, params=PQL, haste=False):
+        self.pmove = Pmove(world, params)
+        self.haste = haste
+
+    def state_from_history(self, history, i=-1):
+        return SimState.from_history(history, i, self.haste)
+
+    def run_action(self, ps, action):
+        self.pmove.think(ps, Controller.get_cmd(action, ps))
+
+    def rollout(self, ps, action, frames):
+        """Run action for frames frames, modifies ps in place."""
+        for i in range(frames):
+            self.run_action(ps, action)
+        return ps
+
+    def compare_history(self, history):
+        """Replay recorded history and measure the error against it.
+
+        Every frame is run from the recorded state, so the returned maximum
+        errors are per-frame errors and do not accumulate.
+        Returns (max position error, max velocity error, worst frame).
+        """
+        max_pos_err = 0.0
+        max_vel_err = 0.0
+        worst_frame = -1
+        for i in range(len(history) - 1):
+            ps = self.state_from_history(history, i)
+            self.run_action(ps, history.action(i))
+            pos_err = MathHelper.vec3_dist(ps.position, history.position(i + 1))
+            vel_err = MathHelper.vec3_dist(ps.velocity, history.velocity(i + 1))
+            if pos_err > max_pos_err or vel_err > max_vel_err:
+                worst_frame = i
+            max_pos_err = max(max_pos_err, pos_err)
+            max_vel_err = max(max_vel_err, vel_err)
+        return max_pos_err, max_vel_err, worst_frame
+
+    def compare_drift(self, history, frames=SIM_DRIFT_FRAMES):
+        """Replay recorded history frames at a time and measure how far
+        the simulator drifts from it.
+
+        Each run starts from a recorded state and runs the recorded actions
+        for up to frames frames without looking at the states in between,
+        like a rollout, so errors accumulate over the run.
+        Returns (max position error, max velocity error, worst frame).
+        """
+        max_pos_err = 0.0
+        max_vel_err = 0.0
+        worst_frame = -1
+        for start in range(0, len(history) - 1, frames):
+            ps = self.state_from_history(history, start)
+            for i in range(start, min(start + frames, len(history) - 1)):
+                self.run_action(ps, history.action(i))
+                pos_err = MathHelper.vec3_dist(ps.position, history.position(i + 1))
+                vel_err = MathHelper.vec3_dist(ps.velocity, history.velocity(i + 1))
+                if pos_err > max_pos_err or vel_err > max_vel_err:
+                    worst_frame = i
+                max_pos_err = max(max_pos_err, pos_err)
+                max_vel_err = max(max_vel_err, vel_err)
+        return max_pos_err, max_vel_err, worst_frame
+
+    def within_tolerance(self, history):
+        """True if every frame of history replays within SIM_POSITION_TOLERANCE
+        and SIM_VELOCITY_TOLERANCE, and runs of SIM_DRIFT_FRAMES frames stay
+        within SIM_DRIFT_POSITION_TOLERANCE and SIM_DRIFT_VELOCITY_TOLERANCE.
+        """
+        pos_err, vel_err, frame = self.compare_history(history)
+        if pos_err > SIM_POSITION_TOLERANCE or vel_err > SIM_VELOCITY_TOLERANCE:
+            return False
+        pos_err, vel_err, frame = self.compare_drift(history)
+        return (
+            pos_err <= SIM_DRIFT_POSITION_TOLERANCE
+            and vel_err <= SIM_DRIFT_VELOCITY_TOLERANCE
+        )
+
+
+def main():
+    """Check the simulator against histories recorded on the engine
+    (!savehistory), exits with 1 if any of them is out of tolerance.
+    """
+    from .history import History
+    from .route import load_route
+
+    parser = argparse.ArgumentParser(
+        description="check the pmove simulator against recorded histories"
+    )
+    parser.add_argument("histories", nargs="+", help=".history files")
+    parser.add_argument(
+        "--route", help="route file of the histories, default floor is under frame 0"
+    )
+    parser.add_argument("--race-mode", type=int, default=0, help="qlx_raceMode")
+    parser.add_argument("--haste", action="store_true")
+    args = parser.parse_args()
+
+    route = load_route(args.route) if args.route is not None else None
+    failed = 0
+    for path in args.histories:
+        history = History.load(path)
+        if route is not None:
+            world = World.from_point(route.start)
+        else:
+            world = World.flat(
+                history.position(0)[2] + PLAYER_MINS[2] - SURFACE_CLIP_EPSILON
+            )
+        simulator = Simulator(world, get_params(args.race_mode), args.haste)
+        ok = simulator.within_tolerance(history)
+        if not ok:
+            failed += 1
+        pos_err, vel_err, frame = simulator.compare_history(history)
+        drift_pos_err, drift_vel_err, drift_frame = simulator.compare_drift(history)
+        print(
+            "{}: {}, {} frames, pos err {:.3f}, vel err {:.3f} (frame {}), "
+            "over {} frames pos err {:.3f}, vel err {:.3f} (frame {})".format(
+                path,
+                "ok" if ok else "out of tolerance",
+                len(history),
+                pos_err,
+                vel_err,
+                frame,
+                SIM_DRIFT_FRAMES,
+                drift_pos_err,
+                drift_vel_err,
+                drift_frame,
+            )
+        )
+    print(
+        "{} of {} histories within {} units, {} ups per frame and {} units, "
+        "{} ups over {} frames".format(
+            len(args.histories) - failed,
+            len(args.histories),
+            SIM_POSITION_TOLERANCE,
+            SIM_VELOCITY_TOLERANCE,
+            SIM_DRIFT_POSITION_TOLERANCE,
+            SIM_DRIFT_VELOCITY_TOLERANCE,
+            SIM_DRIFT_FRAMES,
+        )
+    )
+    if failed > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Per-phase timing for the solver.
+
+PhaseProfiler.instrument replaces methods of an object with timed wrappers
+on that instance only, so nothing is measured, and nothing costs extra,
+unless a profiler was attached. Phases nest: the time of a phase includes
+the phases called from it.
+
+Every phase keeps a log2 histogram of its call times, bucket i counts
+calls that took [2^(i-1), 2^i) microseconds.
+"""
+
+import json
+
+from .scheduler import perf_counter_ns
+
+PROFILE_BUCKETS = 24
+
+
+class Phase:
+    __slots__ = ("count", "total_ns", "worst_ns", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.worst_ns = 0
+        self.buckets = [0] * PROFILE_BUCKETS
+
+    def add(self, ns):
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.worst_ns:
+            self.worst_ns = ns
+        self.buckets[min((ns // 1000).bit_length(), PROFILE_BUCKETS - 1)] += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in microseconds."""
+        target = p * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n > 0 and seen >= target:
+                return 1 << i
+        return 0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ns": self.total_ns,
+            "worst_ns": self.worst_ns,
+            "buckets_us": self.buckets,
+        }
+
+
+class PhaseProfiler:
+    def __init__(self):
+        # name -> Phase
+        self.phases = {}
+        # instrumented object -> attribute names
+        self.instrumented = []
+
+    def phase(self, name):
+        p = self.phases.get(name)
+        if p is None:
+            p = self.phases[name] = Phase()
+        return p
+
+    def wrap(self, name, fn):
+        phase = self.phase(name)
+
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                phase.add(perf_counter_ns() - start)
+
+        return timed
+
+    def instrument(self, obj, phases):
+        """Time obj's methods, phases is a list of (phase name, method name)."""
+        for name, attr in phases:
+            setattr(obj, attr, self.wrap(name, getattr(obj, attr)))
+            self.instrumented.append((obj, attr))
+
+    def detach(self):
+        """Remove the wrappers, the collected times stay."""
+        for obj, attr in self.instrumented:
+            # the instance attribute hides the class method
+            obj.__dict__.pop(attr, None)
+        self.instrumented = []
+
+    def clear(self):
+        # the wrappers hold on to their Phase
+        for p in self.phases.values():
+            p.__init__()
+
+    def report(self):
+        """Lines of count, total, mean, p50/p99 and worst per phase,
+        heaviest phase first.
+        """
+        lines = []
+        for name, p in sorted(
+            self.phases.items(), key=lambda item: item[1].total_ns, reverse=True
+        ):
+            if p.count == 0:
+                continue
+            lines.append(
+                "{}: {} calls, {:.1f} ms, mean {:.1f} us, p50 <{} us, p99 <{} us, worst {:.1f} us".format(
+                    name,
+                    p.count,
+                    p.total_ns / 1000000.0,
+                    p.total_ns / p.count / 1000.0,
+                    p.percentile(0.5),
+                    p.percentile(0.99),
+                    p.worst_ns / 1000.0,
+                )
+            )
+        return lines
+
+    def dump(self, path):
+        with open(path, mode="w") as file:
+            json.dump(
+                {name: p.to_dict() for name, p in self.phases.items()}, file, indent=2
+            )
@@ -0,0 +1,883 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Route files.
+
+A route is the start point, checkpoints and end point of a run. Files
+are versioned little endian structs read in one go:
+
+    header   magic, version, point count, end_dist, haste
+    points   name, position, yaw, ground entity      (point count)
+
+Version 1 files also stored segment directions and lengths after the
+points, which nothing read back. They still load, the segments are skipped.
+
+Routes used to be pickles of the plugin's Point objects, migrate_pickle()
+and "python3 -m qlsb.route migrate <dir>" convert those.
+"""
+
+import argparse
+import math
+import os
+import pickle
+import random
+import struct
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .mathhelper import MathHelper
+
+# positions closer than this to the route line (or the end point) score as
+# if they were this far, the rewards would be infinite on the line otherwise
+ROUTE_DISTANCE_EPSILON = 0.01
+# rewards() calls reward() per row for fewer rows than this, numpy's fixed
+# cost is about 100 us and a reward() 5 us, they break even at 35-60 rows
+REWARDS_NUMPY_MIN_ROWS = 48
+# a route point the direction changes at by more than this is a corner
+ROUTE_CORNER_ANGLE = 10.0  # deg
+
+ROUTE_MAGIC = b"QLSR"
+ROUTE_VERSION = 2
+ROUTE_SUFFIX = ".route"
+ROUTE_DIR = "qlsb_data"
+
+# magic, version, point count, end_dist, haste
+_HEADER = struct.Struct("<4sHHfB3x")
+# name, position, yaw, ground_ent
+_POINT = struct.Struct("<16s3ffi")
+# version 1 segments: direction, length, cumulative length at the segment start
+_SEGMENT_V1 = struct.Struct("<3fff")
+
+
+class Point:
+    position = [0, 0, 0]
+    angles = [0, 0, 0]
+    ground_ent = -1
+    name = ""
+
+    def __init__(self, name="") -> None:
+        self.name = name
+
+    @staticmethod
+    def from_player(player, name=""):
+        p = Point(name)
+        # can't pickle Vector3
+        p.position = [
+            player.state.position[0],
+            player.state.position[1],
+            player.state.position[2],
+        ]
+        p.angles = [
+            0,
+            player.state.viewangles[1],
+            0,
+        ]
+        p.ground_ent = player.state.ground_entity
+        return p
+
+
+class Route:
+    def __init__(self, start, end, checkpoints, end_dist, haste):
+        self.start = start
+        self.end = end
+        self.checkpoints = checkpoints
+        self.end_dist = end_dist
+        self.haste = haste
+
+    def points(self):
+        return [self.start] + list(self.checkpoints) + [self.end]
+
+    def length(self):
+        points = self.points()
+        return sum(
+            MathHelper.vec3_dist(points[i].position, points[i + 1].position)
+            for i in range(len(points) - 1)
+        )
+
+
+class RouteIndex:
+    """Route queries for the solver's reward function.
+
+    The nearest point is found with a k-d tree instead of a scan, and the
+    line to the next point is precomputed, so a reward is O(log n) and
+    doesn't allocate. Results match the list based scan_reward exactly,
+    including ties (the lower index wins) and float rounding,
+    "python3 -m qlsb.route check" verifies that.
+    """
+
+    def __init__(self, points):
+        self.points = list(points)
+        n = len(self.points)
+        self.x = [float(p.position[0]) for p in self.points]
+        self.y = [float(p.position[1]) for p in self.points]
+        self.z = [float(p.position[2]) for p in self.points]
+        self.is_end = [p.name == "end" for p in self.points]
+
+        # points[i + 1] - points[i]
+        self.forward = [None] * n
+        # line from points[i - 1] to points[i],
+        # see MathHelper.line_closest_point_clamped
+        self.line_norm = [None] * n
+        self.line_dot = [0.0] * n
+        self.line_len = [0.0] * n
+        for i in range(n):
+            if i < n - 1:
+                self.forward[i] = MathHelper.vec3_sub(
+                    self.points[i + 1].position, self.points[i].position
+                )
+            if i > 0:
+                start = self.points[i - 1].position
+                end = self.points[i].position
+                self.line_dot[i] = MathHelper.vec_dot(start, end, 3)
+                self.line_len[i] = MathHelper.vec3_dist(start, end)
+                try:
+                    self.line_norm[i] = MathHelper.vec3_norm(
+                        MathHelper.vec3_sub(end, start)
+                    )
+                except ZeroDivisionError:
+                    # duplicate points, reward() raises like the original
+                    pass
+
+        # the route turns by more than ROUTE_CORNER_ANGLE at points[i],
+        # the first and last points count as corners
+        self.corner = [True] * n
+        min_cos = math.cos(math.radians(ROUTE_CORNER_ANGLE))
+        for i in range(1, n - 1):
+            before = self.line_norm[i]
+            after = self.line_norm[i + 1]
+            if before is not None and after is not None and not self.is_end[i]:
+                self.corner[i] = MathHelper.vec_dot(before, after, 3) < min_cos
+        # route distance from points[i] to the next corner
+        self.straight_ahead = [0.0] * n
+        for i in range(n - 2, -1, -1):
+            self.straight_ahead[i] = self.line_len[i + 1]
+            if not self.corner[i + 1]:
+                self.straight_ahead[i] += self.straight_ahead[i + 1]
+
+        # k-d tree as parallel lists, -1 is no child
+        self.node_point = []
+        self.node_axis = []
+        self.node_left = []
+        self.node_right = []
+        self.root = self._build(list(range(n)), 0)
+        self._best = -1
+        self._best_dist = math.inf
+
+        if np is not None:
+            self.np_points = np.array([self.x, self.y, self.z], dtype=np.float64).T
+            self.np_forward = np.array(
+                [f if f is not None else [0.0, 0.0, 0.0] for f in self.forward],
+                dtype=np.float64,
+            )
+            self.np_line_norm = np.array(
+                [v if v is not None else [math.nan] * 3 for v in self.line_norm],
+                dtype=np.float64,
+            )
+            self.np_line_dot = np.array(self.line_dot, dtype=np.float64)
+            self.np_line_len = np.array(self.line_len, dtype=np.float64)
+            self.np_is_end = np.array(self.is_end, dtype=bool)
+
+    def _build(self, indices, depth):
+        if len(indices) == 0:
+            return -1
+        axis = depth % 3
+        coords = (self.x, self.y, self.z)[axis]
+        indices.sort(key=lambda i: (coords[i], i))
+        mid = len(indices) // 2
+        node = len(self.node_point)
+        self.node_point.append(indices[mid])
+        self.node_axis.append(axis)
+        self.node_left.append(-1)
+        self.node_right.append(-1)
+        self.node_left[node] = self._build(indices[:mid], depth + 1)
+        self.node_right[node] = self._build(indices[mid + 1 :], depth + 1)
+        return node
+
+    def nearest(self, x, y, z):
+        """Index of the nearest point, the first one on ties."""
+        self._best = -1
+        self._best_dist = math.inf
+        self._search(self.root, x, y, z)
+        return self._best
+
+    def _search(self, node, x, y, z):
+        if node < 0:
+            return
+        i = self.node_point[node]
+        dx = x - self.x[i]
+        dy = y - self.y[i]
+        dz = z - self.z[i]
+        dist = math.sqrt(0.0 + dx * dx + dy * dy + dz * dz)
+        if dist < self._best_dist or (dist == self._best_dist and i < self._best):
+            self._best = i
+            self._best_dist = dist
+
+        axis = self.node_axis[node]
+        if axis == 0:
+            diff = dx
+        elif axis == 1:
+            diff = dy
+        else:
+            diff = dz
+        if diff < 0:
+            near = self.node_left[node]
+            far = self.node_right[node]
+        else:
+            near = self.node_right[node]
+            far = self.node_left[node]
+        self._search(near, x, y, z)
+        # points past the splitting plane are at least this far,
+        # computed the same way as dist so ties aren't pruned
+        if math.sqrt(diff * diff) <= self._best_dist:
+            self._search(far, x, y, z)
+
+    def next_point(self, x, y, z):
+        """Index of the first point not passed yet."""
+        nearest = self.nearest(x, y, z)
+        if nearest < len(self.points) - 1:
+            # are we past nearest point?
+            f = self.forward[nearest]
+            dot = (
+                0.0
+                + (self.x[nearest] - x) * f[0]
+                + (self.y[nearest] - y) * f[1]
+                + (self.z[nearest] - z) * f[2]
+            )
+            if dot > 0:
+                return nearest
+            return nearest + 1
+        return nearest
+
+    def corner_distance(self, x, y, z):
+        """Distance to the next corner along the route, straight to the
+        next point and then along the route.
+        """
+        i = self.next_point(x, y, z)
+        dx = self.x[i] - x
+        dy = self.y[i] - y
+        dz = self.z[i] - z
+        distance = math.sqrt(0.0 + dx * dx + dy * dy + dz * dz)
+        if self.corner[i]:
+            return distance
+        return distance + self.straight_ahead[i]
+
+    def reward(self, position, velocity):
+        """scan_reward() for this route."""
+        x = position[0]
+        y = position[1]
+        z = position[2]
+        i = self.next_point(x, y, z)
+        px = self.x[i]
+        py = self.y[i]
+        pz = self.z[i]
+
+        if self.is_end[i]:
+            # Only care about distance, reach end as fast as possible.
+            # Building more speed, etc. don't really matter at this point.
+            # (Assuming last checkpoint is relatively close to the end.)
+            # Use large constant so bot doesn't choose not to pass last checkpoint,
+            # ideally this should always give more reward than the normal reward function.
+            dx = px - x
+            dy = py - y
+            dz = pz - z
+            distance = math.sqrt(0.0 + dx * dx + dy * dy + dz * dz)
+            return 100000.0 + 1.0 / max(distance, ROUTE_DISTANCE_EPSILON)
+
+        # VELOCITY DIRECTION
+        dx = px - x
+        dy = py - y
+        dz = pz - z
+        length = math.sqrt(0.0 + dx * dx + dy * dy + dz * dz)
+        direction_reward = 0.0
+        if length > 0:
+            direction_reward = (
+                0.0
+                + dx / length * velocity[0]
+                + dy / length * velocity[1]
+                + dz / length * velocity[2]
+            )
+
+        # VELOCITY MAGNITUDE
+        velocity_reward = math.sqrt(
+            0.0 + velocity[0] * velocity[0] + velocity[1] * velocity[1]
+        )
+
+        # DISTANCE TO ROUTE
+        if i > 0:
+            norm = self.line_norm[i]
+            if norm is None:
+                # zero length line, let it raise the same way
+                cx, cy, cz = MathHelper.line_closest_point_clamped(
+                    self.points[i - 1].position, self.points[i].position, position
+                )
+            else:
+                sx = self.x[i - 1]
+                sy = self.y[i - 1]
+                sz = self.z[i - 1]
+                frac = 0.0 + (x - sx) * norm[0] + (y - sy) * norm[1] + (z - sz) * norm[2]
+                cx = sx + norm[0] * frac
+                cy = sy + norm[1] * frac
+                cz = sz + norm[2] * frac
+                closest_dot = 0.0 + cx * px + cy * py + cz * pz
+                if self.line_dot[i] * closest_dot > 0:
+                    ex = cx - px
+                    ey = cy - py
+                    ez = cz - pz
+                    if self.line_len[i] < math.sqrt(0.0 + ex * ex + ey * ey + ez * ez):
+                        cx = sx
+                        cy = sy
+                        cz = sz
+                else:
+                    ex = cx - sx
+                    ey = cy - sy
+                    ez = cz - sz
+                    if self.line_len[i] < math.sqrt(0.0 + ex * ex + ey * ey + ez * ez):
+                        cx = px
+                        cy = py
+                        cz = pz
+        else:
+            cx = px
+            cy = py
+            cz = pz
+        dx = x - cx
+        dy = y - cy
+        dz = z - cz
+        distance = math.sqrt(0.0 + dx * dx + dy * dy + dz * dz)
+        distance_reward = 1.0 / max(distance, ROUTE_DISTANCE_EPSILON)
+
+        return (
+            #
+            100.0 * distance_reward
+            + 2.0 * direction_reward
+            + 3.0 * velocity_reward
+        )
+
+    def rewards(self, positions, velocities):
+        """reward() for N positions and velocities at once, one numpy pass
+        over (N, 3) arrays. Gives the same values as reward(),
+        "python3 -m qlsb.route check" verifies that.
+
+        Below REWARDS_NUMPY_MIN_ROWS rows, or without numpy, this calls
+        reward() for each row instead.
+        """
+        if np is None or len(positions) < REWARDS_NUMPY_MIN_ROWS:
+            return [self.reward(p, v) for p, v in zip(positions, velocities)]
+
+        pos = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        vel = np.asarray(velocities, dtype=np.float64).reshape(-1, 3)
+        count = len(self.points)
+        x = pos[:, 0]
+        y = pos[:, 1]
+        z = pos[:, 2]
+        points = self.np_points
+
+        # nearest point, argmin picks the first one on ties like the scan
+        dx = x[:, None] - points[None, :, 0]
+        dy = y[:, None] - points[None, :, 1]
+        dz = z[:, None] - points[None, :, 2]
+        nearest = np.argmin(np.sqrt(dx * dx + dy * dy + dz * dz), axis=1)
+
+        # are we past nearest point?
+        p = points[nearest]
+        f = self.np_forward[nearest]
+        dot = (p[:, 0] - x) * f[:, 0] + (p[:, 1] - y) * f[:, 1] + (p[:, 2] - z) * f[:, 2]
+        i = np.where((nearest < count - 1) & ~(dot > 0), nearest + 1, nearest)
+        p = points[i]
+        px = p[:, 0]
+        py = p[:, 1]
+        pz = p[:, 2]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # VELOCITY DIRECTION
+            dx = px - x
+            dy = py - y
+            dz = pz - z
+            length = np.sqrt(dx * dx + dy * dy + dz * dz)
+            direction_reward = np.where(
+                length > 0,
+                dx / length * vel[:, 0]
+                + dy / length * vel[:, 1]
+                + dz / length * vel[:, 2],
+                0.0,
+            )
+
+            # VELOCITY MAGNITUDE
+            velocity_reward = np.sqrt(vel[:, 0] * vel[:, 0] + vel[:, 1] * vel[:, 1])
+
+            # DISTANCE TO ROUTE
+            has_line = i > 0
+            prev = np.where(has_line, i - 1, 0)
+            s = points[prev]
+            norm = self.np_line_norm[i]
+            frac = (
+                (x - s[:, 0]) * norm[:, 0]
+                + (y - s[:, 1]) * norm[:, 1]
+                + (z - s[:, 2]) * norm[:, 2]
+            )
+            c = s + norm * frac[:, None]
+            closest_dot = c[:, 0] * px + c[:, 1] * py + c[:, 2] * pz
+            same = self.np_line_dot[i] * closest_dot > 0
+            e = np.where(same[:, None], c - p, c - s)
+            outside = self.np_line_len[i] < np.sqrt(
+                e[:, 0] * e[:, 0] + e[:, 1] * e[:, 1] + e[:, 2] * e[:, 2]
+            )
+            c = np.where((same & outside)[:, None], s, c)
+            c = np.where((~same & outside)[:, None], p, c)
+            c = np.where(has_line[:, None], c, p)
+            dx = x - c[:, 0]
+            dy = y - c[:, 1]
+            dz = z - c[:, 2]
+            distance_reward = 1.0 / np.maximum(
+                np.sqrt(dx * dx + dy * dy + dz * dz), ROUTE_DISTANCE_EPSILON
+            )
+
+            result = 100.0 * distance_reward + 2.0 * direction_reward + 3.0 * velocity_reward
+
+            # end point, only distance matters
+            end = self.np_is_end[i]
+            result = np.where(
+                end, 100000.0 + 1.0 / np.maximum(length, ROUTE_DISTANCE_EPSILON), result
+            )
+
+        # zero length segments, let reward() deal with them
+        broken = has_line & ~end & np.isnan(norm[:, 0])
+        for row in np.nonzero(broken)[0]:
+            result[row] = self.reward(pos[row], vel[row])
+        return result
+
+
+def _scan_next_index(points, position):
+    nearest_index = -1
+    nearest_dist = math.inf
+    for i in range(0, len(points)):
+        dist = MathHelper.vec3_dist(position, points[i].position)
+        if dist < nearest_dist:
+            nearest_dist = dist
+            nearest_index = i
+
+    next_index = nearest_index
+    if nearest_index < len(points) - 1:
+        # are we past nearest point?
+        forward = MathHelper.vec3_sub(
+            points[nearest_index + 1].position, points[nearest_index].position
+        )
+        to_nearest = MathHelper.vec3_sub(points[nearest_index].position, position)
+        if MathHelper.vec_dot(to_nearest, forward, 3) <= 0:
+            next_index = nearest_index + 1
+    return next_index
+
+
+def scan_distance(points, position):
+    """The distance the reward takes the inverse of: to the end point once
+    it is next, to the line from the previous point to the next one
+    otherwise. ROUTE_DISTANCE_EPSILON clamps it.
+    """
+    next_index = _scan_next_index(points, position)
+    point = points[next_index]
+    closest = point.position
+    if point.name != "end" and next_index > 0:
+        closest = MathHelper.line_closest_point_clamped(
+            points[next_index - 1].position, point.position, position
+        )
+    return MathHelper.vec3_dist(position, closest)
+
+
+def scan_reward(points, position, velocity):
+    """The reward RouteIndex.reward indexes: original_reward with the
+    ROUTE_DISTANCE_EPSILON clamp, kept as the reference "check" compares
+    against.
+    """
+    next_index = _scan_next_index(points, position)
+    point = points[next_index]
+
+    if point.name == "end":
+        distance = MathHelper.vec3_dist(point.position, position)
+        return 100000.0 + 1.0 / max(distance, ROUTE_DISTANCE_EPSILON)
+
+    direction_reward = 0.0
+    if MathHelper.vec3_dist(point.position, position) > 0:
+        want_direction = MathHelper.vec3_norm(
+            MathHelper.vec3_sub(point.position, position)
+        )
+        direction_reward = MathHelper.vec_dot(want_direction, velocity, 3)
+    velocity_reward = MathHelper.vec2_len(velocity)
+    closest = point.position
+    if next_index > 0:
+        closest = MathHelper.line_closest_point_clamped(
+            points[next_index - 1].position, point.position, position
+        )
+    distance_reward = 1.0 / max(
+        MathHelper.vec3_dist(position, closest), ROUTE_DISTANCE_EPSILON
+    )
+    return 100.0 * distance_reward + 2.0 * direction_reward + 3.0 * velocity_reward
+
+
+def original_reward(points, position, velocity):
+    """The plugin's MapConfig.get_reward before the route index, unmodified
+    but for taking the points as a list. Raises ZeroDivisionError on the
+    route line and at the end point.
+    """
+
+    def get_remaining_points(position):
+        nearest_index = -1
+        nearest_dist = math.inf
+        for i in range(0, len(points)):
+            dist = MathHelper.vec3_dist(position, points[i].position)
+            if dist < nearest_dist:
+                nearest_dist = dist
+                nearest_index = i
+
+        if nearest_index < len(points) - 1:
+            # are we past nearest point?
+            forward = MathHelper.vec3_sub(
+                points[nearest_index + 1].position, points[nearest_index].position
+            )
+            to_nearest = MathHelper.vec3_sub(points[nearest_index].position, position)
+            if MathHelper.vec_dot(to_nearest, forward, 3) > 0:
+                next_index = nearest_index
+            else:
+                next_index = nearest_index + 1
+        else:
+            next_index = nearest_index
+
+        return points[next_index:]
+
+    def get_previous_point(point):
+        for i in range(len(points)):
+            if points[i].name == point.name:
+                if i > 0:
+                    return points[i - 1]
+                break
+        return None
+
+    remaining_points = get_remaining_points(position)
+
+    is_end = remaining_points[0].name == "end"
+    if is_end:
+        distance = MathHelper.vec3_dist(remaining_points[0].position, position)
+        return 100000.0 + 1.0 / distance
+
+    want_direction = MathHelper.vec3_norm(
+        MathHelper.vec3_sub(remaining_points[0].position, position)
+    )
+    direction_reward = MathHelper.vec_dot(want_direction, velocity, 3)
+
+    velocity_reward = MathHelper.vec2_len(velocity)
+
+    previous_point = get_previous_point(remaining_points[0])
+    closest = remaining_points[0].position
+    if previous_point != None:
+        closest = MathHelper.line_closest_point_clamped(
+            previous_point.position, remaining_points[0].position, position
+        )
+    distance = MathHelper.vec3_dist(position, closest)
+    distance_reward = 1.0 / distance
+
+    return (
+        #
+        100.0 * distance_reward
+        + 2.0 * direction_reward
+        + 3.0 * velocity_reward
+    )
+
+
+def random_route(rng, count):
+    """count route points on a random walk, for "check"."""
+    points = []
+    position = [rng.uniform(-2000.0, 2000.0) for i in range(3)]
+    for i in range(count):
+        name = "start" if i == 0 else "end" if i == count - 1 else "cp{}".format(i)
+        point = Point(name)
+        point.position = list(position)
+        points.append(point)
+        position = [
+            position[0] + rng.uniform(-800.0, 800.0),
+            position[1] + rng.uniform(-800.0, 800.0),
+            position[2] + rng.uniform(-100.0, 100.0),
+        ]
+    return points
+
+
+def check_queries(rng, points, count):
+    """Random (position, velocity) pairs around points, a quarter of them
+    on a grid so ties come up, plus every point and positions on the route
+    line, where the rewards are clamped by ROUTE_DISTANCE_EPSILON.
+    """
+    lo = [min(p.position[k] for p in points) - 500.0 for k in range(3)]
+    hi = [max(p.position[k] for p in points) + 500.0 for k in range(3)]
+    queries = []
+    for i in range(count):
+        position = [rng.uniform(lo[k], hi[k]) for k in range(3)]
+        if i % 4 == 0:
+            position = [round(x / 100.0) * 100.0 for x in position]
+        velocity = [rng.uniform(-800.0, 800.0) for k in range(3)]
+        queries.append((position, velocity))
+    for i, point in enumerate(points):
+        queries.append((list(point.position), [320.0, 0.0, 0.0]))
+        if i > 0:
+            t = rng.random()
+            position = [
+                a + (b - a) * t
+                for a, b in zip(points[i - 1].position, point.position)
+            ]
+            queries.append((position, [320.0, 0.0, 0.0]))
+    return queries
+
+
+def _reward_or_error(function, *args):
+    try:
+        return function(*args)
+    except ZeroDivisionError:
+        return ZeroDivisionError
+
+
+def check_index(points, queries):
+    """Returns (mismatches, clamped).
+
+    mismatches are the queries where scan_reward differs from
+    original_reward while the distance is at least ROUTE_DISTANCE_EPSILON,
+    RouteIndex.reward from scan_reward, or RouteIndex.rewards from
+    RouteIndex.reward, or either isn't finite, as
+    (position, velocity, expected, reward). clamped counts the queries
+    closer than ROUTE_DISTANCE_EPSILON, where the original raised
+    ZeroDivisionError or scored above 100 / ROUTE_DISTANCE_EPSILON.
+    """
+    index = RouteIndex(points)
+    rewards = index.rewards([q[0] for q in queries], [q[1] for q in queries])
+    mismatches = []
+    clamped = 0
+    for (position, velocity), batch in zip(queries, rewards):
+        expected = _reward_or_error(scan_reward, points, position, velocity)
+        reward = _reward_or_error(index.reward, position, velocity)
+        distance = _reward_or_error(scan_distance, points, position)
+        if distance is not ZeroDivisionError and distance < ROUTE_DISTANCE_EPSILON:
+            clamped += 1
+        else:
+            original = _reward_or_error(original_reward, points, position, velocity)
+            if original != expected:
+                mismatches.append((position, velocity, original, expected))
+                continue
+        if reward != expected:
+            mismatches.append((position, velocity, expected, reward))
+        elif batch != reward:
+            mismatches.append((position, velocity, reward, float(batch)))
+        elif not math.isfinite(batch):
+            mismatches.append((position, velocity, "finite", float(batch)))
+    return mismatches, clamped
+
+
+def pack_route(route):
+    points = route.points()
+    data = [
+        _HEADER.pack(
+            ROUTE_MAGIC, ROUTE_VERSION, len(points), route.end_dist, route.haste
+        )
+    ]
+    for p in points:
+        data.append(
+            _POINT.pack(
+                p.name.encode()[:16],
+                p.position[0],
+                p.position[1],
+                p.position[2],
+                p.angles[1],
+                p.ground_ent,
+            )
+        )
+    return b"".join(data)
+
+
+def unpack_route(data, name="route"):
+    if len(data) < _HEADER.size:
+        raise ValueError("{} is too short for a route".format(name))
+    magic, version, count, end_dist, haste = _HEADER.unpack_from(data, 0)
+    if magic != ROUTE_MAGIC:
+        raise ValueError("{} is not a route file".format(name))
+    if version != ROUTE_VERSION and version != 1:
+        raise ValueError(
+            "{} is route version {}, expected {}".format(name, version, ROUTE_VERSION)
+        )
+    if count < 2:
+        raise ValueError("{} needs a start and an end point".format(name))
+    size = _HEADER.size + count * _POINT.size
+    if version == 1:
+        size += (count - 1) * _SEGMENT_V1.size
+    if len(data) != size:
+        raise ValueError("{} is {} bytes, expected {}".format(name, len(data), size))
+
+    points = []
+    offset = _HEADER.size
+    for i in range(count):
+        p_name, x, y, z, yaw, ground_ent = _POINT.unpack_from(data, offset)
+        p = Point(p_name.rstrip(b"\0").decode())
+        p.position = [x, y, z]
+        p.angles = [0, yaw, 0]
+        p.ground_ent = ground_ent
+        points.append(p)
+        offset += _POINT.size
+
+    if end_dist == int(end_dist):
+        end_dist = int(end_dist)
+    return Route(points[0], points[-1], points[1:-1], end_dist, bool(haste))
+
+
+def save_route(path, route):
+    with open(path, mode="wb") as file:
+        file.write(pack_route(route))
+
+
+def load_route(path):
+    with open(path, mode="rb") as file:
+        return unpack_route(file.read(), path)
+
+
+def route_path(name, directory=ROUTE_DIR):
+    return os.path.join(directory, name + ROUTE_SUFFIX)
+
+
+def load_routes(directory=ROUTE_DIR):
+    """Index every route file in directory, returns {name: Route}.
+    Broken files are reported and skipped.
+    """
+    routes = {}
+    if not os.path.isdir(directory):
+        return routes
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(ROUTE_SUFFIX):
+            continue
+        try:
+            routes[file_name[: -len(ROUTE_SUFFIX)]] = load_route(
+                os.path.join(directory, file_name)
+            )
+        except (OSError, ValueError, struct.error) as e:
+            print("skipping route {}: {}".format(file_name, e))
+    return routes
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    # old configs reference the plugin's Point class,
+    # which can't be imported outside the server.
+    def find_class(self, module, name):
+        if name == "Point":
+            return Point
+        raise pickle.UnpicklingError(
+            "unexpected {}.{} in route pickle".format(module, name)
+        )
+
+
+def migrate_pickle(path, directory=None):
+    """Convert an old save_config pickle to a route file next to it
+    (or in directory), returns the new path.
+    """
+    with open(path, mode="rb") as file:
+        cfg = _LegacyUnpickler(file).load()
+    route = Route(
+        cfg["start"], cfg["end"], cfg["checkpoints"], cfg["end_dist"], cfg["haste"]
+    )
+    if directory is None:
+        directory = os.path.dirname(path)
+    new_path = route_path(os.path.basename(path), directory)
+    save_route(new_path, route)
+    return new_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qlsb route files")
+    sub = parser.add_subparsers(dest="command")
+    migrate = sub.add_parser("migrate", help="convert pickled configs to route files")
+    migrate.add_argument("directory", nargs="?", default=ROUTE_DIR)
+    show = sub.add_parser("show", help="print route files")
+    show.add_argument("directory", nargs="?", default=ROUTE_DIR)
+    check = sub.add_parser(
+        "check", help="check RouteIndex rewards against the original reward"
+    )
+    check.add_argument("directory", nargs="?", default=ROUTE_DIR)
+    check.add_argument("--random-routes", type=int, default=20)
+    check.add_argument("--queries", type=int, default=4500, help="per route")
+    check.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        for file_name in sorted(os.listdir(args.directory)):
+            path = os.path.join(args.directory, file_name)
+            # pickles were saved without an extension
+            if "." in file_name or not os.path.isfile(path):
+                continue
+            try:
+                print("{} -> {}".format(path, migrate_pickle(path)))
+            except Exception as e:
+                print("skipping {}: {}".format(path, e))
+    elif args.command == "show":
+        for name, route in load_routes(args.directory).items():
+            print(
+                "{}: {} checkpoints, {:.0f} units, end_dist {}, haste {}".format(
+                    name,
+                    len(route.checkpoints),
+                    route.length(),
+                    route.end_dist,
+                    route.haste,
+                )
+            )
+    elif args.command == "check":
+        rng = random.Random(args.seed)
+        routes = []
+        if os.path.isdir(args.directory):
+            for name, route in load_routes(args.directory).items():
+                routes.append((name, route.points()))
+        for i in range(args.random_routes):
+            routes.append(("random{}".format(i), random_route(rng, rng.randint(2, 42))))
+        failed = 0
+        total = 0
+        total_clamped = 0
+        for name, points in routes:
+            queries = check_queries(rng, points, args.queries)
+            total += len(queries)
+            mismatches, clamped = check_index(points, queries)
+            total_clamped += clamped
+            if len(mismatches) > 0:
+                failed += 1
+                position, velocity, expected, reward = mismatches[0]
+                print(
+                    "{}: {} of {} rewards differ, e.g. {} {}: {} != {}".format(
+                        name,
+                        len(mismatches),
+                        len(queries),
+                        position,
+                        velocity,
+                        expected,
+                        reward,
+                    )
+                )
+        print(
+            "{} of {} routes match, {} queries, {} clamped".format(
+                len(routes) - failed, len(routes), total, total_clamped
+            )
+        )
+        if failed > 0:
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Decides how much solver work fits in a server frame.
+
+The cost of one solver iteration varies a lot (cache hits, engine vs offline
+rollouts, committing an action), so instead of looping until a fixed
+deadline and overshooting it by a whole rollout, the scheduler keeps a
+running estimate of the cost and only starts work that is predicted to fit.
+An iteration that doesn't fit even in an empty frame skips the frame, but
+only MAX_SKIPPED_FRAMES in a row so the solve can't starve.
+"""
+
+try:
+    from time import perf_counter_ns
+except ImportError:
+    # python < 3.7
+    from time import perf_counter
+
+    def perf_counter_ns():
+        return int(perf_counter() * 1000000000)
+
+
+# most of a 125 Hz frame, the server needs the rest
+FRAME_BUDGET_MS = 0.9 * (1000.0 / 125.0)
+
+# same gains as TCP's RTT estimator
+COST_GAIN = 0.125
+DEVIATION_GAIN = 0.25
+DEVIATION_WEIGHT = 4
+
+# frames in a row that may skip an iteration predicted to overrun the budget,
+# the next one runs it anyway
+MAX_SKIPPED_FRAMES = 3
+
+
+class FrameScheduler:
+    def __init__(self, budget_ms=FRAME_BUDGET_MS, max_skipped=MAX_SKIPPED_FRAMES):
+        self.budget_ns = int(max(0.0, budget_ms) * 1000000)
+        self.max_skipped = max_skipped
+        self.cost_ns = 0
+        self.deviation_ns = 0
+        self.frame_start = 0
+        self.last_mark = 0
+        self.frames = 0
+        self.iterations = 0
+        self.overruns = 0
+        self.worst_ns = 0
+        # frames without an iteration, in total and in a row
+        self.skipped = 0
+        self.starved = 0
+
+    def predicted_ns(self):
+        return self.cost_ns + DEVIATION_WEIGHT * self.deviation_ns
+
+    def start_frame(self):
+        self.frame_start = perf_counter_ns()
+        self.last_mark = 0
+
+    def has_time(self):
+        """Call before every iteration, the time since the previous call is
+        taken as the cost of the previous iteration.
+
+        The first iteration of a frame is skipped too when it is predicted
+        not to fit, unless max_skipped frames in a row already were, so the
+        solve progresses even when no single iteration fits.
+        """
+        now = perf_counter_ns()
+        first = self.last_mark == 0
+        if not first:
+            self._record(now - self.last_mark)
+        if now - self.frame_start + self.predicted_ns() > self.budget_ns:
+            if not first:
+                self.last_mark = 0
+                return False
+            if self.starved < self.max_skipped:
+                self.starved += 1
+                self.skipped += 1
+                return False
+        if first:
+            self.starved = 0
+        self.last_mark = now
+        return True
+
+    def _record(self, cost):
+        self.iterations += 1
+        if self.iterations == 1:
+            self.cost_ns = cost
+            self.deviation_ns = cost // 2
+        else:
+            error = cost - self.cost_ns
+            self.cost_ns += int(COST_GAIN * error)
+            self.deviation_ns += int(DEVIATION_GAIN * (abs(error) - self.deviation_ns))
+
+    def end_frame(self):
+        now = perf_counter_ns()
+        if self.last_mark != 0:
+            # the loop was left from inside an iteration
+            self._record(now - self.last_mark)
+            self.last_mark = 0
+        elapsed = now - self.frame_start
+        self.frames += 1
+        self.worst_ns = max(self.worst_ns, elapsed)
+        if elapsed > self.budget_ns:
+            self.overruns += 1
+
+    def stats(self):
+        return "{} frames, {} overruns, {} skipped, budget {:.2f} ms, iteration {:.3f} ms +- {:.3f}, worst frame {:.2f} ms, {:.1f} iterations/frame".format(
+            self.frames,
+            self.overruns,
+            self.skipped,
+            self.budget_ns / 1000000,
+            self.cost_ns / 1000000,
+            self.deviation_ns / 1000000,
+            self.worst_ns / 1000000,
+            self.iterations / self.frames if self.frames > 0 else 0.0,
+        )
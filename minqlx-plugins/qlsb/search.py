@@ -0,0 +1,327 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Search strategies for the StrafeBot solver.
+
+They don't know about the engine: states are opaque and advanced through
+a rollout(state, action) -> (state, position, velocity[, reward]) callback,
+so the same code runs on engine snapshots and on the offline simulator.
+"""
+
+import heapq
+import math
+
+from .controller import (
+    Actions,
+    TURN_SPEED_MAX,
+    TURN_SPEED_INTERVAL,
+    INPUT_FRAME_INTERVAL,
+    MIN_ACTION_FRAMES,
+    MAX_ACTION_FRAMES,
+    AIR_ACCEL,
+    MAX_GROUND_SPEED,
+    FRAMETIME,
+)
+from .mathhelper import MathHelper
+
+# beam search tries fewer turn rates per node than the greedy sweep
+BEAM_TURN_SPEED_INTERVAL = 45  # deg/s
+BEAM_WIDTH = 4
+BEAM_DEPTH = 3
+
+# commit an action for this fraction of the time to the next corner
+DURATION_LOOKAHEAD = 0.25
+# how far one segment of strafing may turn the velocity
+MAX_SEGMENT_TURN = 16.0  # deg
+FRAMES_PER_SECOND = 125
+
+# the golden-section search narrows the turn rate to less than this
+TURN_SEARCH_TOLERANCE = TURN_SPEED_INTERVAL / 2.0  # deg/s
+# fraction of the larger side of the bracket to try next, 2 - golden ratio
+GOLDEN_SECTION = (3.0 - math.sqrt(5.0)) / 2.0
+
+
+def segment_duration(
+    distance, speed, min_frames=MIN_ACTION_FRAMES, max_frames=MAX_ACTION_FRAMES
+):
+    """Frames to run the next action for.
+
+    A fraction of the time it takes to reach the next corner of the route
+    (RouteIndex.corner_distance) at the current speed: long segments on
+    straights, checkpoints along them included, short ones near corners
+    where the route changes direction.
+
+    Holding one strafe direction curves the path off the route, so the
+    segment is also cut where air acceleration could have turned the
+    velocity MAX_SEGMENT_TURN degrees. That allows longer segments the
+    faster the bot goes.
+    """
+    if speed < 1.0:
+        return INPUT_FRAME_INTERVAL
+    frames = int(DURATION_LOOKAHEAD * FRAMES_PER_SECOND * distance / speed)
+    turn = MathHelper.rad_to_deg(AIR_ACCEL * MAX_GROUND_SPEED * FRAMETIME / speed)
+    frames = min(frames, int(MAX_SEGMENT_TURN / turn))
+    return max(min_frames, min(max_frames, frames))
+
+
+def candidate_actions(turn_interval=TURN_SPEED_INTERVAL, turn_max=TURN_SPEED_MAX):
+    """Every action the solver can pick for one INPUT_FRAME_INTERVAL."""
+    actions = [
+        [Actions.LEFT_DIAG, 0, -math.inf],
+        [Actions.RIGHT_DIAG, 0, -math.inf],
+    ]
+    for act in (Actions.LEFT, Actions.RIGHT):
+        rate = turn_interval
+        while rate <= turn_max:
+            actions.append([act, rate, -math.inf])
+            rate += turn_interval
+    return actions
+
+
+class BeamSearch:
+    """Keeps the width best partial trajectories and expands them depth
+    intervals ahead, then commits the first action of the best one.
+
+    The search is resumable: step() runs a single rollout so the caller
+    can spread a decision over as many server frames as it needs.
+    """
+
+    def __init__(self, rollout, reward, width=BEAM_WIDTH, depth=BEAM_DEPTH, actions=None):
+        self.rollout = rollout
+        self.reward = reward
+        self.width = max(1, width)
+        self.depth = max(1, depth)
+        if actions is None:
+            actions = candidate_actions(BEAM_TURN_SPEED_INTERVAL)
+        self.actions = actions
+        self.rollouts = 0
+        self.level = 0
+        # node: (reward, first action, state)
+        self.frontier = []
+        self.children = []
+        self.queue = []
+        self.outstanding = 0
+
+    def reset(self, root_state):
+        self.level = 0
+        self.frontier = [(-math.inf, None, root_state)]
+        self.children = []
+        self.outstanding = 0
+        self._queue_frontier()
+
+    def _queue_frontier(self):
+        self.queue = [(node, action) for node in self.frontier for action in self.actions]
+
+    def step(self):
+        """Run one rollout.
+
+        Returns the first action of the best trajectory once depth levels
+        have been expanded, None while still searching.
+        """
+        node, action = self.queue.pop()
+        self.outstanding += 1
+        return self.add_result(node, action, *self.rollout(node[2], action))
+
+    def take_jobs(self):
+        """Hand out every queued (node, action) rollout so they can be run
+        elsewhere, each result has to come back through add_result().
+        """
+        jobs = self.queue
+        self.queue = []
+        self.outstanding += len(jobs)
+        return jobs
+
+    def add_result(self, node, action, state, position, velocity, reward=None):
+        """Merge a finished rollout into the search, returns the same as step()."""
+        self.outstanding -= 1
+        self.rollouts += 1
+        first = node[1] if node[1] is not None else action
+        if reward is None:
+            reward = self.reward(position, velocity)
+        self.children.append((reward, first, state))
+
+        if len(self.queue) > 0 or self.outstanding > 0:
+            return None
+
+        self.level += 1
+        self.frontier = heapq.nlargest(self.width, self.children, key=lambda n: n[0])
+        self.children = []
+        if self.level >= self.depth:
+            best = self.frontier[0]
+            return [best[1][0], best[1][1], best[0]]
+        self._queue_frontier()
+        return None
+
+
+class ActionSearch:
+    """Picks the action for one interval, one rollout per step().
+
+    Subclasses write the search as a generator in _search(): it yields the
+    next action to try and is sent back its reward. Repeated actions are
+    answered from the results of this interval without a rollout.
+
+    Resumable like BeamSearch, evaluate(action) -> reward runs one rollout.
+    """
+
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+        self.rollouts = 0
+        self.decisions = 0
+        self.results = {}
+        self.best = None
+        self.pending = None
+        self.search = None
+
+    def reset(self):
+        self.results = {}
+        self.best = None
+        self.search = self._search()
+        self.pending = next(self.search)
+
+    def step(self):
+        """Run one rollout.
+
+        Returns the best [action, turn rate, reward] once the search is done,
+        None while still searching.
+        """
+        while True:
+            action = self.pending
+            key = (int(action[0]), action[1])
+            reward = self.results.get(key)
+            evaluated = reward is None
+            if evaluated:
+                reward = self.evaluate(action)
+                self.rollouts += 1
+                self.results[key] = reward
+                if self.best is None or reward > self.best[2]:
+                    self.best = [action[0], action[1], reward]
+            try:
+                self.pending = self.search.send(reward)
+            except StopIteration:
+                self.decisions += 1
+                return self.best
+            # known results don't count as a step
+            if evaluated:
+                return None
+
+    def _search(self):
+        raise NotImplementedError
+
+
+class SweepSearch(ActionSearch):
+    """The original greedy search.
+
+    Tries both diagonals, then every turn rate in turn_interval steps left
+    and then right. A direction is given up as soon as turning faster
+    gives less reward.
+    """
+
+    def __init__(
+        self, evaluate, turn_interval=TURN_SPEED_INTERVAL, turn_max=TURN_SPEED_MAX
+    ):
+        super().__init__(evaluate)
+        self.turn_interval = turn_interval
+        self.turn_max = turn_max
+
+    def _search(self):
+        yield [Actions.LEFT_DIAG, 0, -math.inf]
+        yield [Actions.RIGHT_DIAG, 0, -math.inf]
+        for act in [Actions.LEFT, Actions.RIGHT]:
+            last = -math.inf
+            rate = self.turn_interval
+            while rate <= self.turn_max:
+                reward = yield [act, rate, -math.inf]
+                if reward < last and rate > self.turn_interval:
+                    # turning faster is giving less reward,
+                    # don't bother iterating through remaining angles
+                    break
+                last = reward
+                rate += self.turn_interval
+
+
+class TurnRateSearch(ActionSearch):
+    """Picks the action for one interval with a golden-section search
+    over the turn rate.
+
+    Both diagonals are tried first. Each turn direction is then bracketed
+    by doubling the rate from turn_interval until the reward stops
+    improving, so a plateau or a drop ends it after two rollouts and a
+    fast turn is reached in a few doublings instead of a step at a time.
+    Only a turn that beats the diagonals and the other direction is
+    refined: a golden-section search inside its bracket, one rollout per
+    iteration, until the bracket is narrower than tolerance, which is
+    below turn_interval. Reward over turn rate is assumed to be unimodal,
+    same as the sweep.
+    """
+
+    def __init__(
+        self,
+        evaluate,
+        turn_interval=TURN_SPEED_INTERVAL,
+        turn_max=TURN_SPEED_MAX,
+        tolerance=TURN_SEARCH_TOLERANCE,
+    ):
+        super().__init__(evaluate)
+        self.turn_interval = turn_interval
+        self.turn_max = turn_max
+        self.tolerance = tolerance
+
+    def _search(self):
+        yield [Actions.LEFT_DIAG, 0, -math.inf]
+        yield [Actions.RIGHT_DIAG, 0, -math.inf]
+        # bracket: (lower, best, upper) rates of each direction
+        brackets = {}
+        for act in [Actions.LEFT, Actions.RIGHT]:
+            lower = 0.0
+            rate = self.turn_interval
+            best = yield [act, rate, -math.inf]
+            while rate < self.turn_max:
+                next_rate = min(rate * 2.0, self.turn_max)
+                reward = yield [act, next_rate, -math.inf]
+                if reward <= best:
+                    brackets[act] = (lower, rate, next_rate)
+                    break
+                lower = rate
+                rate = next_rate
+                best = reward
+            else:
+                brackets[act] = (lower, rate, rate)
+
+        # refine the turn, if one won
+        act = self.best[0]
+        if act != Actions.LEFT and act != Actions.RIGHT:
+            return
+        lower, rate, upper = brackets[act]
+        best = self.best[2]
+        while upper - lower > self.tolerance:
+            if upper - rate > rate - lower:
+                next_rate = rate + GOLDEN_SECTION * (upper - rate)
+            else:
+                next_rate = rate - GOLDEN_SECTION * (rate - lower)
+            reward = yield [act, next_rate, -math.inf]
+            if reward > best:
+                if next_rate > rate:
+                    lower = rate
+                else:
+                    upper = rate
+                rate = next_rate
+                best = reward
+            elif next_rate > rate:
+                upper = next_rate
+            else:
+                lower = next_rate
@@ -0,0 +1,67 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Helpers for the blobs returned by minqlx.snapshot_player.
+
+The blobs are opaque apart from a small header with the kinematics,
+see playerSnapshotHeader_t in python_embed.c.
+"""
+
+import struct
+
+SNAPSHOT_VERSION = 1
+
+# version, origin, velocity, viewangles, groundEntityNum, jumpTime, doubleJumped
+_HEADER = struct.Struct("<i9f3i")
+HEADER_SIZE = _HEADER.size
+
+
+def read_header(blob):
+    """Returns (position, velocity, viewangles, ground_entity, jump_time, double_jumped)."""
+    h = _HEADER.unpack_from(blob)
+    if h[0] != SNAPSHOT_VERSION:
+        raise ValueError("Unsupported player snapshot version {}.".format(h[0]))
+    return (
+        [h[1], h[2], h[3]],
+        [h[4], h[5], h[6]],
+        [h[7], h[8], h[9]],
+        h[10],
+        h[11],
+        h[12],
+    )
+
+
+def pack_header(position, velocity, viewangles, ground_entity, jump_time, double_jumped):
+    """The header on its own, a portable state that is safe to send
+    to other processes (the full snapshot contains pointers).
+    """
+    return _HEADER.pack(
+        SNAPSHOT_VERSION,
+        position[0],
+        position[1],
+        position[2],
+        velocity[0],
+        velocity[1],
+        velocity[2],
+        viewangles[0],
+        viewangles[1],
+        viewangles[2],
+        ground_entity,
+        jump_time,
+        double_jumped,
+    )
@@ -0,0 +1,160 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compact solution files.
+
+A solution is the solved actions run-length encoded as segments of
+(action, turn rate, allow jump, duration), plus a keyframe with the
+kinematics every keyframe_interval frames. Playback only needs the
+keyframes to start from and to correct drift, so a solved run takes a
+few KB instead of a full per-frame history, and frames() expands it
+frame by frame while it plays.
+
+    header    magic, version, haste, route name, keyframe interval,
+              segment count, keyframe count
+    segment   action, allow jump, turn rate, duration
+    keyframe  frame, snapshot header
+"""
+
+import math
+import struct
+
+from .controller import Actions
+from .snapshot import pack_header, HEADER_SIZE
+
+SOLUTION_MAGIC = b"QLSS"
+SOLUTION_VERSION = 1
+SOLUTION_SUFFIX = ".solution"
+# frames between keyframes, one per second of run time
+SOLUTION_KEYFRAME_INTERVAL = 125
+
+# magic, version, haste, route name, keyframe interval, segment count, keyframe count
+_HEADER = struct.Struct("<4sHH32sIII")
+# action, allow jump, turn rate, duration
+_SEGMENT = struct.Struct("<bbdH")
+_KEYFRAME = struct.Struct("<I")
+MAX_SEGMENT_FRAMES = 0xFFFF
+
+
+class Solution:
+    def __init__(self, route_name="", haste=False, keyframe_interval=0):
+        self.route_name = route_name
+        self.haste = haste
+        self.keyframe_interval = keyframe_interval
+        # [action, turn rate, allow jump, duration]
+        self.segments = []
+        # (frame, snapshot header), always starts with frame 0
+        self.keyframes = []
+
+    def __len__(self):
+        return sum(s[3] for s in self.segments)
+
+    @staticmethod
+    def from_history(
+        history, route_name="", haste=False, keyframe_interval=SOLUTION_KEYFRAME_INTERVAL
+    ):
+        solution = Solution(route_name, haste, keyframe_interval)
+        actions = history.column("action")
+        turn_rates = history.column("turn_rate")
+        allow_jumps = history.column("allow_jump")
+        segments = solution.segments
+        for i in range(len(history)):
+            step = [actions[i], turn_rates[i], allow_jumps[i]]
+            last = segments[-1] if len(segments) > 0 else None
+            if last is not None and last[:3] == step and last[3] < MAX_SEGMENT_FRAMES:
+                last[3] += 1
+            else:
+                segments.append(step + [1])
+            if i == 0 or (keyframe_interval > 0 and i % keyframe_interval == 0):
+                solution.keyframes.append((i, pack_header(*history.kinematics(i))))
+        return solution
+
+    def frames(self):
+        """Yields (frame, action, keyframe header or None) for every frame,
+        action in the list form Controller takes.
+        """
+        keyframes = iter(self.keyframes)
+        keyframe = next(keyframes, None)
+        frame = 0
+        for act, turn_rate, allow_jump, duration in self.segments:
+            action = [Actions(act), turn_rate, -math.inf]
+            if allow_jump == 0:
+                action.append(False)
+            for i in range(duration):
+                header = None
+                if keyframe is not None and keyframe[0] == frame:
+                    header = keyframe[1]
+                    keyframe = next(keyframes, None)
+                yield frame, action, header
+                frame += 1
+
+    def save(self, path):
+        data = [
+            _HEADER.pack(
+                SOLUTION_MAGIC,
+                SOLUTION_VERSION,
+                1 if self.haste else 0,
+                self.route_name.encode()[:32],
+                self.keyframe_interval,
+                len(self.segments),
+                len(self.keyframes),
+            )
+        ]
+        for act, turn_rate, allow_jump, duration in self.segments:
+            data.append(_SEGMENT.pack(act, allow_jump, turn_rate, duration))
+        for frame, header in self.keyframes:
+            data.append(_KEYFRAME.pack(frame) + bytes(header[:HEADER_SIZE]))
+        with open(path, mode="wb") as file:
+            file.write(b"".join(data))
+
+    @staticmethod
+    def load(path):
+        with open(path, mode="rb") as file:
+            data = file.read()
+
+        if len(data) < _HEADER.size:
+            raise ValueError("{} is too short for a solution".format(path))
+        magic, version, haste, route_name, interval, segment_count, keyframe_count = (
+            _HEADER.unpack_from(data, 0)
+        )
+        if magic != SOLUTION_MAGIC or version != SOLUTION_VERSION:
+            raise ValueError(
+                "{} is not a version {} solution".format(path, SOLUTION_VERSION)
+            )
+        size = (
+            _HEADER.size
+            + segment_count * _SEGMENT.size
+            + keyframe_count * (_KEYFRAME.size + HEADER_SIZE)
+        )
+        if len(data) != size:
+            raise ValueError("{} is {} bytes, expected {}".format(path, len(data), size))
+        if keyframe_count == 0:
+            raise ValueError("{} has no start keyframe".format(path))
+
+        solution = Solution(route_name.rstrip(b"\0").decode(), haste != 0, interval)
+        offset = _HEADER.size
+        for i in range(segment_count):
+            act, allow_jump, turn_rate, duration = _SEGMENT.unpack_from(data, offset)
+            solution.segments.append([act, turn_rate, allow_jump, duration])
+            offset += _SEGMENT.size
+        for i in range(keyframe_count):
+            (frame,) = _KEYFRAME.unpack_from(data, offset)
+            offset += _KEYFRAME.size
+            solution.keyframes.append((frame, data[offset : offset + HEADER_SIZE]))
+            offset += HEADER_SIZE
+        return solution
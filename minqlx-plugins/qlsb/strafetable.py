@@ -0,0 +1,332 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Tables of the optimal air strafe angle and the velocity yaw.
+
+The angle between the velocity and the optimal wishdir is
+acos(wishspeed * (1 - accel * frametime) / speed), which only depends on
+the ratio of the two speeds. One table over that ratio therefore covers
+every speed, wishspeed and accel, haste or not, PQL or VQL. It is built
+once when the controller is imported, with the plugin.
+
+The strafe yaw is that angle added to the yaw of the velocity, which
+needs an inverse trig function of its own. A second table of atan over
+[-1, 1] covers it: the velocity yaw is atan of the smaller of the x and
+the yz components over the larger, turned into the right quadrant.
+
+Both tables hold the value at the middle of each entry and are read
+without interpolating, which is fewer Python operations per frame than
+acos. Close to the ratio 1 the strafe angle is too steep for a table,
+those speeds (within about 1% of the minimum strafe speed) use acos
+directly.
+
+    python3 -m qlsb.strafetable [--samples n]
+
+checks the tables against acos for the physics modes and times the
+per-frame strafe yaw both ways.
+"""
+
+import argparse
+import math
+import random
+import time
+from array import array
+
+# table entries per unit of the speed ratio, at most 0.0031 deg off
+STRAFE_TABLE_RESOLUTION = 65536
+# ratios above this use acos
+STRAFE_TABLE_MAX_RATIO = 0.99
+# the yaw the tables may differ from acos by
+STRAFE_TABLE_TOLERANCE = 0.01  # deg
+# atan table entries per unit of tan, at most 0.0018 deg off
+YAW_TABLE_RESOLUTION = 16384
+
+
+class StrafeAngleTable:
+    def __init__(
+        self,
+        resolution=STRAFE_TABLE_RESOLUTION,
+        max_ratio=STRAFE_TABLE_MAX_RATIO,
+        yaw_resolution=YAW_TABLE_RESOLUTION,
+    ):
+        self.resolution = resolution
+        self.limit = max_ratio * resolution
+        # degrees, acos((i + 0.5) / resolution). Arrays, not lists: the
+        # doubles are contiguous instead of a float object each, which keeps
+        # more of the tables in the cache
+        self.angles = array(
+            "d",
+            (
+                math.degrees(math.acos((i + 0.5) / resolution))
+                for i in range(int(self.limit) + 1)
+            ),
+        )
+        self.yaw_resolution = yaw_resolution
+        # degrees, atan((i + 0.5 - yaw_resolution) / yaw_resolution),
+        # the last entry is only read for a tan of exactly 1
+        self.atan = array(
+            "d",
+            (
+                math.degrees(math.atan((i + 0.5 - yaw_resolution) / yaw_resolution))
+                for i in range(2 * yaw_resolution + 1)
+            ),
+        )
+
+    def angle(self, speed, wishspeed, accel, frametime):
+        """MathHelper.get_optimal_strafe_angle in degrees."""
+        return self.lookup(wishspeed, accel, frametime)(speed)
+
+    def lookup(self, wishspeed, accel, frametime):
+        """angle() for one wishspeed and accel as a function of speed,
+        with everything but the speed bound once.
+        """
+        num = wishspeed * (1.0 - accel * frametime)
+        scale = num * self.resolution
+        limit = self.limit
+        angles = self.angles
+        acos = math.acos
+        degrees = math.degrees
+        # int() of a float without the type call, which costs more than acos
+        trunc = float.__trunc__
+
+        def angle(speed):
+            if num >= speed:
+                return 0
+            x = scale / speed
+            if x < 0.0 or x >= limit:
+                return degrees(acos(num / speed))
+            return angles[trunc(x)]
+
+        return angle
+
+    def velocity_yaw(self):
+        """MathHelper.get_yaw from the atan table, as a function of the vector."""
+        res = float(self.yaw_resolution)
+        atan = self.atan
+        sqrt = math.sqrt
+        trunc = float.__trunc__
+
+        def velocity_yaw(v):
+            x, y, z = v
+            w = sqrt(y * y + z * z)
+            if x >= w:
+                yaw = atan[trunc(res * w / x + res)]
+            elif -x >= w:
+                yaw = 180.0 - atan[trunc(res * w / -x + res)]
+            else:
+                yaw = 90.0 - atan[trunc(res * x / w + res)]
+            if y < 0:
+                return -yaw
+            return yaw
+
+        return velocity_yaw
+
+    def strafe_yaw(self, wishspeed, accel, frametime):
+        """The yaw of the optimal diagonal air strafe as a function of
+        (velocity, 2d speed of it, right), with lookup() and velocity_yaw()
+        inlined.
+        """
+        num = wishspeed * (1.0 - accel * frametime)
+        scale = num * self.resolution
+        limit = self.limit
+        angles = self.angles
+        res = float(self.yaw_resolution)
+        atan = self.atan
+        acos = math.acos
+        degrees = math.degrees
+        sqrt = math.sqrt
+        trunc = float.__trunc__
+
+        def strafe_yaw(velocity, vel_len, right):
+            # speeds at or below num have x >= limit too
+            x = scale / vel_len
+            if 0.0 <= x < limit:
+                vel_to_optimal_yaw = angles[trunc(x)] - 45.0
+            elif num < vel_len:
+                vel_to_optimal_yaw = degrees(acos(num / vel_len)) - 45.0
+            else:
+                vel_to_optimal_yaw = 0.0
+            if right:
+                vel_to_optimal_yaw = -vel_to_optimal_yaw
+            # the angle of the velocity to the x axis, in 3d like get_yaw
+            vx, vy, vz = velocity
+            w = sqrt(vy * vy + vz * vz)
+            if vx >= w:
+                vel_yaw = atan[trunc(res * w / vx + res)]
+            elif -vx >= w:
+                vel_yaw = 180.0 - atan[trunc(res * w / -vx + res)]
+            else:
+                vel_yaw = 90.0 - atan[trunc(res * vx / w + res)]
+            if vy < 0:
+                return vel_to_optimal_yaw - vel_yaw
+            return vel_yaw + vel_to_optimal_yaw
+
+        return strafe_yaw
+
+
+def strafe_modes():
+    """(name, wishspeed, accel) of the diagonal air strafes the table must cover."""
+    from .controller import STRAFE_WISHSPEED, AIR_ACCEL
+    from .pmove import PQL, VQL, HASTE_FACTOR
+
+    modes = [("controller", STRAFE_WISHSPEED, AIR_ACCEL)]
+    for params in (PQL, VQL):
+        for haste in (False, True):
+            speed = params.speed * (HASTE_FACTOR if haste else 1.0)
+            name = params.name + (" haste" if haste else "")
+            modes.append((name, speed, params.air_accelerate))
+            if params.strafe_accelerate != params.air_accelerate:
+                modes.append(
+                    (
+                        name + " sidestrafe",
+                        min(speed, params.strafe_wishspeed),
+                        params.strafe_accelerate,
+                    )
+                )
+    return modes
+
+
+def main():
+    from .controller import Controller, Actions, AIR_ACCEL, FRAMETIME, STRAFE_TABLE
+    from .mathhelper import MathHelper
+
+    parser = argparse.ArgumentParser(description="qlsb strafe angle table check")
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    ok = True
+    print("max angle error vs acos:")
+    for name, wishspeed, accel in strafe_modes():
+        num = wishspeed * (1.0 - accel * FRAMETIME)
+        angle = STRAFE_TABLE.lookup(wishspeed, accel, FRAMETIME)
+        worst = 0.0
+        for i in range(args.samples):
+            # dense just above the minimum strafe speed, where it is steepest
+            speed = num * (1.0 + rng.random() ** 3 * 40.0)
+            exact = MathHelper.rad_to_deg(
+                MathHelper.get_optimal_strafe_angle(
+                    wishspeed, accel, [speed, 0.0, 0.0], FRAMETIME
+                )
+            )
+            err = abs(angle(speed) - exact)
+            worst = max(worst, err)
+        ok = ok and worst <= STRAFE_TABLE_TOLERANCE
+        print("  {:<20} {:.6f} deg".format(name, worst))
+
+    class State:
+        pass
+
+    states = []
+    for i in range(1000):
+        state = State()
+        yaw = rng.uniform(-math.pi, math.pi)
+        speed = rng.uniform(200.0, 2000.0)
+        state.velocity = [
+            speed * math.cos(yaw),
+            speed * math.sin(yaw),
+            rng.uniform(-400.0, 400.0),
+        ]
+        state.grounded = False
+        state.viewangles = [0.0, rng.uniform(-180.0, 180.0), 0.0]
+        state.delta_angles = [0.0, 0.0, 0.0]
+        states.append(state)
+    action = [Actions.LEFT_DIAG, 0.0, 0.0]
+
+    def exact_yaw(state):
+        # the strafe yaw as get_cmd computed it before the table,
+        # on the current (already faster) MathHelper
+        velocity = state.velocity
+        forward = MathHelper.get_forward(state.viewangles[1])
+        right = [forward[1], -forward[0], 0]
+        wishmove = Controller.get_wishmove(action[0], False)
+        wishvel = [0.0, 0.0, 0.0]
+        for i in range(3):
+            wishvel[i] = forward[i] * wishmove[0] + right[i] * wishmove[1]
+        wishspeed = MathHelper.vec2_len(wishvel)
+        angle = MathHelper.rad_to_deg(
+            MathHelper.get_optimal_strafe_angle(
+                wishspeed, AIR_ACCEL, velocity, FRAMETIME
+            )
+        )
+        if angle > 0:
+            angle -= 45.0
+        return MathHelper.get_yaw([velocity[0], velocity[1], velocity[2]]) + angle
+
+    def table_yaw(state):
+        velocity = state.velocity
+        return Controller.get_strafe_yaw(velocity, MathHelper.vec2_len(velocity), False)
+
+    worst = 0.0
+    for state in states:
+        for yaw in (table_yaw(state), Controller.get_cmd(action, state)["yaw"]):
+            worst = max(worst, abs(MathHelper.yaw_diff(yaw, exact_yaw(state))))
+    ok = ok and worst <= STRAFE_TABLE_TOLERANCE
+    print("max strafe yaw error: {:.6f} deg".format(worst))
+
+    velocity_yaw = STRAFE_TABLE.velocity_yaw()
+    worst = 0.0
+    for state in states:
+        v = state.velocity
+        # the axes and diagonals are the octant edges
+        for w in (v, [v[0], 0.0, 0.0], [0.0, v[1], 0.0], [v[0], v[0], v[2]]):
+            error = MathHelper.yaw_diff(velocity_yaw(w), MathHelper.get_yaw(w))
+            worst = max(worst, abs(error))
+    ok = ok and worst <= STRAFE_TABLE_TOLERANCE
+    print("max velocity yaw error: {:.6f} deg".format(worst))
+
+    def time_per_call(*benchmarks):
+        """us per call of each (function, argument tuples), the best of
+        runs taken in turns so a busy machine slows them all alike.
+        """
+        best = [math.inf] * len(benchmarks)
+        for i in range(15):
+            for j, (fn, calls) in enumerate(benchmarks):
+                start = time.perf_counter()
+                for args in calls:
+                    fn(*args)
+                best[j] = min(best[j], time.perf_counter() - start)
+        return [b / len(calls) * 1e6 for b, (fn, calls) in zip(best, benchmarks)]
+
+    exact_us, table_us, cmd_us = time_per_call(
+        (exact_yaw, [(state,) for state in states]),
+        # get_cmd calls it with the 2d speed it has for the jump check
+        (
+            Controller.get_strafe_yaw,
+            [
+                (state.velocity, MathHelper.vec2_len(state.velocity), False)
+                for state in states
+            ],
+        ),
+        (Controller.get_cmd, [(action, state) for state in states]),
+    )
+    print("strafe yaw, acos:  {:.2f} us/frame".format(exact_us))
+    print(
+        "strafe yaw, table: {:.2f} us/frame ({:.1f}x)".format(
+            table_us, exact_us / table_us
+        )
+    )
+    print("get_cmd:           {:.2f} us/frame".format(cmd_us))
+    if not ok:
+        raise SystemExit("table exceeds {} deg".format(STRAFE_TABLE_TOLERANCE))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Solver progress published over zmq, for watching many solving servers at once.
+
+Every solving server connects a PUB socket to the address of one
+TelemetryAggregator (python3 -m qlsb.telemetry, see main()), which binds a
+SUB socket and keeps the latest message of each server. Messages are sent
+at most every interval seconds, in between the solver only pays for a
+clock read. PUB drops messages nobody is listening for, so a server never
+waits on the aggregator.
+
+Message: [b"qlsb", json {"source", "seq", "time", "rollouts_per_sec", ...}]
+the other fields are whatever the server publishes, see bot_test.
+"""
+
+import argparse
+import json
+import time
+
+import zmq
+
+TELEMETRY_TOPIC = b"qlsb"
+TELEMETRY_ADDRESS = "tcp://127.0.0.1:27972"
+# seconds between messages of a server
+TELEMETRY_INTERVAL = 1.0
+# a server that hasn't sent anything for this long is shown as stale
+TELEMETRY_STALE = 10.0
+# messages queued for a slow aggregator before PUB drops them
+TELEMETRY_HWM = 16
+
+
+class TelemetryPublisher:
+    """Publishes the fields of a solving server, rate limited by due()."""
+
+    def __init__(self, address, source, interval=TELEMETRY_INTERVAL, context=None):
+        self.context = context or zmq.Context.instance()
+        self.socket = self.context.socket(zmq.PUB)
+        self.socket.setsockopt(zmq.SNDHWM, TELEMETRY_HWM)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(address)
+        self.source = source
+        self.interval = interval
+        self.seq = 0
+        self.last_time = 0.0
+        self.last_rollouts = 0
+
+    def due(self, now=None):
+        """True once interval seconds have passed since the last message,
+        check this before gathering the fields.
+        """
+        return (time.time() if now is None else now) - self.last_time >= self.interval
+
+    def publish(self, fields, now=None):
+        """Send fields, their "rollouts" count is turned into rollouts_per_sec
+        since the previous message.
+        """
+        now = time.time() if now is None else now
+        rollouts = fields.get("rollouts", 0)
+        if rollouts < self.last_rollouts:
+            # a new solve started counting from 0
+            self.last_rollouts = 0
+        rate = 0.0
+        if self.last_time > 0.0 and now > self.last_time:
+            rate = (rollouts - self.last_rollouts) / (now - self.last_time)
+        self.seq += 1
+        message = dict(fields)
+        message["source"] = self.source
+        message["seq"] = self.seq
+        message["time"] = now
+        message["rollouts_per_sec"] = rate
+        self.last_time = now
+        self.last_rollouts = rollouts
+        try:
+            self.socket.send_multipart(
+                [TELEMETRY_TOPIC, json.dumps(message).encode()], zmq.NOBLOCK
+            )
+        except zmq.Again:
+            pass
+
+    def close(self):
+        self.socket.close(linger=0)
+
+
+class TelemetryAggregator:
+    """Keeps the latest message of every server publishing to address."""
+
+    def __init__(self, address, stale=TELEMETRY_STALE, context=None):
+        self.context = context or zmq.Context.instance()
+        self.socket = self.context.socket(zmq.SUB)
+        self.socket.setsockopt(zmq.SUBSCRIBE, TELEMETRY_TOPIC)
+        self.socket.bind(address)
+        self.stale = stale
+        # source -> [receive time, message]
+        self.sources = {}
+        self.received = 0
+        # gaps in the seq of a source, messages PUB or the network dropped
+        self.dropped = 0
+
+    def poll(self, timeout=0):
+        """Take every waiting message, waits up to timeout seconds for the first
+        one. Returns how many were taken.
+        """
+        count = 0
+        while self.socket.poll(timeout * 1000) != 0:
+            topic, message = self.socket.recv_multipart()
+            self.add(json.loads(message.decode()))
+            count += 1
+            timeout = 0
+        return count
+
+    def add(self, message, now=None):
+        now = time.time() if now is None else now
+        last = self.sources.get(message["source"])
+        if last is not None and message["seq"] > last[1]["seq"] + 1:
+            self.dropped += message["seq"] - last[1]["seq"] - 1
+        self.sources[message["source"]] = [now, message]
+        self.received += 1
+
+    def active(self, now=None):
+        now = time.time() if now is None else now
+        return [
+            message
+            for received, message in self.sources.values()
+            if now - received < self.stale
+        ]
+
+    def totals(self, now=None):
+        active = self.active(now)
+        return {
+            "sources": len(self.sources),
+            "active": len(active),
+            "solving": sum(1 for m in active if m.get("state") == "solving"),
+            "rollouts_per_sec": sum(m.get("rollouts_per_sec", 0.0) for m in active),
+            "overruns": sum(m.get("overruns", 0) for m in active),
+        }
+
+    def report(self, now=None):
+        now = time.time() if now is None else now
+        lines = [
+            "{:<24} {:<8} {:<16} {:>7} {:>12} {:>6} {:>10} {:>8}".format(
+                "source",
+                "state",
+                "route",
+                "history",
+                "best reward",
+                "speed",
+                "rollouts/s",
+                "overruns",
+            )
+        ]
+        for source in sorted(self.sources):
+            received, m = self.sources[source]
+            lines.append(
+                "{:<24} {:<8} {:<16} {:>7} {:>12.1f} {:>6.0f} {:>10.0f} {:>8}".format(
+                    source[:24],
+                    "stale" if now - received >= self.stale else m.get("state", ""),
+                    m.get("route", "")[:16],
+                    m.get("history", 0),
+                    m.get("best_reward", 0.0),
+                    m.get("speed", 0.0),
+                    m.get("rollouts_per_sec", 0.0),
+                    m.get("overruns", 0),
+                )
+            )
+        totals = self.totals(now)
+        lines.append(
+            "{} of {} servers active, {} solving, {:.0f} rollouts/s, "
+            "{} overruns, {} messages dropped".format(
+                totals["active"],
+                totals["sources"],
+                totals["solving"],
+                totals["rollouts_per_sec"],
+                totals["overruns"],
+                self.dropped,
+            )
+        )
+        return lines
+
+    def close(self):
+        self.socket.close(linger=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qlsb solver telemetry aggregator")
+    parser.add_argument(
+        "--address",
+        default=TELEMETRY_ADDRESS,
+        help="address the servers publish to, their qlx_solverTelemetry",
+    )
+    parser.add_argument(
+        "--refresh", type=float, default=TELEMETRY_INTERVAL, help="seconds"
+    )
+    parser.add_argument("--stale", type=float, default=TELEMETRY_STALE, help="seconds")
+    args = parser.parse_args()
+
+    aggregator = TelemetryAggregator(args.address, args.stale)
+    print("listening on {}".format(args.address))
+    try:
+        while True:
+            deadline = time.time() + args.refresh
+            while time.time() < deadline:
+                # a negative timeout would wait forever
+                aggregator.poll(max(0.0, deadline - time.time()))
+            print("\n".join(aggregator.report()) + "\n")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("received {} messages".format(aggregator.received))
+        aggregator.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Copyright (C) 2022 nullprop
+
+# This file is part of minqlx.
+
+# minqlx is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# minqlx is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with minqlx. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Bounded LRU cache of rollout results.
+
+Beam search re-expands states it already rolled out the previous decision
+(the committed node's subtree), and re-running a solve from the same history
+tries the same actions again. Keys are quantized so float noise doesn't
+turn identical states into misses.
+"""
+
+from collections import OrderedDict
+
+# grid the key is snapped to
+POSITION_QUANTUM = 0.125  # units
+VELOCITY_QUANTUM = 1.0  # ups, the engine snaps velocity to integers anyway
+YAW_QUANTUM = 360.0 / 65536.0  # SHORT2ANGLE(1)
+
+TRANSPOSITION_TABLE_SIZE = 16384
+
+
+class TranspositionTable:
+    """Maps (quantized state, action, frames) to (end state, position, velocity, reward)."""
+
+    def __init__(self, capacity=TRANSPOSITION_TABLE_SIZE):
+        self.capacity = max(1, capacity)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(
+        position, velocity, yaw, grounded, jump_time, double_jumped, action, frames
+    ):
+        # jump_time and double_jumped decide whether the next jump is a
+        # double jump, states that only differ in them don't transpose
+        return (
+            frames,
+            int(action[0]),
+            round(action[1], 3),
+            not (len(action) >= 4 and action[3] == False),
+            round(position[0] / POSITION_QUANTUM),
+            round(position[1] / POSITION_QUANTUM),
+            round(position[2] / POSITION_QUANTUM),
+            round(velocity[0] / VELOCITY_QUANTUM),
+            round(velocity[1] / VELOCITY_QUANTUM),
+            round(velocity[2] / VELOCITY_QUANTUM),
+            round((yaw % 360.0) / YAW_QUANTUM),
+            bool(grounded),
+            int(jump_time),
+            bool(double_jumped),
+        )
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, state, position, velocity, reward):
+        self.entries[key] = (state, position, velocity, reward)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self):
+        return "{}/{} entries, {} hits, {} misses ({:.1f}%), {} evictions".format(
+            len(self.entries),
+            self.capacity,
+            self.hits,
+            self.misses,
+            100.0 * self.hit_rate(),
+            self.evictions,
+        )
@@ -86,7 +86,7 @@ class race(minqlx.Plugin):
 
         self.move_player = {}  # Queued !goto/!loadto positions. {steam_id: position}
         self.goto = {}  # Players which have used !goto/!loadpos. {steam_id: score}
-        self.savepos = {}  # Saved player positions. {steam_id: player.state.position}
+        self.savepos = {}  # Saved player positions. {steam_id: minqlx.Vector3}
         self.frame = {}  # The frame when player used !timer. {steam_id: frame}
         self.current_frame = 0  # Number of frames the map has been playing for.
         self.lagged = {}
@@ -722,22 +722,28 @@ class race(minqlx.Plugin):
         elif len(msg) != 2:
             return minqlx.RET_USAGE
 
+        try:
+            position = self.player_position(target_player)
+        except minqlx.NonexistentPlayerError:
+            player.tell("Invalid ID.")
+            return minqlx.RET_STOP_ALL
+
         if player.team == "spectator":
             if 'spec_delay' in self.plugins and player.steam_id in self.plugins['spec_delay'].spec_delays:
                 player.tell("^6You must wait 15 seconds before joining after spectating")
                 return minqlx.RET_STOP_ALL
 
-            self.move_player[player.steam_id] = target_player.state.position
+            self.move_player[player.steam_id] = position
             player.team = "free"
         else:
-            self.move_player[player.steam_id] = target_player.state.position
+            self.move_player[player.steam_id] = position
             minqlx.player_spawn(player.id)  # respawn player so he can't cheat
 
     def cmd_savepos(self, player, msg, channel):
         """Saves current position."""
         if player.team != "spectator":
             # add player to savepos dict
-            self.savepos[player.steam_id] = player.state.position
+            self.savepos[player.steam_id] = self.player_position(player)
             player.tell("^6Position saved. Your time won't count if you use !loadpos, unless you kill yourself.")
         else:
             player.tell("Can't save position as spectator.")
@@ -924,6 +930,17 @@ class race(minqlx.Plugin):
         s = str(s).zfill(2)
         return "{}:{}.{}".format(m, s, ms)
 
+    @staticmethod
+    def player_position(player):
+        """Returns player position without building their whole player_state.
+
+        :raises: minqlx.NonexistentPlayerError
+        """
+        kinematics = minqlx.player_kinematics(player.id)
+        if kinematics is None:
+            raise minqlx.NonexistentPlayerError("The player does not exist anymore.")
+        return minqlx.Vector3(kinematics[:3])
+
 
 class RaceRecords:
     """Race records object. Gets records using QLRace.com API."""
@@ -5,6 +5,7 @@
 #include <string.h>
 #include <errno.h>
 #include <stdio.h>
+#include <math.h>
 
 #include "pyminqlx.h"
 #include "quake_common.h"
@@ -346,6 +347,26 @@ static PyObject* PyMinqlx_GetUserinfo(PyObject* self, PyObject* args) {
  * ================================================================
 */
 
+static void RunClientCmd(int client_id, usercmd_t* cmd, int run_frame) {
+    // Needed to avoid timeout
+    svs->clients[client_id].lastPacketTime = svs->time;
+    svs->clients[client_id]._unknownTime = svs->time; // TODO needed?
+
+    // Bots call ClientThink_real in G_RunClient,
+    // just need to set pers.cmd.
+    if (g_entities[client_id].r.svFlags & SVF_BOT) {
+        g_entities[client_id].client->pers.cmd = *cmd;
+    } else {
+        My_SV_ClientThink(&svs->clients[client_id], cmd);
+    }
+
+    // Force a new frame so bot action is instant
+    if (run_frame > 0) {
+        svs->time += run_frame;
+        G_RunFrame(svs->time);
+    }
+}
+
 static PyObject *PyMinqlx_ClientThink(PyObject *self, PyObject *args)
 {
     int client_id;
@@ -389,25 +410,452 @@ static PyObject *PyMinqlx_ClientThink(PyObject *self, PyObject *args)
         .upmove = (char)PyLong_AsLong(PyDict_GetItemString(obj, "upmove")),
     };
 
-    // Needed to avoid timeout
-    svs->clients[client_id].lastPacketTime = svs->time;
-    svs->clients[client_id]._unknownTime = svs->time; // TODO needed?
+    RunClientCmd(client_id, &cmd, run_frame);
 
-    // Bots call ClientThink_real in G_RunClient,
-    // just need to set pers.cmd.
-    if (g_entities[client_id].r.svFlags & SVF_BOT) {
-        g_entities[client_id].client->pers.cmd = cmd;
-    } else {
-        My_SV_ClientThink(&svs->clients[client_id], &cmd);
+    Py_RETURN_TRUE;
+}
+
+/*
+ * ================================================================
+ *                        simulate_actions
+ * ================================================================
+ */
+
+// Same values as qlsb/controller.py.
+#define BOT_ACTION_LEFT_DIAG 0
+#define BOT_ACTION_RIGHT_DIAG 1
+#define BOT_ACTION_LEFT 2
+#define BOT_ACTION_RIGHT 3
+#define BOT_FRAMETIME (1.0 / 125.0)
+#define BOT_MAX_GROUND_SPEED 320.0
+#define BOT_AIR_ACCEL 1.0
+#define BOT_WISHMOVE_SPEED 127
+#define BOT_TURN_SNAP_ANGLE 5.0
+#define BOT_RUN_FRAME 8
+#define BOT_RAD_TO_DEG (180.0 / M_PI)
+// Same values as qlsb/strafetable.py.
+#define BOT_STRAFE_TABLE_RESOLUTION 65536
+#define BOT_STRAFE_TABLE_MAX_RATIO 0.99
+// (int)(BOT_STRAFE_TABLE_MAX_RATIO * BOT_STRAFE_TABLE_RESOLUTION) + 1
+#define BOT_STRAFE_TABLE_SIZE 64881
+#define BOT_YAW_TABLE_RESOLUTION 16384
+#define BOT_YAW_TABLE_SIZE (2 * BOT_YAW_TABLE_RESOLUTION + 1)
+
+static double WrapYaw(double yaw) {
+    while (yaw > 180.0)
+        yaw -= 360.0;
+    while (yaw < -180.0)
+        yaw += 360.0;
+    return yaw;
+}
+
+// MathHelper.yaw_diff
+static double YawDiff(double a, double b) {
+    double d = (a + 180.0) - (b + 180.0);
+    while (d > 180.0)
+        d -= 360.0;
+    while (d < -180.0)
+        d += 360.0;
+    return d;
+}
+
+/*
+ * The tables of StrafeAngleTable in qlsb/strafetable.py, built and read with
+ * the same operations in the same order, so engine rollouts aim exactly like
+ * Controller.get_cmd.
+ */
+static double strafe_table[BOT_STRAFE_TABLE_SIZE];
+static double yaw_table[BOT_YAW_TABLE_SIZE];
+static int strafe_table_built = 0;
+
+static void BuildStrafeTable(void) {
+    for (int i = 0; i < BOT_STRAFE_TABLE_SIZE; i++)
+        strafe_table[i] = acos((i + 0.5) / BOT_STRAFE_TABLE_RESOLUTION) * BOT_RAD_TO_DEG;
+    for (int i = 0; i < BOT_YAW_TABLE_SIZE; i++)
+        yaw_table[i] = atan((i + 0.5 - BOT_YAW_TABLE_RESOLUTION) / BOT_YAW_TABLE_RESOLUTION) * BOT_RAD_TO_DEG;
+    strafe_table_built = 1;
+}
+
+// The angle of v to the x axis in 3d, from the atan table
+static double VelocityAngle(const vec3_t v) {
+    double res = BOT_YAW_TABLE_RESOLUTION;
+    double x = v[0], y = v[1], z = v[2];
+    double w = sqrt(y * y + z * z);
+
+    if (!strafe_table_built)
+        BuildStrafeTable();
+    if (x >= w)
+        return yaw_table[(int)(res * w / x + res)];
+    if (-x >= w)
+        return 180.0 - yaw_table[(int)(res * w / -x + res)];
+    return 90.0 - yaw_table[(int)(res * x / w + res)];
+}
+
+// StrafeAngleTable.velocity_yaw, MathHelper.get_yaw from the atan table
+static double VelocityYaw(const vec3_t v) {
+    double yaw = VelocityAngle(v);
+    return v[1] < 0 ? -yaw : yaw;
+}
+
+// Controller.get_strafe_yaw (StrafeAngleTable.strafe_yaw), vel_len is the 2d speed
+static double StrafeYaw(const vec3_t velocity, double vel_len, int right) {
+    double num = sqrt(2.0) * BOT_WISHMOVE_SPEED * (1.0 - BOT_AIR_ACCEL * BOT_FRAMETIME);
+    double scale = num * BOT_STRAFE_TABLE_RESOLUTION;
+    double limit = BOT_STRAFE_TABLE_MAX_RATIO * BOT_STRAFE_TABLE_RESOLUTION;
+    double x = scale / vel_len;
+    double vel_to_optimal_yaw, vel_yaw;
+
+    if (!strafe_table_built)
+        BuildStrafeTable();
+    if (0.0 <= x && x < limit)
+        vel_to_optimal_yaw = strafe_table[(int)x] - 45.0;
+    else if (num < vel_len)
+        vel_to_optimal_yaw = acos(num / vel_len) * BOT_RAD_TO_DEG - 45.0;
+    else
+        vel_to_optimal_yaw = 0.0;
+    if (right)
+        vel_to_optimal_yaw = -vel_to_optimal_yaw;
+    vel_yaw = VelocityAngle(velocity);
+    if (velocity[1] < 0)
+        return vel_to_optimal_yaw - vel_yaw;
+    return vel_yaw + vel_to_optimal_yaw;
+}
+
+/*
+ * The closed-loop part of StrafeBot.run_action (Controller.get_cmd in
+ * qlsb/controller.py): the aim depends on the velocity on every frame,
+ * so it can't be precomputed by the caller. Keep the two in sync.
+ */
+static void StrafeBotCmd(gclient_t* client, int action, double turn_rate, int allow_jump, usercmd_t* cmd) {
+    float* velocity = client->ps.velocity;
+    // in double like Controller.get_cmd, float products would round differently
+    double vx = velocity[0], vy = velocity[1];
+    double vel_len = sqrt(vx * vx + vy * vy);
+    int grounded = client->ps.groundEntityNum != ENTITYNUM_NONE;
+    int moving = action >= BOT_ACTION_LEFT_DIAG && action <= BOT_ACTION_RIGHT;
+    int jump = grounded && vel_len > BOT_MAX_GROUND_SPEED && moving && allow_jump;
+    double current_yaw = client->ps.viewangles[1];
+    double new_yaw = current_yaw;
+    int wish_action = action;
+
+    // jump will walkmove for 1 frame, see Controller.get_cmd
+    if (jump)
+        grounded = 0;
+
+    if (grounded) {
+        if (action == BOT_ACTION_LEFT) {
+            wish_action = BOT_ACTION_LEFT_DIAG;
+            new_yaw += turn_rate * BOT_FRAMETIME;
+        }
+        else if (action == BOT_ACTION_RIGHT) {
+            wish_action = BOT_ACTION_RIGHT_DIAG;
+            new_yaw -= turn_rate * BOT_FRAMETIME;
+        }
+    }
+    else if (action == BOT_ACTION_LEFT_DIAG || action == BOT_ACTION_RIGHT_DIAG) {
+        if (vel_len > 0.1)
+            new_yaw = StrafeYaw(velocity, vel_len, action == BOT_ACTION_RIGHT_DIAG);
+    }
+    else if (action == BOT_ACTION_LEFT || action == BOT_ACTION_RIGHT) {
+        if (vel_len > 0.1) {
+            double yaw_change = turn_rate * BOT_FRAMETIME;
+            double vel_yaw = VelocityYaw(velocity);
+            if (action == BOT_ACTION_RIGHT)
+                yaw_change = -yaw_change;
+            if (fabs(YawDiff(new_yaw, vel_yaw)) > BOT_TURN_SNAP_ANGLE)
+                new_yaw = vel_yaw;
+            new_yaw += yaw_change;
+        }
     }
 
-    // Force a new frame so bot action is instant
-    if (run_frame > 0) {
-        svs->time += run_frame;
+    // delta required here for bot
+    new_yaw = WrapYaw(new_yaw - SHORT2ANGLE(client->ps.delta_angles[1]));
+
+    memset(cmd, 0, sizeof(usercmd_t));
+    cmd->serverTime = svs->time;
+    cmd->angles[1] = ANGLE2SHORT(new_yaw);
+    cmd->weapon = 5;
+    cmd->weaponPrimary = 5;
+    cmd->fov = 100;
+    switch (wish_action) {
+        case BOT_ACTION_LEFT_DIAG:
+            cmd->forwardmove = BOT_WISHMOVE_SPEED;
+            cmd->rightmove = -BOT_WISHMOVE_SPEED;
+            break;
+        case BOT_ACTION_RIGHT_DIAG:
+            cmd->forwardmove = BOT_WISHMOVE_SPEED;
+            cmd->rightmove = BOT_WISHMOVE_SPEED;
+            break;
+        case BOT_ACTION_LEFT:
+            cmd->rightmove = -BOT_WISHMOVE_SPEED;
+            break;
+        case BOT_ACTION_RIGHT:
+            cmd->rightmove = BOT_WISHMOVE_SPEED;
+            break;
+    }
+    if (jump)
+        cmd->upmove = BOT_WISHMOVE_SPEED;
+}
+
+static PyObject* MakeKinematicsTuple(gclient_t* client) {
+    playerState_t* ps = &client->ps;
+    return Py_BuildValue("((ddd)(ddd)(ddd)Ni)",
+        ps->origin[0], ps->origin[1], ps->origin[2],
+        ps->velocity[0], ps->velocity[1], ps->velocity[2],
+        ps->viewangles[0], ps->viewangles[1], ps->viewangles[2],
+        PyBool_FromLong(ps->groundEntityNum != ENTITYNUM_NONE),
+        ps->groundEntityNum);
+}
+
+static int CheckPlayerSnapshot(Py_buffer* blob);
+static int RestorePlayerSnapshot(int client_id, Py_buffer* blob);
+
+/*
+ * Builds the usercmd for step i of simulate_actions or simulate_branches,
+ * the StrafeBot action form depends on the client's current state.
+ * With a NULL cmd the step is only checked.
+ */
+static int ParseBotStep(PyObject* step, gclient_t* client, Py_ssize_t i, usercmd_t* cmd) {
+    int action, allow_jump;
+    double turn_rate;
+    float pitch, yaw, roll;
+    int buttons, weapon, weapon_primary, fov, forwardmove, rightmove, upmove;
+
+    if (PyTuple_Check(step) && PyTuple_GET_SIZE(step) == 3) {
+        if (!PyArg_ParseTuple(step, "idp:simulate_actions", &action, &turn_rate, &allow_jump))
+            return 0;
+        if (cmd)
+            StrafeBotCmd(client, action, turn_rate, allow_jump, cmd);
+    }
+    else if (PyTuple_Check(step) && PyTuple_GET_SIZE(step) == 10) {
+        if (!PyArg_ParseTuple(step, "fffiiiiiii:simulate_actions", &pitch, &yaw, &roll,
+                &buttons, &weapon, &weapon_primary, &fov, &forwardmove, &rightmove, &upmove))
+            return 0;
+        if (!cmd)
+            return 1;
+        *cmd = (usercmd_t){
+            .serverTime = svs->time,
+            .angles[0] = ANGLE2SHORT(pitch),
+            .angles[1] = ANGLE2SHORT(yaw),
+            .angles[2] = ANGLE2SHORT(roll),
+            .buttons = buttons,
+            .weapon = (byte)weapon,
+            .weaponPrimary = (byte)weapon_primary,
+            .fov = (byte)fov,
+            .forwardmove = (char)forwardmove,
+            .rightmove = (char)rightmove,
+            .upmove = (char)upmove,
+        };
+    }
+    else {
+        PyErr_Format(PyExc_ValueError, "Step %d must be a tuple of 3 or 10 items.", (int)i);
+        return 0;
+    }
+    return 1;
+}
+
+/*
+ * Restores the snapshot (unless it's None), then runs all the steps back-to-back
+ * with a G_RunFrame for each, like client_think(client_id, cmd, 8) would.
+ *
+ * A step is either a usercmd as a tuple of
+ * (pitch, yaw, roll, buttons, weapon, weapon_primary, fov, forwardmove, rightmove, upmove),
+ * or a StrafeBot action as (action, turn_rate, allow_jump).
+ *
+ * Returns (origin, velocity, viewangles, grounded, ground_entity) after the last
+ * step, or a list of them for every step if all_steps is true.
+ */
+static PyObject* PyMinqlx_SimulateActions(PyObject* self, PyObject* args) {
+    int client_id, all_steps = 0;
+    PyObject *snapshot, *steps;
+    Py_buffer blob;
+
+    if (!PyArg_ParseTuple(args, "iOO|p:simulate_actions", &client_id, &snapshot, &steps, &all_steps))
+        return NULL;
+    else if (client_id < 0 || client_id >= sv_maxclients->integer) {
+        PyErr_Format(PyExc_ValueError,
+                     "client_id needs to be a number from 0 to %d.",
+                     sv_maxclients->integer);
+        return NULL;
+    }
+    else if (svs->clients[client_id].state == CS_FREE || !g_entities[client_id].client) {
+        DebugPrint("WARNING: PyMinqlx_SimulateActions called for CS_FREE client %d.\n", client_id);
+        Py_RETURN_NONE;
+    }
+
+    if (snapshot != Py_None) {
+        if (PyObject_GetBuffer(snapshot, &blob, PyBUF_SIMPLE) == -1)
+            return NULL;
+        int ok = RestorePlayerSnapshot(client_id, &blob);
+        PyBuffer_Release(&blob);
+        if (!ok)
+            return NULL;
+    }
+
+    PyObject* seq = PySequence_Fast(steps, "steps must be a sequence.");
+    if (!seq)
+        return NULL;
+
+    Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+    PyObject* ret = all_steps ? PyList_New(count) : NULL;
+    if (all_steps && !ret) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+
+    gclient_t* client = g_entities[client_id].client;
+    usercmd_t cmd;
+    for (Py_ssize_t i = 0; i < count; i++) {
+        if (!ParseBotStep(PySequence_Fast_GET_ITEM(seq, i), client, i, &cmd))
+            goto error;
+
+        RunClientCmd(client_id, &cmd, BOT_RUN_FRAME);
+
+        if (all_steps)
+            PyList_SET_ITEM(ret, i, MakeKinematicsTuple(client));
+    }
+
+    Py_DECREF(seq);
+    if (all_steps)
+        return ret;
+    return MakeKinematicsTuple(client);
+
+error:
+    Py_DECREF(seq);
+    Py_XDECREF(ret);
+    return NULL;
+}
+
+/*
+ * ================================================================
+ *                        simulate_branches
+ * ================================================================
+ */
+
+/*
+ * simulate_actions for several bots at once: restores snapshots[k] into
+ * client_ids[k], then runs the steps frame by frame, setting every bot's
+ * command before a single G_RunFrame. One server frame advances all of
+ * them, so K rollouts cost about as many G_RunFrames as one.
+ *
+ * Every argument is checked before the first snapshot is restored, so on
+ * an error no bot has moved. The bots are made non-solid (and stay that
+ * way): they are usually restored to the same origin, and the ones parked
+ * where their last branch ended would block the next rollouts.
+ *
+ * All the bots need the same number of steps.
+ * Returns a list of (origin, velocity, viewangles, grounded, ground_entity),
+ * one for each bot after its last step.
+ */
+static PyObject* PyMinqlx_SimulateBranches(PyObject* self, PyObject* args) {
+    PyObject *ids_arg, *snapshots_arg, *steps_arg;
+    PyObject *ids = NULL, *snapshots = NULL, *steps = NULL, *ret = NULL;
+    PyObject* branches[MAX_CLIENTS] = {0};
+    Py_buffer blobs[MAX_CLIENTS];
+    int has_blob[MAX_CLIENTS] = {0};
+    int client_ids[MAX_CLIENTS];
+    int used[MAX_CLIENTS] = {0};
+    Py_ssize_t count = 0, frames = 0;
+    usercmd_t cmd;
+
+    if (!PyArg_ParseTuple(args, "OOO:simulate_branches", &ids_arg, &snapshots_arg, &steps_arg))
+        return NULL;
+
+    ids = PySequence_Fast(ids_arg, "client_ids must be a sequence.");
+    snapshots = PySequence_Fast(snapshots_arg, "snapshots must be a sequence.");
+    steps = PySequence_Fast(steps_arg, "steps must be a sequence.");
+    if (!ids || !snapshots || !steps)
+        goto done;
+
+    count = PySequence_Fast_GET_SIZE(ids);
+    if (count > MAX_CLIENTS || PySequence_Fast_GET_SIZE(snapshots) != count
+            || PySequence_Fast_GET_SIZE(steps) != count) {
+        PyErr_Format(PyExc_ValueError,
+                     "Expected the same number of client_ids, snapshots and steps, at most %d.",
+                     MAX_CLIENTS);
+        goto done;
+    }
+
+    for (Py_ssize_t k = 0; k < count; k++) {
+        int client_id = (int)PyLong_AsLong(PySequence_Fast_GET_ITEM(ids, k));
+        if (PyErr_Occurred())
+            goto done;
+        if (client_id < 0 || client_id >= sv_maxclients->integer) {
+            PyErr_Format(PyExc_ValueError,
+                         "client_id needs to be a number from 0 to %d.",
+                         sv_maxclients->integer);
+            goto done;
+        }
+        if (svs->clients[client_id].state == CS_FREE || !g_entities[client_id].client
+                || !(g_entities[client_id].r.svFlags & SVF_BOT)) {
+            PyErr_Format(PyExc_ValueError, "Client %d is not a bot.", client_id);
+            goto done;
+        }
+        if (used[client_id]) {
+            PyErr_Format(PyExc_ValueError, "Client %d is given more than once.", client_id);
+            goto done;
+        }
+        used[client_id] = 1;
+        client_ids[k] = client_id;
+
+        branches[k] = PySequence_Fast(PySequence_Fast_GET_ITEM(steps, k), "steps must be sequences.");
+        if (!branches[k])
+            goto done;
+        if (k == 0)
+            frames = PySequence_Fast_GET_SIZE(branches[k]);
+        else if (PySequence_Fast_GET_SIZE(branches[k]) != frames) {
+            PyErr_Format(PyExc_ValueError, "Every bot needs the same number of steps.");
+            goto done;
+        }
+        for (Py_ssize_t i = 0; i < frames; i++) {
+            if (!ParseBotStep(PySequence_Fast_GET_ITEM(branches[k], i), NULL, i, NULL))
+                goto done;
+        }
+
+        PyObject* snapshot = PySequence_Fast_GET_ITEM(snapshots, k);
+        if (snapshot != Py_None) {
+            if (PyObject_GetBuffer(snapshot, &blobs[k], PyBUF_SIMPLE) == -1)
+                goto done;
+            has_blob[k] = 1;
+            if (!CheckPlayerSnapshot(&blobs[k]))
+                goto done;
+        }
+    }
+
+    // nothing can fail from here on until the results are built
+    for (Py_ssize_t k = 0; k < count; k++) {
+        if (has_blob[k])
+            RestorePlayerSnapshot(client_ids[k], &blobs[k]);
+        g_entities[client_ids[k]].r.contents = 0;
+    }
+
+    for (Py_ssize_t i = 0; i < frames; i++) {
+        for (Py_ssize_t k = 0; k < count; k++) {
+            ParseBotStep(PySequence_Fast_GET_ITEM(branches[k], i),
+                g_entities[client_ids[k]].client, i, &cmd);
+            RunClientCmd(client_ids[k], &cmd, 0);
+        }
+        svs->time += BOT_RUN_FRAME;
         G_RunFrame(svs->time);
     }
-    
-    Py_RETURN_TRUE;
+
+    ret = PyList_New(count);
+    if (!ret)
+        goto done;
+    for (Py_ssize_t k = 0; k < count; k++)
+        PyList_SET_ITEM(ret, k, MakeKinematicsTuple(g_entities[client_ids[k]].client));
+
+done:
+    for (Py_ssize_t k = 0; k < count; k++) {
+        if (has_blob[k])
+            PyBuffer_Release(&blobs[k]);
+    }
+    for (Py_ssize_t k = 0; k < MAX_CLIENTS; k++)
+        Py_XDECREF(branches[k]);
+    Py_XDECREF(ids);
+    Py_XDECREF(snapshots);
+    Py_XDECREF(steps);
+    return ret;
 }
 
 /*
@@ -1003,6 +1451,78 @@ static PyObject* PyMinqlx_PlayerState(PyObject* self, PyObject* args) {
     return state;
 }
 
+/*
+ * ================================================================
+ *                        player_kinematics
+ * ================================================================
+ */
+
+#define PLAYER_KINEMATICS_SIZE 16
+
+/*
+ * The part of player_state a bot reads every frame, without building the
+ * whole struct sequence. Returns a flat tuple of
+ * (origin x, y, z, velocity x, y, z, viewangles pitch, yaw, roll,
+ * delta_angles pitch, yaw, roll, grounded, ground_entity, jump_time, double_jumped),
+ * delta_angles in degrees like player_state.
+ *
+ * If a writable buffer of at least 16 doubles is passed (array("d", [0.0]) * 16),
+ * the same values are written into it instead and nothing is allocated.
+ */
+static PyObject* PyMinqlx_PlayerKinematics(PyObject* self, PyObject* args) {
+    int client_id;
+    PyObject* out = Py_None;
+
+    if (!PyArg_ParseTuple(args, "i|O:player_kinematics", &client_id, &out))
+        return NULL;
+    else if (client_id < 0 || client_id >= sv_maxclients->integer) {
+        PyErr_Format(PyExc_ValueError,
+                     "client_id needs to be a number from 0 to %d.",
+                     sv_maxclients->integer);
+        return NULL;
+    }
+    else if (!g_entities[client_id].client)
+        Py_RETURN_NONE;
+
+    playerState_t* ps = &g_entities[client_id].client->ps;
+
+    if (out != Py_None) {
+        Py_buffer buf;
+        if (PyObject_GetBuffer(out, &buf, PyBUF_WRITABLE | PyBUF_FORMAT) == -1)
+            return NULL;
+        if (buf.itemsize != sizeof(double) || (buf.format && strcmp(buf.format, "d") != 0)
+                || buf.len < (Py_ssize_t)(PLAYER_KINEMATICS_SIZE * sizeof(double))) {
+            PyBuffer_Release(&buf);
+            PyErr_Format(PyExc_ValueError,
+                         "The buffer needs to hold at least %d doubles.",
+                         PLAYER_KINEMATICS_SIZE);
+            return NULL;
+        }
+        double* d = (double*)buf.buf;
+        for (int i = 0; i < 3; i++) {
+            d[i] = ps->origin[i];
+            d[3 + i] = ps->velocity[i];
+            d[6 + i] = ps->viewangles[i];
+            d[9 + i] = SHORT2ANGLE(ps->delta_angles[i]);
+        }
+        d[12] = ps->groundEntityNum != ENTITYNUM_NONE;
+        d[13] = ps->groundEntityNum;
+        d[14] = ps->jumpTime;
+        d[15] = ps->doubleJumped;
+        PyBuffer_Release(&buf);
+        Py_RETURN_TRUE;
+    }
+
+    return Py_BuildValue("(ddddddddddddNiii)",
+        ps->origin[0], ps->origin[1], ps->origin[2],
+        ps->velocity[0], ps->velocity[1], ps->velocity[2],
+        ps->viewangles[0], ps->viewangles[1], ps->viewangles[2],
+        SHORT2ANGLE(ps->delta_angles[0]), SHORT2ANGLE(ps->delta_angles[1]),
+        SHORT2ANGLE(ps->delta_angles[2]),
+        PyBool_FromLong(ps->groundEntityNum != ENTITYNUM_NONE),
+        ps->groundEntityNum, ps->jumpTime, ps->doubleJumped);
+}
+
 /*
  * ================================================================
  *                          player_stats
@@ -1259,6 +1779,158 @@ static PyObject *PyMinqlx_SetDoubleJumped(PyObject *self, PyObject *args)
     Py_RETURN_TRUE;
 }
 
+/*
+ * ================================================================
+ *                  snapshot_player/restore_player
+ * ================================================================
+*/
+
+#define PLAYER_SNAPSHOT_VERSION 1
+
+// Kept first in the snapshot so Python can read the kinematics
+// with struct.unpack_from("<i9f3i", blob) without restoring it.
+typedef struct {
+    int version;
+    vec3_t origin;
+    vec3_t velocity;
+    vec3_t viewangles;
+    int groundEntityNum;
+    int jumpTime;
+    int doubleJumped;
+} playerSnapshotHeader_t;
+
+// Everything ClientThink_real and the race code read or write for a client,
+// except for timestamps. Contains pointers (race.nextRacePoint etc.), so a snapshot is only valid
+// for the map it was taken on.
+typedef struct {
+    playerSnapshotHeader_t header;
+    playerState_t ps;
+    usercmd_t cmd;
+    int buttons;
+    int oldbuttons;
+    int timeResidual;
+    raceInfo_t race;
+    entityState_t s;
+    vec3_t currentOrigin;
+    vec3_t currentAngles;
+    int waterlevel;
+    int watertype;
+} playerSnapshot_t;
+
+static PyObject* PyMinqlx_SnapshotPlayer(PyObject* self, PyObject* args) {
+    int client_id;
+
+    if (!PyArg_ParseTuple(args, "i:snapshot_player", &client_id))
+        return NULL;
+    else if (client_id < 0 || client_id >= sv_maxclients->integer) {
+        PyErr_Format(PyExc_ValueError,
+                     "client_id needs to be a number from 0 to %d.",
+                     sv_maxclients->integer);
+        return NULL;
+    }
+    else if (!g_entities[client_id].client)
+        Py_RETURN_NONE;
+
+    gentity_t* ent = &g_entities[client_id];
+    gclient_t* client = ent->client;
+    playerSnapshot_t snap;
+    memset(&snap, 0, sizeof(snap));
+
+    snap.header.version = PLAYER_SNAPSHOT_VERSION;
+    memcpy(snap.header.origin, client->ps.origin, sizeof(vec3_t));
+    memcpy(snap.header.velocity, client->ps.velocity, sizeof(vec3_t));
+    memcpy(snap.header.viewangles, client->ps.viewangles, sizeof(vec3_t));
+    snap.header.groundEntityNum = client->ps.groundEntityNum;
+    snap.header.jumpTime = client->ps.jumpTime;
+    snap.header.doubleJumped = client->ps.doubleJumped;
+
+    snap.ps = client->ps;
+    snap.cmd = client->pers.cmd;
+    snap.buttons = client->buttons;
+    snap.oldbuttons = client->oldbuttons;
+    snap.timeResidual = client->timeResidual;
+    snap.race = client->race;
+    snap.s = ent->s;
+    memcpy(snap.currentOrigin, ent->r.currentOrigin, sizeof(vec3_t));
+    memcpy(snap.currentAngles, ent->r.currentAngles, sizeof(vec3_t));
+    snap.waterlevel = ent->waterlevel;
+    snap.watertype = ent->watertype;
+
+    return PyBytes_FromStringAndSize((const char*)&snap, sizeof(snap));
+}
+
+static int CheckPlayerSnapshot(Py_buffer* blob) {
+    if (blob->len != sizeof(playerSnapshot_t)
+            || ((playerSnapshotHeader_t*)blob->buf)->version != PLAYER_SNAPSHOT_VERSION) {
+        PyErr_Format(PyExc_ValueError,
+                     "Invalid player snapshot, expected %d bytes of version %d.",
+                     (int)sizeof(playerSnapshot_t), PLAYER_SNAPSHOT_VERSION);
+        return 0;
+    }
+    return 1;
+}
+
+static int RestorePlayerSnapshot(int client_id, Py_buffer* blob) {
+    if (!CheckPlayerSnapshot(blob))
+        return 0;
+
+    playerSnapshot_t snap;
+    memcpy(&snap, blob->buf, sizeof(snap));
+
+    gentity_t* ent = &g_entities[client_id];
+    gclient_t* client = ent->client;
+
+    // Keep the timing of the current client, otherwise ClientThink_real
+    // would try to catch up on all the msec since the snapshot was taken.
+    // The snapshot may also have been taken from another client.
+    int command_time = client->ps.commandTime;
+    int ping = client->ps.ping;
+    client->ps = snap.ps;
+    client->ps.commandTime = command_time;
+    client->ps.clientNum = client_id;
+    client->ps.ping = ping;
+    client->pers.cmd = snap.cmd;
+    client->buttons = snap.buttons;
+    client->oldbuttons = snap.oldbuttons;
+    client->timeResidual = snap.timeResidual;
+    client->race = snap.race;
+    ent->s = snap.s;
+    ent->s.number = client_id;
+    ent->s.clientNum = client_id;
+    memcpy(ent->r.currentOrigin, snap.currentOrigin, sizeof(vec3_t));
+    memcpy(ent->r.currentAngles, snap.currentAngles, sizeof(vec3_t));
+    ent->waterlevel = snap.waterlevel;
+    ent->watertype = snap.watertype;
+
+    return 1;
+}
+
+static PyObject* PyMinqlx_RestorePlayer(PyObject* self, PyObject* args) {
+    int client_id;
+    Py_buffer blob;
+
+    if (!PyArg_ParseTuple(args, "iy*:restore_player", &client_id, &blob))
+        return NULL;
+    else if (client_id < 0 || client_id >= sv_maxclients->integer) {
+        PyBuffer_Release(&blob);
+        PyErr_Format(PyExc_ValueError,
+                     "client_id needs to be a number from 0 to %d.",
+                     sv_maxclients->integer);
+        return NULL;
+    }
+    else if (!g_entities[client_id].client) {
+        PyBuffer_Release(&blob);
+        Py_RETURN_FALSE;
+    }
+
+    int ok = RestorePlayerSnapshot(client_id, &blob);
+    PyBuffer_Release(&blob);
+    if (!ok)
+        return NULL;
+
+    Py_RETURN_TRUE;
+}
+
 /*
 * ================================================================
 *                             noclip
@@ -2085,6 +2757,10 @@ static PyMethodDef minqlxMethods[] = {
 	 "Returns a string with a player's userinfo."},
     {"client_think", PyMinqlx_ClientThink, METH_VARARGS,
 	 "Invoke ClientThink. Used for custom bots."},
+    {"simulate_actions", PyMinqlx_SimulateActions, METH_VARARGS,
+     "Runs a list of usercmds or bot actions from a snapshot and returns the resulting kinematics."},
+    {"simulate_branches", PyMinqlx_SimulateBranches, METH_VARARGS,
+     "simulate_actions for several bots at once, sharing one G_RunFrame per step."},
     {"client_end_frame", PyMinqlx_ClientEndFrame, METH_VARARGS,
 	 "Invoke ClientEndFrame. Used for custom bots."},
     {"set_team", PyMinqlx_SetTeam, METH_VARARGS,
@@ -2125,6 +2801,8 @@ static PyMethodDef minqlxMethods[] = {
      "Register an event handler. Can be called more than once per event, but only the last one will work."},
     {"player_state", PyMinqlx_PlayerState, METH_VARARGS,
      "Get information about the player's state in the game."},
+    {"player_kinematics", PyMinqlx_PlayerKinematics, METH_VARARGS,
+     "Get a player's position, velocity, angles and ground state as a flat tuple."},
     {"player_stats", PyMinqlx_PlayerStats, METH_VARARGS,
      "Get some player stats."},
     {"set_position", PyMinqlx_SetPosition, METH_VARARGS,
@@ -2141,6 +2819,10 @@ static PyMethodDef minqlxMethods[] = {
      "Sets a player's jumpTime."},
     {"set_double_jumped", PyMinqlx_SetDoubleJumped, METH_VARARGS,
      "Sets a player's doubleJumped."},
+    {"snapshot_player", PyMinqlx_SnapshotPlayer, METH_VARARGS,
+     "Returns an opaque bytes snapshot of a player's movement state."},
+    {"restore_player", PyMinqlx_RestorePlayer, METH_VARARGS,
+     "Restores a player's movement state from snapshot_player()."},
     {"noclip", PyMinqlx_NoClip, METH_VARARGS,
      "Sets noclip for a player."},
     {"set_health", PyMinqlx_SetHealth, METH_VARARGS,
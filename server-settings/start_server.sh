@@ -18,9 +18,33 @@ else
     exit 1
 fi
 
-echo "Starting redis..."
-redis-server --daemonize yes
-sleep 3
+# ./start_server.sh <mode> worker <n>
+# runs solver farm rollouts for the server started without worker
+farmWorker=0
+if [[ $2 == "worker" ]]; then
+    farmWorker=1
+    gamePort=$((gamePort + $3))
+    rconPort=$((rconPort + $3))
+    hostname="$hostname - Worker $3"
+fi
+
+# ./start_server.sh <mode> batch <n> <map> <route> [route ...]
+# solves the routes on <map> with nobody connected,
+# writes qlsb_data/<route>.solution for each and quits.
+# ports are offset by <n> like a worker's, so it can run next to the server
+batchArgs=()
+if [[ $2 == "batch" ]]; then
+    gamePort=$((gamePort + $3))
+    rconPort=$((rconPort + $3))
+    batchArgs=(+set qlx_solverBatch "${*:5}" +map "$4")
+    hostname="$hostname - Batch $3"
+fi
+
+if [[ $farmWorker == 0 ]]; then
+    echo "Starting redis..."
+    redis-server --daemonize yes
+    sleep 3
+fi
 
 echo "Starting minqlx..."
 exec /home/steam/qlds/run_server_x64_minqlx.sh \
@@ -37,4 +61,6 @@ exec /home/steam/qlds/run_server_x64_minqlx.sh \
     +set zmq_rcon_port $rconPort \
     +set zmq_stats_enable 1 \
     +set zmq_stats_password $STATS_PW \
-    +set qlx_raceMode $mode
+    +set qlx_raceMode $mode \
+    +set qlx_solverFarmWorker $farmWorker \
+    "${batchArgs[@]}"